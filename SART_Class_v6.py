@@ -1,8 +1,19 @@
 from __future__ import print_function
-import pandas as pd
-import numpy as np
+import os
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 from collections import defaultdict
-from datetime import datetime
+from SART_core import (LazyModule, RunnerIndex, SlotTable, HeatSchedule, generate_bracket, heat_label, seed_label, write_atomic,
+                       HEAT_BASE, WINNER, PAIR_QUALIFIER, HEAT_QUALIFIER)
+from SART_instrument import NULL_INSTRUMENTATION, instrumented
+from SART_oe import read_registration, read_results, read_splits, read_time_trial, time_to_seconds
+from SART_sheets import heat_sheet_texts, write_files, write_heat_sheets
+
+#pandas / NumPy are only imported once a bracket is built or a CSV read, so bracket lookups start fast
+pd = LazyModule('pandas')
+np = LazyModule('numpy')
 
 
 class SART(object):
@@ -27,14 +38,40 @@ class SART(object):
         bracket_type - int, represents method of progressing people through rounds
         heat_size = int, number of people per heat
         bracket_size = int, total number of people in the bracket
+        For any other field size use SART.from_bracket_format, which generates r0_seeds,
+        bef_aft_ht_pairs and the seed keys from bracket_size, heat_size and the advancement rule.
+        To pick a tournament back up (e.g. after a laptop crash) use SART.load_checkpoint on a file
+        written by save_checkpoint.
+    instrumentation - SART_instrument.Instrumentation, optional; when given, the main methods record
+        their timings and counters (rows parsed, slots written, heat pairs processed) as JSON lines
 
     attributes:
     round - int, round of tournament
     heat - int, heat within given round
     h_seed_key
+    slot_table - SlotTable, integer slot ids / heat codes compiled from h_seed_key (see SART_core)
+    slot_rows - array, bracket_df row position of each slot id
+    bracket_format - BracketFormat, set when built by from_bracket_format (see SART_core.generate_bracket)
+    heat_base - int, heat codes are round * heat_base + heat number (100 unless a round has 100+ heats)
+    schedule - HeatSchedule, which heats have finished / heat pairs are in the bracket (see SART_core)
+    runner_index - RunnerIndex, (surname, first name) -> slot in every round, next heat, times so far and
+        projected start, updated on every slot write (see SART_core)
+    slot_listeners - list of callables, each called with the slot ids just written whenever
+        add_time_trial_results or nxt_ht_assigns / assign_ready_pairs fill bracket slots (see SART_publish)
     '''
 
-    def __init__(self, r0_seeds, bef_aft_ht_pairs, columns, start_times, combined_heats_R3=None, nine_person_heat_R4=None):
+    #everything save_checkpoint writes besides h_seed_key (a defaultdict, stored as a plain dict)
+    checkpoint_attributes = ('r0_seeds', 'bef_aft_ht_pairs', 'columns', 'start_times', 'combined_heats_R3',
+                             'nine_person_heat_R4', 'bracket_format', 'heat_base', 'sd_h_key', 'slot_table',
+                             'slot_rows', 'schedule', 'bracket_df', 'tt_df_cleaned')
+    checkpoint_magic = b'SARTCKPT'
+    checkpoint_version = 1
+
+    #order runners without a valid result are placed in, below every finisher (see place_non_finishers)
+    non_finisher_order = ('MP', 'DSQ', 'OT', 'DNF', 'DNS')
+
+    def __init__(self, r0_seeds, bef_aft_ht_pairs, columns, start_times, combined_heats_R3=None, nine_person_heat_R4=None,
+                 instrumentation=None):
         self.r0_seeds = r0_seeds
         self.columns = columns
         self.start_times = start_times
@@ -42,9 +79,62 @@ class SART(object):
         self.bef_aft_ht_pairs = bef_aft_ht_pairs
         self.combined_heats_R3 = combined_heats_R3
         self.nine_person_heat_R4 = nine_person_heat_R4
+        self.bracket_format = None
+        self.heat_base = HEAT_BASE
         self.sd_h_key = None
+        self.slot_table = None
+        self.slot_rows = None
+        self.schedule = None
         self.bracket_df = None
         self.tt_df_cleaned = None
+        self.runner_index = None
+        self.instrumentation = instrumentation if instrumentation is not None else NULL_INSTRUMENTATION
+        self.slot_listeners = []
+
+    @classmethod
+    def from_bracket_format(cls, bracket_size, heat_size, columns, start_times, n_winners=1, n_fastest=None,
+                            n_rounds=None, min_heat_size=None, instrumentation=None):
+        '''Set up a tournament for any field size instead of hand writing r0_seeds/bef_aft_ht_pairs.
+        Parameters after start_times (except instrumentation) are passed to SART_core.generate_bracket.'''
+        bracket_format = generate_bracket(bracket_size, heat_size, n_winners, n_fastest, n_rounds, min_heat_size)
+        sart = cls(bracket_format.r0_seeds, bracket_format.bef_aft_ht_pairs, columns, start_times,
+                   instrumentation=instrumentation)
+        sart.bracket_format = bracket_format
+        sart.heat_base = bracket_format.heat_base
+        return sart
+
+    @instrumented()
+    def save_checkpoint(self, path):
+        '''Write the whole tournament state - bracket_df, seed keys, compiled slot table, time trial results
+        and which heats / heat pairs are done - to a binary checkpoint file.
+
+        The file is written next to path and renamed into place, so a crash mid-save leaves the previous
+        checkpoint intact.  Checkpoints are pickles: only load ones you wrote yourself.
+        '''
+        state = dict((name, getattr(self, name)) for name in self.checkpoint_attributes)
+        state['h_seed_key'] = dict(self.h_seed_key)
+
+        write_atomic(path, self.checkpoint_magic +
+                     pickle.dumps((self.checkpoint_version, state), protocol=pickle.HIGHEST_PROTOCOL))
+
+    @classmethod
+    def load_checkpoint(cls, path, instrumentation=None):
+        '''Restore a SART instance from a file written by save_checkpoint, ready to carry on where it left off.'''
+        with open(path, 'rb') as checkpoint:
+            if checkpoint.read(len(cls.checkpoint_magic)) != cls.checkpoint_magic:
+                raise ValueError('{} is not a SART checkpoint'.format(path))
+            version, state = pickle.load(checkpoint)
+        if version != cls.checkpoint_version:
+            raise ValueError('{} is a version {} checkpoint, this SART reads version {}'.format(path, version, cls.checkpoint_version))
+
+        sart = cls(state['r0_seeds'], state['bef_aft_ht_pairs'], state['columns'], state['start_times'],
+                   state['combined_heats_R3'], state['nine_person_heat_R4'], instrumentation=instrumentation)
+        for name in cls.checkpoint_attributes:
+            setattr(sart, name, state[name])
+        sart.h_seed_key = defaultdict(lambda: [], state['h_seed_key'])
+        if sart.bracket_df is not None:
+            sart.index_runners()
+        return sart
 
     def _define_ht_sd_keys(self, pri_heat_pair1, pri_heat_pair2, win_heat, lose_heat):
         #altered bracket for 56 people; 32 move up as usual for a 64 person bracket; remainder move down
@@ -99,179 +189,567 @@ class SART(object):
             self._define_ht_sd_keys(pri_heat1, pri_heat2, win_ht, lose_ht)
 
     def _assign_flip_sd_ht_keys(self):
-        self.sd_h_key = {val:key for key, value in self.h_seed_key.iteritems() for i, val in enumerate(value)}
+        self.sd_h_key = {val:key for key, value in self.h_seed_key.items() for i, val in enumerate(value)}
 
+    @instrumented()
     def prepare_sd_h_keys(self):
 
-        self._assign_ht_sd_keys()
+        if self.bracket_format is not None:
+            self.h_seed_key = defaultdict(lambda: [], self.bracket_format.h_seed_key)
+        else:
+            self._assign_ht_sd_keys()
         self._assign_flip_sd_ht_keys()
+        self.slot_table = SlotTable(self.h_seed_key, self.heat_base)
+        self.schedule = HeatSchedule(self.bef_aft_ht_pairs, self.r0_seeds)
+        self.instrumentation.count('slots', len(self.slot_table))
 
 
-    def create_bracket(self):
-        RH_index = [i for i in self.sd_h_key.keys()]
-        self.bracket_df = pd.DataFrame(index=RH_index, columns=self.columns)
-        self.bracket_df.index.name = 'Seed'
-
-        for val in self.bracket_df.index:
-            self.bracket_df.loc[val,['Nxt_Heat']] = self.sd_h_key[val]
-            self.bracket_df.loc[val,['Round']] = int(str(self.bracket_df.loc[val,['Nxt_Heat']]).split()[2][0])-1
-
-        for key, time in self.start_times.iteritems():
-            self.bracket_df['Nxt_Heat_Time'][self.bracket_df['Nxt_Heat'] == key] = time
+    def plan_start_times(self, first_start, **options):
+        '''Generate start_times from the bracket instead of typing them in, e.g.
+        sart.plan_start_times('9:00am', interval=3, heat_duration=25, processing=5, capacity=8)
+        Options are those of SART_core.HeatSchedule.plan_start_times.  Call before create_bracket.'''
+        plan = HeatSchedule(self.bef_aft_ht_pairs, self.r0_seeds).plan_start_times(first_start, heat_base=self.heat_base, **options)
+        self.start_times = plan.start_times()
+        print(plan.report())
+        return plan
 
-        self.bracket_df.sort_index(inplace=True)
-
-    def process_time_trial_results(self, raw_csv):
-        time_trial_df = pd.read_csv(raw_csv)
-        self.tt_df_cleaned = time_trial_df[['Surname', 'First name', 'Time']]
-        self.tt_df_cleaned = self.tt_df_cleaned.rename(index=str, columns={'First name': 'First_name'})
-        self.tt_df_cleaned = self.tt_df_cleaned.sort_values(['Time'])
-        self.tt_df_cleaned['Seed'] = [int(i)+1 for i in self.tt_df_cleaned.index]
+    @instrumented()
+    def create_bracket(self):
+        #built in one go from the compiled slot table: one row per slot, integer heat codes give the round
+        #(heat // heat_base - 1, so 4 digit heats work) and start times are attached with one mapping
+        heats = np.array(self.slot_table.nxt_heat, dtype=int)
+        self.bracket_df = pd.DataFrame(index=pd.Index(self.slot_table.labels(), dtype=object, name='Seed'), columns=self.columns)
+        self.bracket_df['Nxt_Heat'] = [heat_label(heat) for heat in heats]
+        self.bracket_df['Round'] = heats // self.heat_base - 1
+        #heats without a start time stay NaN
+        self.bracket_df['Nxt_Heat_Time'] = self.bracket_df['Nxt_Heat'].map(self.start_times)
+
+        #int seeds first, then the string labels - the order python 2 sorts the mixed index in, spelled
+        #out so python 3 (which won't compare int with str) builds the same bracket
+        labels = self.bracket_df.index
+        self.bracket_df = self.bracket_df.iloc[sorted(range(len(labels)), key=lambda row: (not isinstance(labels[row], int), labels[row]))]
+        self.slot_rows = self.bracket_df.index.get_indexer(self.slot_table.labels())
+        self.index_runners()
+        self.instrumentation.count('bracket_rows', len(self.bracket_df))
+
+    def _time_to_seconds(self, times):
+        #see SART_oe.time_to_seconds; '59:00' style mispunch times parse, blank/'mp' come back NaN
+        return time_to_seconds(times)
+
+    def _rank_times(self, seconds, tiebreak=None, unplaced=None):
+        #tie policy: equal times are ordered by tiebreak (see _split_tiebreak), then keep the order they
+        #appear in the export (SportsSoftware place order).  Runners flagged in unplaced (a non-OK Status)
+        #and times that don't parse rank after every finisher, in export order.  Ties not broken on splits
+        #are still flagged by the tie checks before anything is written
+        last = seconds.isnull() if unplaced is None else (seconds.isnull() | unplaced)
+        order = pd.DataFrame({'Last': last, 'Seconds': seconds.where(~last),
+                              'Tiebreak': 0 if tiebreak is None else tiebreak, 'Row': np.arange(len(seconds))},
+                             index=seconds.index).sort_values(['Last', 'Seconds', 'Tiebreak', 'Row'])
+        return pd.Series(np.arange(1, len(order) + 1), index=order.index).reindex(seconds.index)
+
+    def _split_tiebreak(self, runners, splits, by):
+        '''Order runners with equal times on their split times; returns a Tiebreak column for runners.
+
+        Runners tie when they have the same Seconds and the same by columns (e.g. heat pair).  Every tie
+        group is resolved at once: tied runners are ordered on their time at the last control they all
+        punched, then the control before that, and so on back to the start.  Tiebreak is 0 for the
+        first runner of each group and counts up; runners whose common splits are identical too (or who
+        have no splits) share a value and stay tied.
+
+        splits - read_splits frame, or the path of an export with split times
+        '''
+        tiebreak = pd.Series(0, index=runners.index)
+        tied = runners[runners.duplicated(by + ['Seconds'], keep=False) & pd.notnull(runners['Seconds'])]
+        if splits is None or len(tied) == 0:
+            return tiebreak
+        if not isinstance(splits, pd.DataFrame):
+            splits = read_splits(splits)
+
+        tied = tied[by + ['Surname', 'First_name', 'Seconds']].copy()
+        tied['Row'] = np.arange(len(tied))
+        tied['Group'] = tied.groupby(by + ['Seconds']).ngroup()
+        legs = tied.merge(splits, on=['Surname', 'First_name'])
+        #a control punched twice on a course counts as two controls; keep the controls every runner in the group punched
+        legs['Visit'] = legs.groupby(['Row', 'Control']).cumcount()
+        punched_by = legs.groupby(['Group', 'Control', 'Visit'])['Row'].transform('count')
+        legs = legs[punched_by.values == legs['Group'].map(tied.groupby('Group').size()).values]
+        #0 is the last common control, 1 the one before it, ...
+        legs['Back'] = legs.sort_values('Leg').groupby('Row').cumcount(ascending=False)
+        keys = legs.pivot(index='Row', columns='Back', values='Split').reindex(tied['Row'].values)
+
+        order = pd.concat([tied[['Group']].reset_index(drop=True), keys.reset_index(drop=True).fillna(np.inf)], axis=1)
+        order.index = tied.index
+        order = order.sort_values(['Group'] + list(keys.columns))
+        changed = (order != order.shift()).any(axis=1)
+        tiebreak[order.index] = changed.groupby(order['Group']).cumsum().astype(int) - 1
+
+        n_groups = tied['Group'].nunique()
+        n_broken = n_groups - tiebreak[tied.index].groupby(tied['Group']).nunique().eq(1).sum()
+        print('Broke {} of {} ties on split times'.format(n_broken, n_groups))
+        self.instrumentation.count('ties_broken_on_splits', n_broken)
+        return tiebreak
+
+    @instrumented()
+    def process_time_trial_results(self, raw_csv, splits=None):
+        #only Surname/First name/Time (and Classifier) are parsed from the export (see SART_oe.read_time_trial)
+        #splits (an export with split times, or a read_splits frame) breaks tied times, see _split_tiebreak
+        time_trial_df = read_time_trial(raw_csv)
+        self.instrumentation.count('rows_parsed', len(time_trial_df))
+        self._seed_time_trial(time_trial_df, splits)
+
+    def _seed_time_trial(self, time_trial_df, splits=None):
+        #time_trial_df has Surname, First_name, Time (and Status, if the export has a Classifier)
+        #row labels are strings ('17'), as the notebooks' manual fixes (tt_df_cleaned.loc['17', ...]) expect
+        self.tt_df_cleaned = time_trial_df.reset_index(drop=True).rename(index=str)
+        seconds = self._time_to_seconds(self.tt_df_cleaned['Time'])
+        unplaced = self._tt_unplaced(self.tt_df_cleaned)
+        self.tt_df_cleaned['Tiebreak'] = self._split_tiebreak(self.tt_df_cleaned.assign(Seconds=seconds.where(~unplaced)), splits, [])
+        self.tt_df_cleaned['Seed'] = self._rank_times(seconds, self.tt_df_cleaned['Tiebreak'], unplaced)
+        self.tt_df_cleaned = self.tt_df_cleaned.sort_values(['Seed'])
+
+    def _tt_unplaced(self, tt_df):
+        #time trial runners with a non-OK Status (a mispunch, say) - seeded after every finisher, never a tie
+        if 'Status' not in tt_df:
+            return pd.Series(False, index=tt_df.index)
+        return tt_df['Status'].fillna('OK') != 'OK'
 
     def _check_TT_for_ties(self):
-        unique_len = len(set(self.tt_df_cleaned['Time']))
-        original_len = len(self.tt_df_cleaned)
+        #only finishers with a time that parses can tie; everyone else is seeded last in export order
+        seconds = self._time_to_seconds(self.tt_df_cleaned['Time'])
+        #rows added by hand (a DNS runner given '0:59:00' and a Seed) have no Tiebreak: they tie on time alone
+        tiebreak = self.tt_df_cleaned['Tiebreak'].fillna(0) if 'Tiebreak' in self.tt_df_cleaned else 0
+        placed = pd.notnull(seconds) & ~self._tt_unplaced(self.tt_df_cleaned)
+        unique_len = len(pd.DataFrame({'Seconds': seconds, 'Tiebreak': tiebreak})[placed].drop_duplicates())
+        original_len = placed.sum()
 
         if unique_len != original_len:
             return 'Warning: Ties exist - diff in list length is {}.  Fix before proceeding.'.format((original_len - unique_len))
         else:
             return 'No Ties, results added to bracket!'
 
-    def add_time_trial_results(self):
+    @instrumented()
+    def add_time_trial_results(self, person_info=['First_name', 'Surname', 'Time']):
         tie_status = self._check_TT_for_ties()
         print (tie_status)
 
         if tie_status != 'No Ties, results added to bracket!':
             return
 
-        for val in self.tt_df_cleaned['Seed']:
-            self.bracket_df.loc[val,['First_name']] = (self.tt_df_cleaned['First_name'][self.tt_df_cleaned['Seed'] == val].item())
-            self.bracket_df.loc[val,['Surname']] = (self.tt_df_cleaned['Surname'][self.tt_df_cleaned['Seed'] == val].item())
-            self.bracket_df.loc[val,['Time']] = (self.tt_df_cleaned['Time'][self.tt_df_cleaned['Seed'] == val].item())
+        tt_by_seed = self.tt_df_cleaned.set_index(self.tt_df_cleaned['Seed'].astype(int))
+        missing_seeds = tt_by_seed.index.difference(self.bracket_df.index)
+
+        if tt_by_seed.index.has_duplicates or len(missing_seeds) > 0:
+            print('Warning: time trial seeds do not line up with the bracket - duplicate seeds {}, seeds not in bracket {}.  Fix before proceeding.'.format(
+                sorted(set(tt_by_seed.index[tt_by_seed.index.duplicated()])), sorted(missing_seeds)))
+            return
 
+        #single indexed write of every seed's name and time
+        self.bracket_df.loc[tt_by_seed.index, person_info] = tt_by_seed[person_info].values
+        self.schedule.mark_seeded()
+        self.instrumentation.count('slots_written', len(tt_by_seed))
+        self._slots_written([self.slot_table.slot_id_for_label(seed) for seed in tt_by_seed.index])
+
+    @instrumented()
     def clean_results_csv(self, raw_csv):
-        df = pd.read_csv(raw_csv)
-        df = df[['Surname', 'First name', 'Time', 'Entry cl. No']]
-        df = df.rename(index=str, columns={'First name': 'First_name'})
-        df = df.rename(index=str, columns={'Entry cl. No': 'Heat'})
+        #only Surname, First_name, Time and Heat are parsed (see SART_oe.read_results); times are parsed
+        #when the results are used, so manual fixes to Time (ties, mispunches, DNS rows) always count
+        df = read_results(raw_csv).rename(index=str)
+        self.instrumentation.count('rows_parsed', len(df))
         df = df.sort_values(['Time'])
         return df
 
-    def _check_heats_for_ties(self, temp_df1, temp_df2, ht1, ht2):
-        temp_df = pd.concat([temp_df1, temp_df2])
-        unique_len = len(set(temp_df['Time']))
-        original_len = len(temp_df)
-
-        if unique_len != original_len:
-            return 'Warning: Ties exist in Heat Pair {},{}.  Must fix before proceeding.'.format(ht1, ht2)
-        else:
-            return 'No Ties, proceeding with next heat assignments!'
-
-    def nxt_ht_assigns(self, results_df, rnd, person_info=['Surname', 'First_name', 'Time']):
-        '''define inputs, how function works'''
-        for ht_pair1, ht_pair2 in self.bef_aft_ht_pairs:
-            ht1 = ht_pair1[0]
-            ht2 = ht_pair1[1]
-            if ht1 < (rnd * 100 + 100) and ht1 > ((rnd - 1) * 100 + 100) and (ht1 in self.nine_person_heat_R4 or ht2 in self.nine_person_heat_R4):
-                print('Processing Heat Pair {}, {} for R4 to R5 Unique Heats'.format(ht1,ht2))
-                temp_df1 = results_df[(results_df['Heat'] == ht1)].sort_values('Time')
-                temp_df1.reset_index(drop=True, inplace=True)
-
-                for i, row in enumerate(temp_df1.values):
-                    for j, colnm in enumerate(person_info):
-                        self.bracket_df.loc['{}-Q{}'.format(ht1, i+1),[colnm]] = row[j]
-
-            elif ht1 < (rnd * 100 + 100) and ht1 > ((rnd - 1) * 100 + 100):
-                print('Processing Heat Pair {}, {} per Normal Function'.format(ht1,ht2))
-                temp_df1 = results_df[(results_df['Heat'] == ht1)].sort_values('Time')
-                temp_df1.reset_index(drop=True, inplace=True)
-                temp_df2 = results_df[(results_df['Heat'] == ht2)].sort_values('Time')
-                temp_df2.reset_index(drop=True, inplace=True)
-
-                tie_status = self._check_heats_for_ties(temp_df1, temp_df2, ht1, ht2)
-                print (tie_status)
-
-                if tie_status != 'No Ties, proceeding with next heat assignments!':
-                    break
-
-                for colnm in person_info:
-                    ht_win1 = temp_df1[colnm][temp_df1['Time'] == temp_df1['Time'].min()].item()
-                    self.bracket_df.loc['W{}'.format(ht1),[colnm]] = ht_win1
-                    ht_win2 = temp_df2[colnm][temp_df2['Time'] == temp_df2['Time'].min()].item()
-                    self.bracket_df.loc['W{}'.format(ht2),[colnm]] = ht_win2
-
-                temp_df1.drop(0, inplace=True)
-                temp_df2.drop(0, inplace=True)
-                temp_dftot = pd.concat([temp_df1, temp_df2]).sort_values('Time')
-                temp_dftot.reset_index(drop=True, inplace=True)
-
-                for i, row in enumerate(temp_dftot.values):
-                    for j, colnm in enumerate(person_info):
-                        self.bracket_df.loc['{}/{}-Q{}'.format(ht1, ht2, i+1),[colnm]] = row[j]
-
-
+    def _heat_pair_plan(self, heat_pairs):
+        #flag each (ht1, ht2) True where the pair is a single heat whose finishers move on together
+        #in finish order (nine person heat in R4, or a heat paired with itself like 404/404)
+        nine_person = self.nine_person_heat_R4 or []
+        return [(ht1, ht2, ht1 == ht2 or ht1 in nine_person or ht2 in nine_person) for ht1, ht2 in heat_pairs]
+
+    def _round_heat_pairs(self, rnd):
+        #heat pairs feeding out of round rnd
+        return self._heat_pair_plan([ht_pair1 for ht_pair1, ht_pair2 in self.bef_aft_ht_pairs
+                                     if ht_pair1[0] // self.heat_base == rnd])
+
+    def _check_heats_for_ties(self, ranked):
+        tied = ranked[ranked.duplicated(['Pair1', 'Pair2', 'Seconds', 'Tiebreak'], keep=False)]
+        tied_pairs = sorted(set(zip(tied['Pair1'], tied['Pair2'])))
+        return ['Warning: Ties exist in Heat Pair {}.  Must fix before proceeding.'.format(
+                ht1 if not ht2 else '{},{}'.format(ht1, ht2)) for ht1, ht2 in tied_pairs]
+
+    def _rank_round_results(self, results_df, round_pairs, person_info, splits=None):
+        #group the whole round by heat once: every row gets its place in heat, its heat pair and its seconds
+        pair_of_heat = {}
+        for ht1, ht2, single_heat in round_pairs:
+            pair_of_heat[ht1] = (ht1, 0) if single_heat else (ht1, ht2)
+            if not single_heat:
+                pair_of_heat[ht2] = (ht1, ht2)
+
+        ranked = results_df[person_info + ['Heat']].reset_index(drop=True)
+        ranked['Seconds'] = self._time_to_seconds(ranked['Time'])
+        ranked = ranked[pd.notnull(ranked['Heat'])]
+        ranked['Heat'] = ranked['Heat'].astype(int)
+        ranked = ranked[ranked['Heat'].isin(list(pair_of_heat.keys()))]
+        ranked['Pair1'] = ranked['Heat'].map(lambda heat: pair_of_heat[heat][0])
+        ranked['Pair2'] = ranked['Heat'].map(lambda heat: pair_of_heat[heat][1])
+        ranked['Tiebreak'] = self._split_tiebreak(ranked, splits, ['Pair1', 'Pair2'])
+        ranked = ranked.sort_values(['Heat', 'Seconds', 'Tiebreak'])
+        ranked['Place'] = ranked.groupby('Heat').cumcount() + 1
+        return ranked
+
+    def _slot_round_results(self, ranked):
+        #winners of each paired heat fill W###, everyone else is ranked across the pair into ###/###-Q#,
+        #and single heat pairs (Pair2 == 0) fill ###-Q# in finish order
+        is_single = ranked['Pair2'] == 0
+        is_winner = (ranked['Place'] == 1) & ~is_single
+
+        winners = ranked[is_winner].copy()
+        winners['Kind'] = WINNER
+        winners['Rank'] = 0
+
+        singles = ranked[is_single].copy()
+        singles['Kind'] = HEAT_QUALIFIER
+        singles['Rank'] = singles['Place']
+
+        qualifiers = ranked[~is_single & ~is_winner].sort_values(['Pair1', 'Pair2', 'Seconds', 'Tiebreak'])
+        qualifiers['Kind'] = PAIR_QUALIFIER
+        qualifiers['Rank'] = qualifiers.groupby(['Pair1', 'Pair2']).cumcount() + 1
+
+        slotted = pd.concat([winners, qualifiers, singles])
+        slotted.loc[slotted['Kind'] == WINNER, 'Pair1'] = slotted['Heat']
+        slotted.loc[slotted['Kind'] != PAIR_QUALIFIER, 'Pair2'] = 0
+        slotted['Slot'] = [self.slot_table.slot_id(kind, ht1, ht2, rank) for kind, ht1, ht2, rank in
+                           zip(slotted['Kind'], slotted['Pair1'], slotted['Pair2'], slotted['Rank'])]
+        return slotted
+
+    def _assign_heat_pairs(self, results_df, round_pairs, person_info, splits=None):
+        #rank, tie check, slot and write the given heat pairs; True if the bracket was written
+        ranked = self._rank_round_results(results_df, round_pairs, person_info, splits)
+
+        tie_status = self._check_heats_for_ties(ranked)
+        if tie_status:
+            print(*tie_status, sep='\n')
+            self.instrumentation.count('tied_heat_pairs', len(tie_status))
+            return False
+        print('No Ties, proceeding with next heat assignments!')
+
+        slotted = self._slot_round_results(ranked)
+        unslotted = slotted[slotted['Slot'] < 0]
+        if len(unslotted) > 0:
+            print('Warning: no bracket slot for {} - those runners were not assigned, check data!'.format(
+                [seed_label(*row) for row in unslotted[['Kind', 'Pair1', 'Pair2', 'Rank']].values]))
+            slotted = slotted[slotted['Slot'] >= 0]
+
+        #single bulk write of the heat pairs into the bracket, by row position
+        self.bracket_df.iloc[self.slot_rows[slotted['Slot'].values],
+                             self.bracket_df.columns.get_indexer(person_info)] = slotted[person_info].values
+        for ht1, ht2, single_heat in round_pairs:
+            self.schedule.mark_pair_processed(ht1, ht2)
+        self.instrumentation.count('slots_written', len(slotted))
+        self.instrumentation.count('heat_pairs_processed', len(round_pairs))
+        self._slots_written(slotted['Slot'].tolist())
+        return True
+
+    def index_runners(self):
+        '''Rebuild runner_index from bracket_df, e.g. after editing bracket_df by hand (slot writes made by
+        add_time_trial_results, nxt_ht_assigns and assign_ready_pairs keep it up to date themselves).'''
+        self.runner_index = RunnerIndex(self.slot_table, self.start_times)
+        self._index_slots(range(len(self.slot_table)))
+
+    def _index_slots(self, slot_ids):
+        slot_ids = list(slot_ids)
+        rows = self.bracket_df.iloc[self.slot_rows[slot_ids]]
+        for slot_id, filled, surname, first_name, time in zip(slot_ids, pd.notnull(rows['Surname']).values, rows['Surname'],
+                                                              rows['First_name'], rows['Time']):
+            if filled:
+                self.runner_index.record(slot_id, surname, first_name, time)
+            else:
+                self.runner_index.clear(slot_id)
+
+    def _slots_written(self, slot_ids):
+        self._index_slots(slot_ids)
+        for listener in self.slot_listeners:
+            listener(slot_ids)
+
+    @instrumented(round='rnd')
+    def place_non_finishers(self, results_df, rnd, heats=None):
+        '''Put every runner without a valid result at the bottom of their heat, ready for nxt_ht_assigns.
+
+        Runners the bracket has in a round rnd heat but who are missing from results_df are added as DNS
+        rows; runners with a non-OK Status (MP, DNF, DSQ, OT from the export's Classifier) or a time that
+        doesn't parse are flagged too.  All of them get placeholder times after the slowest finisher of the
+        round ('0:59:00', '0:59:01', ... unless someone ran longer), in non_finisher_order, then by their
+        recorded time, then bracket order - the same placing the notebooks gave by hand, but repeatable.
+        Given heats (heat codes), only those heats' runners are placed and returned, e.g. the heat pairs of
+        a round still running that have finished (see SART_stream).
+        Returns a copy of results_df with a Status column; the recorded times are printed.
+        '''
+        results = results_df.copy()
+        if 'Status' not in results:
+            results['Status'] = 'OK'
+        results['Status'] = results['Status'].fillna('OK')
+        seconds = self._time_to_seconds(results['Time'])
+        results.loc[(results['Status'] == 'OK') & seconds.isnull(), 'Status'] = 'DNF'
+
+        #runners expected in the round's heats, in bracket (slot) order
+        slot_of_row = np.empty(len(self.bracket_df), dtype=int)
+        slot_of_row[self.slot_rows] = np.arange(len(self.slot_rows))
+        expected = self.bracket_df.assign(Slot=slot_of_row)
+        expected = expected[(expected['Round'] == rnd - 1) & pd.notnull(expected['Surname'])].sort_values('Slot')
+        if heats is not None:
+            heats = list(heats)
+            expected = expected[np.isin(np.array(self.slot_table.nxt_heat)[expected['Slot'].values], heats)]
+            results = results[results['Heat'].isin(heats)]
+        expected_keys = pd.MultiIndex.from_arrays([expected['Surname'], expected['First_name']])
+        result_keys = pd.MultiIndex.from_arrays([results['Surname'], results['First_name']])
+
+        missing = expected[~expected_keys.isin(result_keys)]
+        unexpected = results[~result_keys.isin(expected_keys)]
+        if len(unexpected) > 0:
+            print('Warning: {} are in the Round {} results but not in a Round {} heat - check data!'.format(
+                ', '.join('{} {}'.format(first, last) for first, last in unexpected[['First_name', 'Surname']].values), rnd, rnd))
+
+        first_label = max([int(label) for label in results.index if str(label).isdigit()] + [-1]) + 1
+        dns = pd.DataFrame({'Surname': missing['Surname'].values, 'First_name': missing['First_name'].values,
+                            'Time': np.nan, 'Heat': np.array(self.slot_table.nxt_heat)[missing['Slot'].values],
+                            'Status': 'DNS'},
+                           index=[str(label) for label in range(first_label, first_label + len(missing))])
+        results = pd.concat([results, dns[[column for column in results.columns if column in dns.columns]]], sort=False)
+        seconds = seconds.reindex(results.index)
+
+        flagged = results[results['Status'] != 'OK']
+        if len(flagged) == 0:
+            return results
+        order = pd.DataFrame({'Status': flagged['Status'].map(lambda status: self.non_finisher_order.index(status)
+                                                                if status in self.non_finisher_order else len(self.non_finisher_order)),
+                              'Seconds': seconds[flagged.index],
+                              'Slot': pd.Series(expected['Slot'].values, index=expected_keys).reindex(
+                                  pd.MultiIndex.from_arrays([flagged['Surname'], flagged['First_name']])).values},
+                             index=flagged.index).sort_values(['Status', 'Seconds', 'Slot'], na_position='last')
+
+        finished = seconds[results['Status'] == 'OK']
+        last_place = max(59 * 60, (int(finished.max()) // 60 + 1) * 60 if len(finished) else 0)
+        placeholders = self._seconds_to_time(pd.Series(last_place + np.arange(len(order), dtype=float), index=order.index))
+        for label, placeholder in placeholders.items():
+            row = results.loc[label]
+            print('Heat {} {} {} {} ({}) placed last as {}'.format(row['Heat'], row['First_name'], row['Surname'],
+                                                                    row['Status'], row['Time'] if pd.notnull(row['Time']) else 'no time', placeholder))
+        results.loc[placeholders.index, 'Time'] = placeholders.values
+        self.instrumentation.count('non_finishers', len(order))
+        return results
+
+    @instrumented(round='rnd')
+    def nxt_ht_assigns(self, results_df, rnd, person_info=['Surname', 'First_name', 'Time'], splits=None):
+        '''Take a round's cleaned results (see clean_results_csv) and fill in the bracket slots they feed.
+
+        The whole round is ranked in one pass: heat winners go to W###, the rest of each heat pair is
+        ranked into ###/###-Q#, and single heat pairs (nine_person_heat_R4, or a heat paired with itself)
+        go to ###-Q# in finish order.  Given splits (an export with split times, or a read_splits frame)
+        tied times are broken on split times (see _split_tiebreak).  If any heat pair still has tied times
+        nothing is written, so the ties can be fixed and the round re-run.
+        '''
+        round_pairs = self._round_heat_pairs(rnd)
+        if self._assign_heat_pairs(results_df, round_pairs, person_info, splits):
+            print('Processed {} heat pairs for Round {}'.format(len(round_pairs), rnd))
+
+    @instrumented()
+    def assign_ready_pairs(self, results_df, person_info=['Surname', 'First_name', 'Time'], splits=None):
+        '''Process every heat pair whose heats are complete in results_df, whatever round they are in.
+
+        results_df can hold results from more than one round (cleaned as in clean_results_csv).  A heat is
+        complete once it has a result for every bracket slot feeding it, or has been marked finished with
+        self.schedule.mark_heat_finished (e.g. a heat with a DNS).  splits breaks ties as in nxt_ht_assigns.
+        Returns the heat pairs processed.
+        '''
+        heat_counts = results_df['Heat'].dropna().astype(int).value_counts()
+        for heat, count in heat_counts.items():
+            if count >= len(self.slot_table.heat_slots.get(heat, [])):
+                self.schedule.mark_heat_finished(heat)
+
+        ready_pairs = self.schedule.ready_pairs()
+        if ready_pairs and self._assign_heat_pairs(results_df, self._heat_pair_plan(ready_pairs), person_info, splits):
+            print('Processed heat pairs {}'.format(', '.join('{},{}'.format(ht1, ht2) for ht1, ht2 in ready_pairs)))
+            return ready_pairs
+        return []
+
+    def _heat_is_filled(self, heat):
+        #every slot feeding this heat has a runner in it
+        slot_ids = self.slot_table.heat_slots.get(heat, [])
+        return len(slot_ids) > 0 and self.bracket_df['Surname'].iloc[self.slot_rows[slot_ids]].notnull().all()
+
+    def round_heat_sheets(self, rnd):
+        '''(heat code, start time, runners) for every heat of round rnd in heat order, runners being the
+        First_name, Surname, Nxt_Heat_Time rows (by seed) feeding the heat, fastest first.
+
+        The round's rows are picked out of bracket_df once, sorted once by (heat, time) and walked with one
+        groupby; ties (and empty slots) keep bracket order.'''
+        heat_of_row = np.empty(len(self.bracket_df), dtype=int)
+        heat_of_row[self.slot_rows] = self.slot_table.nxt_heat
+        in_round = heat_of_row // self.heat_base == rnd
+        round_df = self.bracket_df.loc[in_round, ['First_name', 'Surname', 'Nxt_Heat_Time', 'Time']].assign(
+            Heat=heat_of_row[in_round])
+        round_df = round_df.sort_values(['Heat', 'Time'], kind='mergesort', na_position='last')
+        #each heat is then a contiguous run of the sorted rows, handed out as a slice
+        heats = round_df['Heat'].values
+        sheets = round_df[['First_name', 'Surname', 'Nxt_Heat_Time']]
+        bounds = np.flatnonzero(np.diff(heats)) + 1
+        for first, last in zip(np.r_[0, bounds], np.r_[bounds, len(heats)]):
+            heat = int(heats[first])
+            yield heat, self.start_times.get(heat_label(heat)), sheets.iloc[first:last]
+
+    @instrumented(round='rnd')
     def print_heat_assigns(self, rnd):
+        #every heat of the round from the slot table, however many there are
         info_list = []
 
-        for heat in xrange((rnd*100 + 1), (rnd*100 + 17)):
-            df = self.bracket_df[self.bracket_df['Nxt_Heat'] == 'Heat {}'.format(heat)].sort_values('Time')
-            info_list.append('Heat {}'.format(heat))
+        for heat, start_time, df in self.round_heat_sheets(rnd):
+            info_list.append(heat_label(heat))
             info_list.append('\n')
-            info_list.append(df[['First_name', 'Surname', 'Nxt_Heat_Time']])
+            info_list.append(df)
             info_list.append('\n')
 
         return info_list
 
+    @instrumented(round='rnd')
+    def write_heat_sheets(self, rnd, paths):
+        '''Write round rnd's heat sheets to every path in one pass - .txt as print_heat_assigns, .html, .csv
+        (see SART_sheets); e.g. the start chief's and event director's copies plus the posted sheets.'''
+        n_heats = write_heat_sheets(self, rnd, paths)
+        self.instrumentation.count('heat_sheets', n_heats * len(paths))
+        return n_heats
+
+    @instrumented(round='rnd')
+    def export_round(self, rnd, out_dir, registration=None, sheet_formats=('.txt', '.html', '.csv'), workers=4):
+        '''Write every file the desks need to run round rnd into out_dir in one go:
+
+        R#_heat_assigns.txt / .html / .csv - heat sheets (see SART_sheets)
+        SS_import_R#_with_heats.csv - registration (the OE0001 master) with round rnd heats, as
+            assign_nxt_ht_to_ss_import_csv(registration, rnd - 1); skipped, with its warnings printed, if the
+            registration and the bracket don't line up (or no registration is given)
+        Bracket_before_R#.csv - bracket_df as it stands
+
+        Everything is rendered first, from the bracket as it is at the call, then the files are written
+        concurrently, each to a temporary name and renamed into place.  Returns {file name: path} of the
+        files written.
+        '''
+        names = ['R{}_heat_assigns{}'.format(rnd, extension) for extension in sheet_formats]
+        contents = heat_sheet_texts(self, rnd, names)
+        if registration is not None:
+            ss_import = self.assign_nxt_ht_to_ss_import_csv(registration, rnd - 1)
+            if ss_import is not None:
+                contents['SS_import_R{}_with_heats.csv'.format(rnd)] = ss_import.to_csv(index=False)
+        contents['Bracket_before_R{}.csv'.format(rnd)] = self.bracket_df.to_csv()
+
+        if not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        paths = dict((name, os.path.join(out_dir, name)) for name in contents)
+        write_files(dict((paths[name], text) for name, text in contents.items()), workers)
+        self.instrumentation.count('files_written', len(paths))
+        print('Round {} files written to {}: {}'.format(rnd, out_dir, ', '.join(sorted(paths))))
+        return paths
+
+    @instrumented(round='prior_rnd')
     def assign_nxt_ht_to_ss_import_csv(self, csv_imp_file, prior_rnd):
-        ss_input = pd.read_csv(csv_imp_file)
+        #the registration master is re-read every round; unchanged files come from SART_oe's cache
+        ss_input = read_registration(csv_imp_file)
+        self.instrumentation.count('rows_parsed', len(ss_input))
         ss_input = ss_input[pd.notnull(ss_input['Surname'])]
-        bracket_df_temp = self.bracket_df[(pd.notnull(self.bracket_df['Surname'])) & (self.bracket_df['Round'] == prior_rnd)]
-
-        if len(ss_input) != len(bracket_df_temp):
-            print('Warning: mismatch between next round import file and current round results lists - check data! ss_input length is {} and bracket_df_temp length is {}'.format(len(ss_input), len(bracket_df_temp)))
+        key = ['Surname', 'First name']
+        #bracket_df may have been edited by hand since the last slot write (a late entry, a swapped runner)
+        self.index_runners()
+        round_runners = self.runner_index.in_round(prior_rnd)
+
+        if len(ss_input) != len(round_runners):
+            print('Warning: mismatch between next round import file and current round results lists - check data! ss_input length is {} and bracket_df_temp length is {}'.format(len(ss_input), len(round_runners)))
+
+        #each registrant is a runner_index lookup instead of a match against the filtered bracket
+        registrants = list(zip(ss_input['Surname'], ss_input['First name']))
+        slot_ids = [self.runner_index.slot_in_round(surname, first_name, prior_rnd) for surname, first_name in registrants]
+        registered = set(registrants)
+        problems = [('in import file but not in Round {} of the bracket'.format(prior_rnd),
+                     [runner for runner, slot_id in zip(registrants, slot_ids) if slot_id < 0]),
+                    ('in Round {} of the bracket but not in import file'.format(prior_rnd),
+                     [runner for runner in round_runners if runner not in registered]),
+                    ('listed more than once', [tuple(runner) for runner in
+                                               ss_input[ss_input.duplicated(key, keep=False)].drop_duplicates(key)[key].values])]
+        problems = [(issue, names) for issue, names in problems if len(names) > 0]
+
+        for issue, names in problems:
+            print('Warning: {} runners {} - check data! {}'.format(len(names), issue,
+                  ', '.join('{} {}'.format(first, last) for last, first in names)))
+        if problems or len(ss_input) != len(round_runners):
             return
-        else:
-            for val in ss_input.index:
-                ss_input.loc[val, ['Long']] = bracket_df_temp[
-                    (bracket_df_temp['Round'] == prior_rnd) &
-                    (bracket_df_temp['Surname'] == ss_input.loc[
-                    val, ['Surname']].values[0]) & (bracket_df_temp[
-                    'First_name'] == ss_input.loc[
-                    val, ['First name']].values[0])]['Nxt_Heat'].values[0]
-
-                ss_input.loc[val, ['Short']] = 'H' + ss_input.loc[val, ['Long']].values[0][-3:]
-                ss_input.loc[val, ['Cl. no.']] = ss_input.loc[val, ['Long']].values[0][-3:]
-
-            return ss_input
-
-    def _calc_final_combo_score(self, r4_results, r5_results):
-
-        time_zero = datetime.strptime('00:00:00', '%H:%M:%S')
-
-        r5_results['SumTime'] = r5_results[['First_name', 'Surname', 'Time', 'Heat']].apply(
-                        lambda row: (datetime.strptime(row[2],'%H:%M:%S')
-                        - time_zero
-                        + datetime.strptime(r4_results[(r4_results['First_name'] == row[0]) &
-                        (r4_results['Surname'] == row[1])]['Time'].values[0], '%H:%M:%S')).time().strftime("%H:%M:%S") if row[3] in [504, 502] else None, axis=1)
-
-        r5_results['Time_Official'] = r5_results[['Time', 'SumTime']].apply(
-                            lambda row: row[1] if row[1] > 0 else row[0], axis=1)
-
-        r5_results.sort_values(by=['Heat', 'Time_Official'], ascending=[False, True], inplace=True)
-        r5_results.reset_index(inplace=True, drop=True)
-        r5_results.index += 1
 
-        return r5_results
+        ss_input['Long'] = [heat_label(self.slot_table.nxt_heat[slot_id]) for slot_id in slot_ids]
+        heat_no = ss_input['Long'].str.split().str[-1]
+        ss_input['Short'] = 'H' + heat_no
+        ss_input['Cl. no.'] = heat_no
+        self.instrumentation.count('import_rows_assigned', len(ss_input))
+
+        return ss_input
+
+    def _seconds_to_time(self, seconds):
+        #float seconds -> 'HH:MM:SS' (with fractional seconds kept, e.g. '00:25:03.5'); NaN stays NaN
+        whole = seconds.fillna(0).astype(int)
+        fraction = (seconds - np.floor(seconds)).round(3).fillna(0)
+        times = ((whole // 3600).astype(str).str.zfill(2) + ':' + (whole % 3600 // 60).astype(str).str.zfill(2)
+                 + ':' + (whole % 60).astype(str).str.zfill(2)
+                 + fraction.map(lambda frac: '{:g}'.format(frac)[1:] if frac else ''))
+        return times.where(pd.notnull(seconds))
+
+    @instrumented()
+    def calc_combined_scores(self, results_by_round, combined_heats, combine_rounds=None):
+        '''Score the last round's results, summing times across rounds for runners in combined_heats.
+
+        parameters:
+        results_by_round - dict, round -> cleaned results dataframe (see clean_results_csv); the highest
+            round is the one being scored
+        combined_heats - list of int, heats of the scored round whose runners are placed on total time
+        combine_rounds - list of int, rounds whose times make up the total (default: every round given)
+
+        Times are parsed once per round and rounds are joined on (Surname, First_name) with one merge each.
+        Returns the scored round's results with SumTime (total for combined heats) and Time_Official, ranked
+        by heat (highest first) then official time, indexed from 1.  A combined heat runner missing from one
+        of the rounds gets no SumTime and is placed last in their heat.
+        '''
+        final_rnd = max(results_by_round)
+        if combine_rounds is None:
+            combine_rounds = sorted(results_by_round)
+        key = ['Surname', 'First_name']
+
+        scored = results_by_round[final_rnd].copy()
+        total = pd.Series(0.0, index=scored.index)
+        for rnd in combine_rounds:
+            if rnd == final_rnd:
+                total += self._time_to_seconds(scored['Time'])
+                continue
+            rnd_secs = results_by_round[rnd][key].copy()
+            rnd_secs['Seconds'] = self._time_to_seconds(results_by_round[rnd]['Time'])
+            rnd_secs = rnd_secs.drop_duplicates(key)
+            total += scored[key].merge(rnd_secs, on=key, how='left')['Seconds'].values
+
+        is_combined = scored['Heat'].isin(combined_heats)
+        scored['SumTime'] = self._seconds_to_time(total.where(is_combined))
+        scored['Time_Official'] = scored['SumTime'].where(is_combined, scored['Time'])
+        scored['Official_Seconds'] = total.where(is_combined, self._time_to_seconds(scored['Time']))
+
+        scored = scored.sort_values(by=['Heat', 'Official_Seconds'], ascending=[False, True], na_position='last')
+        scored = scored.drop('Official_Seconds', axis=1).reset_index(drop=True)
+        scored.index += 1
+
+        return scored
+
+    def _calc_final_combo_score(self, r4_results, r5_results, combined_heats=[504, 502]):
+        return self.calc_combined_scores({4: r4_results, 5: r5_results}, combined_heats)
 
     def _check_finals_for_ties(self, r5_results):
 
-        for heat in xrange(501, 517):
+        for heat in range(501, 517):
             if len(set(r5_results[r5_results['Heat']==heat]['Time'])) == len(r5_results[r5_results['Heat']==heat]):
                 return 'No ties, proceeding with print out'
             else:
                 return 'Ties exist in Heat {}.  Fix before proceeding!'.format(heat)
 
-    def print_final_results(self, r4_results, r5_results):
+    @instrumented()
+    def print_final_results(self, r4_results, r5_results, combined_heats=[504, 502]):
         info_list = []
 
         tie_status = self._check_finals_for_ties(r5_results)
@@ -282,12 +760,12 @@ class SART(object):
         else:
             return
 
-        r5_results = self._calc_final_combo_score(r4_results, r5_results)
+        r5_results = self._calc_final_combo_score(r4_results, r5_results, combined_heats)
 
-        for heat in xrange(516, 500, -1):
-            if heat in [503, 501]:
+        for heat in range(516, 500, -1):
+            if not (r5_results['Heat'] == heat).any():
                 pass
-            elif heat in [504, 502]:
+            elif heat in combined_heats:
                 df = r5_results[r5_results['Heat'] == heat]
                 info_list.append('Heat {}'.format(heat))
                 info_list.append('\n')
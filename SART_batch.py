@@ -0,0 +1,232 @@
+'''Reprocess archived tournaments end to end, one tournament per worker process.
+
+Each archived season is a notebook plus its event directory - 2017_SART.ipynb
+with 2017_event_files (SART_Class_v2), 2018_SART_58.ipynb with
+2018_event_files_58 (SART_Class_v5), 2019_SART.ipynb with 2019_event_files
+(SART_Class_v6).  The notebook holds that season's bracket definition and every
+manual fix made during the event (tie breaks, mispunch times, DNS rows), so
+reprocessing a season means running its notebook's code cells again.
+
+Every tournament is run in a scratch copy of its event directory under the
+output directory, so all the heat sheets, import files and final results it
+writes land there and the archive is never touched.  Each file the run writes
+is then compared with the archived file of the same name, which shows at a
+glance whether a change to a SART class changes any past season's outputs:
+
+    python SART_batch.py --python python2                       #every season, one process each
+    python SART_batch.py 2018 --out rescore --python python2    #just 2018
+    python SART_batch.py myevent.ipynb:my_event_files --workers 2
+
+The archived notebooks and SART_Class_v2/v5 are Python 2 code (print
+statements, iteritems) written against pandas 0.2x, so the seasons have to be
+run by a Python 2.7 interpreter with pandas 0.24: --python names it, and each
+tournament is then run by that interpreter in a child process (the batch itself
+can run under either).  Without --python the tournaments run in this
+interpreter.
+
+Lines a notebook marks '#not required for actual event' were added after the
+event to test the notebook and are left out, as they were at the event itself:
+in 2018 they reset the round 1 and 2 results' row labels, which makes the
+mispunch fixes (r1_results.loc['22', ...]) add rows instead of editing the
+runners.  With them left out 2017 and 2018 reproduce every archived file.
+
+A notebook that stops because an input file isn't there (2019's results files
+aren't in the archive) is reported as skipped, with the missing file, rather
+than as a failed cell.  A summary of every tournament (cells run, the cell that
+failed or was skipped at if any, files written and whether each matches the
+archive) is printed and written to batch_summary.json in the output directory.
+'''
+from __future__ import print_function
+import __future__
+import argparse
+import errno
+import filecmp
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import time
+import traceback
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#season -> (notebook, event directory), relative to the repo
+SEASONS = {'2017': ('2017_SART.ipynb', '2017_event_files'),
+           '2018': ('2018_SART_58.ipynb', '2018_event_files_58'),
+           '2019': ('2019_SART.ipynb', '2019_event_files')}
+
+#notebook lines carrying this comment were only for testing the notebook after the event
+TEST_ONLY_MARKER = '#not required for actual event'
+
+
+def notebook_code_cells(notebook_path):
+    '''Source of every code cell, with IPython magics, shell escapes and test only lines dropped.'''
+    with io.open(notebook_path, encoding='utf-8') as notebook_file:
+        notebook = json.load(notebook_file)
+    cells = []
+    for cell in notebook['cells']:
+        if cell['cell_type'] != 'code':
+            continue
+        source = cell['source'] if isinstance(cell['source'], str) else ''.join(cell['source'])
+        lines = [line for line in source.splitlines()
+                 if not line.lstrip().startswith(('%', '!')) and TEST_ONLY_MARKER not in line]
+        cells.append('\n'.join(lines))
+    return cells
+
+
+def _written_files(run_dir, started):
+    return sorted(os.path.relpath(os.path.join(folder, name), run_dir)
+                  for folder, _, names in os.walk(run_dir) for name in names
+                  if os.path.getmtime(os.path.join(folder, name)) >= started)
+
+
+def run_tournament(job):
+    '''Run one archived tournament in its own scratch directory; returns a summary dict.'''
+    name, notebook, event_dir, out_dir, engine_dir = job[:5]
+    python = job[5] if len(job) > 5 else None
+    if python:
+        return _run_in_interpreter(python, job[:5])
+    run_dir = os.path.join(out_dir, name)
+    if os.path.exists(run_dir):
+        shutil.rmtree(run_dir)
+    os.makedirs(run_dir)
+    #the notebooks use paths relative to the repo, e.g. '2017_event_files/TT_R0_Results.csv'
+    shutil.copytree(os.path.join(REPO_DIR, event_dir), os.path.join(run_dir, event_dir))
+
+    summary = {'tournament': name, 'notebook': notebook, 'event_dir': event_dir, 'cells_run': 0,
+               'failed_cell': None, 'error': None, 'skipped': None}
+    cells = notebook_code_cells(os.path.join(REPO_DIR, notebook))
+    summary['cells'] = len(cells)
+
+    os.chdir(run_dir)
+    sys.path.insert(0, engine_dir)
+    log = io.open(os.path.join(run_dir, 'run.log'), 'w', encoding='utf-8')
+    stdout = sys.stdout
+    sys.stdout = _TextLog(log)
+    started = time.time() - 1
+    namespace = {'__name__': '__sart_batch__'}
+    try:
+        for cell_no, source in enumerate(cells):
+            #compile every cell with print_function on, as the notebooks turn it on part way through
+            code = compile(source, '{} cell {}'.format(notebook, cell_no), 'exec',
+                           __future__.print_function.compiler_flag, True)
+            exec(code, namespace)
+            summary['cells_run'] += 1
+    except Exception as error:
+        summary['failed_cell'] = summary['cells_run']
+        if isinstance(error, (IOError, OSError)) and error.errno == errno.ENOENT:
+            #not a failure of the code - the archive doesn't have this input
+            summary['skipped'] = 'missing input file {}'.format(error.filename or error)
+        else:
+            summary['error'] = '{}: {}'.format(type(error).__name__, error)
+        traceback.print_exc(file=sys.stdout)
+    finally:
+        sys.stdout = stdout
+        log.close()
+    summary['seconds'] = round(time.time() - started - 1, 3)
+
+    summary['files'] = {}
+    for written in _written_files(run_dir, started):
+        if written == 'run.log':
+            continue
+        archived = os.path.join(REPO_DIR, written)
+        if not os.path.exists(archived):
+            status = 'new'
+        else:
+            status = 'same' if filecmp.cmp(archived, os.path.join(run_dir, written), shallow=False) else 'differs'
+        summary['files'][written] = status
+    return summary
+
+
+def _run_in_interpreter(python, job):
+    #run_tournament in a child process of another interpreter (e.g. python2 for the archived seasons);
+    #the child prints the summary as its last line of output
+    code = ('import json, sys; sys.path.insert(0, {!r}); import SART_batch; '
+            'print(json.dumps(SART_batch.run_tournament(tuple(json.loads(sys.argv[1])))))').format(REPO_DIR)
+    output = subprocess.check_output([python, '-c', code, json.dumps(list(job))], cwd=REPO_DIR)
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+class _TextLog(object):
+
+    #lets py2 str and py3 str prints both land in an io text file
+    def __init__(self, log):
+        self.log = log
+
+    def write(self, text):
+        if not isinstance(text, type(u'')):
+            text = text.decode('utf-8', 'replace')
+        self.log.write(text)
+
+    def flush(self):
+        self.log.flush()
+
+
+def parse_tournament(spec):
+    #'2018' or 'notebook.ipynb:event_dir'
+    if spec in SEASONS:
+        return (spec,) + SEASONS[spec]
+    notebook, _, event_dir = spec.partition(':')
+    if not event_dir:
+        raise ValueError('{!r} is not a season ({}) or notebook.ipynb:event_dir'.format(spec, ', '.join(sorted(SEASONS))))
+    return (os.path.splitext(os.path.basename(notebook))[0], notebook, event_dir)
+
+
+def run_batch(tournaments, out_dir, workers=None, engine_dir=REPO_DIR, python=None):
+    '''Reprocess tournaments ((name, notebook, event_dir) tuples) in a process pool; returns their summaries.
+
+    python - interpreter to run each tournament with (see above), default this one
+    '''
+    out_dir = os.path.abspath(out_dir)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    jobs = [(name, notebook, event_dir, out_dir, engine_dir, python) for name, notebook, event_dir in tournaments]
+    #one tournament per worker process, and a fresh process for each so class modules and cwd don't leak
+    pool = multiprocessing.Pool(processes=min(workers or multiprocessing.cpu_count(), len(jobs)), maxtasksperchild=1)
+    try:
+        summaries = sorted(pool.map(run_tournament, jobs, chunksize=1), key=lambda summary: summary['tournament'])
+    finally:
+        pool.close()
+        pool.join()
+
+    with io.open(os.path.join(out_dir, 'batch_summary.json'), 'w', encoding='utf-8') as summary_file:
+        summary_file.write(u'{}'.format(json.dumps(summaries, indent=1, sort_keys=True)))
+    return summaries
+
+
+def print_summary(summaries):
+    for summary in summaries:
+        statuses = list(summary['files'].values())
+        print('{}: {}/{} cells, {:.1f}s, {} files written ({} same as archive, {} differ, {} new)'.format(
+            summary['tournament'], summary['cells_run'], summary['cells'], summary['seconds'], len(statuses),
+            statuses.count('same'), statuses.count('differs'), statuses.count('new')))
+        if summary['error']:
+            print('    stopped at cell {}: {}'.format(summary['failed_cell'], summary['error']))
+        elif summary.get('skipped'):
+            print('    skipped from cell {}: {}'.format(summary['failed_cell'], summary['skipped']))
+        for written, status in sorted(summary['files'].items()):
+            if status == 'differs':
+                print('    differs from archive: {}'.format(written))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reprocess archived SART tournaments in parallel.')
+    parser.add_argument('tournaments', nargs='*', default=sorted(SEASONS),
+                        help='seasons ({}) or notebook.ipynb:event_dir pairs'.format(', '.join(sorted(SEASONS))))
+    parser.add_argument('--out', default='batch_output', help='directory the reprocessed tournaments are written under')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per core)')
+    parser.add_argument('--engine-dir', default=REPO_DIR, help='directory the SART_Class_v* modules are imported from')
+    parser.add_argument('--python', default=None,
+                        help='interpreter to run the notebooks with; the archived seasons need Python 2.7 with pandas 0.24')
+    args = parser.parse_args(argv)
+
+    summaries = run_batch([parse_tournament(spec) for spec in args.tournaments], args.out, args.workers,
+                          os.path.abspath(args.engine_dir), args.python)
+    print_summary(summaries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+'''Benchmark the SART bracket lifecycle as the field grows.
+
+Runs a whole tournament - seed keys, bracket, time trial, every round's heat
+assignments, heat sheets, SportsSoftware import files and final results - for
+synthetic fields of 74, 80, 1k, 10k and 100k entrants, plus the real 2017 and
+2018 time trial and registration files.  Synthetic registrations and results
+are written in the same OE0001/OE0012 CSV layouts SportsSoftware exports, so
+file parsing is part of what gets measured.
+
+Those brackets are generated (SART.from_bracket_format).  The 74 runner bracket
+run in 2019 is also benchmarked, set up through the SART(...) constructor as in
+2019_SART.ipynb and driven only through the methods the notebooks call, so a
+class that can't generate brackets - the original SART_Class_v6 - can be
+compared on it; for such a class only that run is made.
+
+Wall time and peak memory are recorded for every stage (and every round of the
+per-round stages) and written as JSON, so runs from different versions of the
+class can be compared:
+
+    python SART_benchmark.py
+    python SART_benchmark.py --sizes 74 1000 --out bench_v6.json
+    python SART_benchmark.py --module SART_Class_v7 --no-fixtures
+    python SART_benchmark.py --module SART_Class_v6_original --out bench_original.json
+
+Peak memory comes from tracemalloc where available (Python 3), which slows the
+stages it watches; use --no-memory for clean timings.  Under Python 2 the
+process-wide peak RSS is reported instead.
+'''
+from __future__ import print_function
+import argparse
+import importlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = [74, 80, 1000, 10000, 100000]
+
+#real event files used as fixtures: (name, time trial results, registration, people per heat)
+FIXTURES = [('2017', '2017_event_files/TT_R0_Results.csv',
+             '2017_event_files/EntryForOE-20170908022926-R00-TT.csv', 5),
+            ('2018', '2018_event_files_58/00_NSC1_TimeTrial/TT_R0_Results.csv',
+             '2018_event_files_58/00_NSC1_TimeTrial/EntryForOE-20180906074203-R00-TimeTrial.csv', 4)]
+
+#take the OE0012 (results) and OE0001 (registration) column layouts from real exports
+RESULTS_LAYOUT = '2018_event_files_58/01_NSC2/R1_NSC_Results.csv'
+REGISTRATION_LAYOUT = '2018_event_files_58/01_NSC2/SS_import_R1_with_heats.csv'
+
+COLUMNS = ['Round', 'Nxt_Heat', 'First_name', 'Surname', 'Time', 'Nxt_Heat_Time']
+
+#the 74 runner bracket run in 2019, as typed into 2019_SART.ipynb (heats 304/308 and 402 combined by hand)
+R0_SEEDS_2019 = {'Heat 101': [1, 32, 33, 64, 65], 'Heat 102': [16, 17, 48, 49],
+                 'Heat 103': [8, 25, 40, 57, 72], 'Heat 104': [9, 24, 41, 56, 73],
+                 'Heat 105': [4, 29, 36, 61, 68], 'Heat 106': [13, 20, 45, 52],
+                 'Heat 107': [5, 28, 37, 60, 69], 'Heat 108': [12, 21, 44, 53],
+                 'Heat 109': [2, 31, 34, 63, 66], 'Heat 110': [15, 18, 47, 50],
+                 'Heat 111': [7, 26, 39, 58, 71], 'Heat 112': [10, 23, 42, 55, 74],
+                 'Heat 113': [3, 30, 35, 62, 67], 'Heat 114': [14, 19, 46, 51],
+                 'Heat 115': [6, 27, 38, 59, 70], 'Heat 116': [11, 22, 43, 54]}
+BEF_AFT_HT_PAIRS_2019 = [((101, 102), (201, 202)), ((103, 104), (203, 204)), ((105, 106), (205, 206)),
+                         ((107, 108), (207, 208)), ((109, 110), (209, 210)), ((111, 112), (211, 212)),
+                         ((113, 114), (213, 214)), ((115, 116), (215, 216)),
+                         ((201, 203), (301, 302)), ((205, 207), (305, 306)), ((209, 211), (309, 310)),
+                         ((213, 215), (313, 314)), ((202, 204), (303, 304)), ((206, 208), (307, 308)),
+                         ((210, 212), (311, 304)), ((214, 216), (315, 308)),
+                         ((301, 305), (416, 414)), ((309, 313), (415, 413)), ((302, 306), (412, 410)),
+                         ((310, 314), (411, 409)), ((303, 307), (408, 406)), ((311, 315), (407, 405)),
+                         ((304, 308), (404, 402)),
+                         ((416, 415), (516, 515)), ((414, 413), (514, 513)), ((412, 411), (512, 511)),
+                         ((410, 409), (510, 509)), ((408, 407), (508, 507)), ((406, 405), (506, 505)),
+                         ((404, 404), (504, 504)), ((402, 402), (502, 502))]
+COMBINED_HEATS_R3_2019 = [304, 308]
+NINE_PERSON_HEAT_R4_2019 = [402]
+
+
+class StageRecorder(object):
+
+    '''Times stages and records their peak memory, collecting one record per stage run.'''
+
+    def __init__(self, track_memory=True):
+        self.track_memory = track_memory and tracemalloc is not None
+        self.records = []
+        self.context = {}
+
+    def run(self, stage, func, *args, **kwargs):
+        if self.track_memory:
+            tracemalloc.start()
+        start = time.time()
+        result = func(*args, **kwargs)
+        seconds = time.time() - start
+
+        record = dict(self.context, stage=stage, seconds=round(seconds, 6))
+        if self.track_memory:
+            record['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        elif resource is not None:
+            record['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.records.append(record)
+        print('  {:<35} {:>10.3f}s'.format(stage if 'round' not in record else '{} R{}'.format(stage, record['round']), seconds))
+        return result
+
+
+def _layout(path):
+    return list(pd.read_csv(os.path.join(REPO_DIR, path), nrows=0).columns)
+
+
+def format_times(seconds, fractional=True):
+    #float seconds -> 'H:MM:SS.fff' like a SportsSoftware export with fractional times ('H:MM:SS' if not fractional)
+    seconds = pd.Series(seconds)
+    whole = seconds.astype(int)
+    times = ((whole // 3600).astype(str) + ':' + (whole % 3600 // 60).astype(str).str.zfill(2) + ':'
+             + (whole % 60).astype(str).str.zfill(2))
+    if fractional:
+        times += '.' + ((seconds - whole) * 1000).round().astype(int).astype(str).str.zfill(3)
+    return times.values
+
+
+def unique_times(seconds, step=0.001):
+    #nudge equal times apart (by a millisecond, or step) so no heat pair ever has a tie
+    decimals = 3 if step < 1 else 0
+    seconds = pd.Series(np.round(seconds, decimals))
+    while seconds.duplicated().any():
+        seconds[seconds.duplicated()] += step
+        seconds = seconds.round(decimals)
+    return seconds.values
+
+
+def write_oe_csv(path, layout, df):
+    #fill a full OE layout (about 60 columns) with the columns we have, blanks elsewhere
+    out = pd.DataFrame(index=range(len(df)), columns=layout)
+    for column in df.columns:
+        out[column] = df[column].values
+    out.to_csv(path, index=False)
+
+
+def runner_keys(surnames, first_names):
+    #families share surnames, so runners are keyed on the whole name
+    return (pd.Series(surnames).astype(str) + ', ' + pd.Series(first_names).astype(str).values).values
+
+
+def synthetic_field(n_entrants, rng):
+    numbers = np.arange(n_entrants)
+    field = pd.DataFrame({'Surname': ['Runner{:06d}'.format(i) for i in numbers],
+                          'First name': ['First{:06d}'.format(i) for i in numbers]})
+    field['Ability'] = rng.uniform(400, 1500, n_entrants)
+    return field
+
+
+def write_registration(path, field):
+    registration = pd.DataFrame({'Stno': np.arange(1, len(field) + 1), 'Surname': field['Surname'].values,
+                                 'First name': field['First name'].values, 'Cl. no.': 1,
+                                 'Short': 'TT', 'Long': 'Time Trial'})
+    write_oe_csv(path, _layout(REGISTRATION_LAYOUT), registration)
+
+
+def write_round_results(path, sart, rnd, abilities, rng, fractional=True):
+    #everyone the bracket has placed into a Round rnd heat runs it; time = ability plus noise
+    runners = sart.bracket_df[(sart.bracket_df['Round'] == rnd - 1) & pd.notnull(sart.bracket_df['Surname'])]
+    seconds = abilities.reindex(runner_keys(runners['Surname'], runners['First_name'])).values * rng.uniform(0.9, 1.3, len(runners))
+    heats = runners['Nxt_Heat'].str.split().str[-1].astype(int).values
+    times = format_times(unique_times(seconds, 0.001 if fractional else 1), fractional)
+    results = pd.DataFrame({'Surname': runners['Surname'].values, 'First name': runners['First_name'].values,
+                            'Time': times, 'Entry cl. No': heats,
+                            'Cl. no.': heats, 'Short': ['H{}'.format(heat) for heat in heats],
+                            'Long': runners['Nxt_Heat'].values, 'Classifier': 0})
+    write_oe_csv(path, _layout(RESULTS_LAYOUT), results)
+
+
+def combined_final_heats(bef_aft_ht_pairs):
+    #final heats whose runners stay together as one group (fed by a heat paired with itself, like 502 and
+    #504 in 2019) are placed on total time; a generated bracket's final heats are all ordinary heats
+    return sorted(set(heat for (ht1, ht2), nxt_heats in bef_aft_ht_pairs if ht1 == ht2 for heat in nxt_heats))
+
+
+def run_lifecycle(sart, recorder, tt_csv, reg_csv, abilities, work_dir, rng, fractional=True):
+    #only the methods and attributes the notebooks use, so any version of the class can be run
+    recorder.run('prepare_sd_h_keys', sart.prepare_sd_h_keys)
+    recorder.run('create_bracket', sart.create_bracket)
+    recorder.run('process_time_trial_results', sart.process_time_trial_results, tt_csv)
+    recorder.run('add_time_trial_results', sart.add_time_trial_results)
+
+    #the original class numbers heats 101 to 516 and has no heat_base
+    heat_base = getattr(sart, 'heat_base', 100)
+    n_rounds = max(heat for pri_heats, nxt_heats in sart.bef_aft_ht_pairs for heat in nxt_heats) // heat_base
+    round_results = {}
+    for rnd in range(1, n_rounds + 1):
+        recorder.context['round'] = rnd
+        recorder.run('print_heat_assigns', sart.print_heat_assigns, rnd)
+        recorder.run('assign_nxt_ht_to_ss_import_csv', sart.assign_nxt_ht_to_ss_import_csv, reg_csv, rnd - 1)
+
+        results_csv = os.path.join(work_dir, 'R{}_Results.csv'.format(rnd))
+        write_round_results(results_csv, sart, rnd, abilities, rng, fractional)
+        round_results[rnd] = recorder.run('clean_results_csv', sart.clean_results_csv, results_csv)
+        if rnd < n_rounds:
+            recorder.run('nxt_ht_assigns', sart.nxt_ht_assigns, round_results[rnd], rnd)
+    del recorder.context['round']
+
+    combined_heats = combined_final_heats(sart.bef_aft_ht_pairs)
+    if combined_heats == [502, 504]:
+        #the 2019 bracket's finals, print_final_results' default (and the only ones the original class knows)
+        recorder.run('print_final_results', sart.print_final_results, round_results[4], round_results[5])
+    elif n_rounds == 5 and heat_base == 100:
+        recorder.run('print_final_results', sart.print_final_results, round_results[4], round_results[5], combined_heats)
+    else:
+        recorder.run('calc_combined_scores', sart.calc_combined_scores,
+                     {n_rounds - 1: round_results[n_rounds - 1], n_rounds: round_results[n_rounds]}, combined_heats)
+
+
+def write_synthetic_event(field, work_dir, rng, fractional=True):
+    #time trial results and registration for a synthetic field; returns their paths and the field's abilities
+    tt_csv = os.path.join(work_dir, 'TT_R0_Results.csv')
+    reg_csv = os.path.join(work_dir, 'RegMaster.csv')
+    tt_seconds = unique_times(field['Ability'].values * rng.uniform(0.9, 1.3, len(field)), 0.001 if fractional else 1)
+    tt = field.assign(Time=format_times(tt_seconds, fractional), **{'Entry cl. No': 1, 'Classifier': 0})
+    write_oe_csv(tt_csv, _layout(RESULTS_LAYOUT), tt.drop('Ability', axis=1))
+    write_registration(reg_csv, field)
+    abilities = pd.Series(field['Ability'].values, index=runner_keys(field['Surname'], field['First name']))
+    return tt_csv, reg_csv, abilities
+
+
+def benchmark_synthetic(SART, recorder, n_entrants, heat_size, work_dir, seed):
+    rng = np.random.RandomState(seed)
+    tt_csv, reg_csv, abilities = write_synthetic_event(synthetic_field(n_entrants, rng), work_dir, rng)
+    sart = SART.from_bracket_format(n_entrants, heat_size, COLUMNS, {})
+    run_lifecycle(sart, recorder, tt_csv, reg_csv, abilities, work_dir, rng)
+
+
+def benchmark_2019_bracket(SART, recorder, work_dir, seed):
+    #74 synthetic runners in the 2019 bracket, set up through the constructor; whole second times, as
+    #the original class's final results parse times as H:MM:SS
+    rng = np.random.RandomState(seed)
+    tt_csv, reg_csv, abilities = write_synthetic_event(synthetic_field(74, rng), work_dir, rng, fractional=False)
+    sart = SART(dict(R0_SEEDS_2019), BEF_AFT_HT_PAIRS_2019, COLUMNS, {}, COMBINED_HEATS_R3_2019, NINE_PERSON_HEAT_R4_2019)
+    run_lifecycle(sart, recorder, tt_csv, reg_csv, abilities, work_dir, rng, fractional=False)
+
+
+def benchmark_fixture(SART, recorder, tt_path, reg_path, heat_size, work_dir, seed):
+    #real time trial and registration files; later rounds are synthesised from each runner's time trial pace
+    rng = np.random.RandomState(seed)
+    tt = pd.read_csv(os.path.join(REPO_DIR, tt_path))
+    registration = pd.read_csv(os.path.join(REPO_DIR, reg_path))
+    reg_csv = os.path.join(work_dir, 'RegMaster.csv')
+    registration.merge(tt[['Surname', 'First name']], on=['Surname', 'First name']).to_csv(reg_csv, index=False)
+
+    #the real exports have whole second ties the race director settled by hand; settle them in export order
+    tt_seconds = pd.to_timedelta(tt['Time'], errors='coerce').dt.total_seconds()
+    finished = pd.notnull(tt_seconds)
+    tt.loc[finished, 'Time'] = format_times(unique_times(tt_seconds[finished].values))
+    tt_csv = os.path.join(work_dir, 'TT_R0_Results.csv')
+    tt.to_csv(tt_csv, index=False)
+
+    abilities = pd.Series(tt_seconds.fillna(tt_seconds.max()).values * 2, index=runner_keys(tt['Surname'], tt['First name']))
+    sart = SART.from_bracket_format(len(abilities), heat_size, COLUMNS, {})
+    run_lifecycle(sart, recorder, tt_csv, reg_csv, abilities, work_dir, rng)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the SART bracket lifecycle at increasing field sizes.')
+    parser.add_argument('--sizes', type=int, nargs='*', default=DEFAULT_SIZES, help='synthetic field sizes to run')
+    parser.add_argument('--heat-size', type=int, default=5, help='people per heat for synthetic fields')
+    parser.add_argument('--no-fixtures', action='store_true', help='skip the real 2017/2018 event files and the 2019 bracket')
+    parser.add_argument('--no-memory', action='store_true', help='do not track peak memory (cleaner timings)')
+    parser.add_argument('--module', default='SART_Class_v6', help='module providing the SART class to benchmark')
+    parser.add_argument('--seed', type=int, default=2019)
+    parser.add_argument('--out', default='bench_results.json', help='where to write the JSON records')
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, REPO_DIR)
+    SART = importlib.import_module(args.module).SART
+    recorder = StageRecorder(track_memory=not args.no_memory)
+
+    runs = [('synthetic-{}'.format(size), benchmark_synthetic, (size, args.heat_size)) for size in args.sizes]
+    if not args.no_fixtures:
+        runs += [('event-{}'.format(name), benchmark_fixture, (tt_path, reg_path, heat_size))
+                 for name, tt_path, reg_path, heat_size in FIXTURES]
+        runs.append(('bracket-2019', benchmark_2019_bracket, ()))
+    if not hasattr(SART, 'from_bracket_format'):
+        print('{} can only set up the 2019 bracket (no SART.from_bracket_format); running that alone'.format(args.module))
+        runs = [('bracket-2019', benchmark_2019_bracket, ())]
+
+    for fixture, bench, bench_args in runs:
+        print('{} ...'.format(fixture))
+        work_dir = tempfile.mkdtemp(prefix='sart_bench_')
+        recorder.context = {'fixture': fixture}
+        try:
+            bench(SART, recorder, *(bench_args + (work_dir, args.seed)))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {'module': args.module, 'python': platform.python_version(), 'pandas': pd.__version__,
+              'numpy': np.__version__, 'platform': platform.platform(),
+              'memory': 'tracemalloc' if recorder.track_memory else 'peak_rss_kb' if resource else None,
+              'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'records': recorder.records}
+    with open(args.out, 'w') as out:
+        json.dump(report, out, indent=1)
+    print('wrote {} stage records to {}'.format(len(recorder.records), args.out))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,806 @@
+'''Integer keyed bracket slots for the SART class.
+
+Every seed label the bracket uses ('12', 'W101', '101/102-Q3', '402-Q5') is a
+slot: a place in the bracket that one runner will fill.  Here each slot gets an
+integer slot id and is described by integer heat codes (204 rather than
+'Heat 204'), so lookups while an event is running are dict hits on int keys and
+array indexes rather than string building and parsing.  The legacy string
+labels are only produced when a bracket is displayed or exported.
+
+Everything here is standard library only, so bracket topology, slot lookups and
+advancing a round's finishers (advance) work without importing pandas or NumPy.
+The SART class loads those lazily (see LazyModule), only once a CSV is read or a
+DataFrame is built.  For quick lookups from the command line:
+
+    python SART_core.py 74 5 --heat 204 --label W101
+    python SART_core.py 74 5 --results R1_Results.csv --round 1
+'''
+from __future__ import print_function
+import argparse
+import csv
+import importlib
+import io
+import os
+from array import array
+from heapq import heappop, heappush
+from math import ceil
+from numbers import Integral
+
+HEAT_BASE = 100
+HEAT_CODE_BITS = 20  #bits each heat code gets in a slot key (see slot_key)
+
+#slot kinds
+SEED = 0            #round 0 seed, label '12'
+WINNER = 1          #winner of heat1, label 'W101'
+PAIR_QUALIFIER = 2  #rank-th fastest non-winner across heat1 and heat2, label '101/102-Q3'
+HEAT_QUALIFIER = 3  #rank-th finisher in heat1, label '402-Q5'
+
+
+def slot_key(kind, heat1=0, heat2=0, rank=0):
+    #pack a slot description into a single int so slot lookups hash one small int
+    if not (0 <= heat1 < 1 << HEAT_CODE_BITS and 0 <= heat2 < 1 << HEAT_CODE_BITS):
+        raise ValueError('heat codes {} and {} do not fit a slot key (each must be below {}) - '
+                         'too many heats per round for this heat_base'.format(heat1, heat2, 1 << HEAT_CODE_BITS))
+    return ((rank * 4 + kind) << (2 * HEAT_CODE_BITS)) | (heat1 << HEAT_CODE_BITS) | heat2
+
+
+def heat_code(heat):
+    #'Heat 204' -> 204 (ints pass straight through)
+    if isinstance(heat, Integral):
+        return int(heat)
+    return int(str(heat).split()[-1])
+
+
+def heat_label(code):
+    return 'Heat {}'.format(code)
+
+
+def parse_seed_label(label):
+    '''Turn a legacy seed label into (kind, heat1, heat2, rank).'''
+    if isinstance(label, Integral):
+        return SEED, 0, 0, int(label)
+    label = str(label)
+    if label.startswith('W'):
+        return WINNER, int(label[1:]), 0, 0
+    if '-Q' not in label:
+        return SEED, 0, 0, int(label)
+    heats, rank = label.split('-Q')
+    if '/' in heats:
+        heat1, heat2 = heats.split('/')
+        return PAIR_QUALIFIER, int(heat1), int(heat2), int(rank)
+    return HEAT_QUALIFIER, int(heats), 0, int(rank)
+
+
+def seed_label(kind, heat1=0, heat2=0, rank=0):
+    '''Legacy label for a slot - the inverse of parse_seed_label.'''
+    if kind == SEED:
+        return rank
+    if kind == WINNER:
+        return 'W{}'.format(heat1)
+    if kind == PAIR_QUALIFIER:
+        return '{}/{}-Q{}'.format(heat1, heat2, rank)
+    return '{}-Q{}'.format(heat1, rank)
+
+
+def parse_time(text):
+    #SportsSoftware time ('0:10:26', '10:26', '0:10:26.5') -> float seconds; None if it doesn't parse
+    try:
+        parts = [float(part) for part in str(text).strip().split(':')]
+    except ValueError:
+        return None
+    if not 1 <= len(parts) <= 3:
+        return None
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return seconds
+
+
+def parse_clock(clock):
+    #'11:15am' -> minutes after midnight (695)
+    clock = clock.strip().lower()
+    hours, minutes = clock[:-2].split(':')
+    return int(hours) % 12 * 60 + int(minutes) + (720 if clock.endswith('pm') else 0)
+
+
+def format_clock(minutes):
+    #695 -> '11:15am', the format start_times are written in
+    hours, minutes = divmod(int(minutes), 60)
+    return '{}:{:02d}{}'.format((hours - 1) % 12 + 1, minutes, 'pm' if hours % 24 >= 12 else 'am')
+
+
+def write_atomic(path, data):
+    '''Write data (bytes, or text written as utf-8) next to path and rename it into place, so a reader
+    - or a crash mid-write - sees the old file or the whole new one; returns path.'''
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'wb') as out:
+        out.write(data)
+        out.flush()
+        os.fsync(out.fileno())
+    getattr(os, 'replace', os.rename)(tmp_path, path)
+    return path
+
+
+class LazyModule(object):
+
+    '''Stand-in for a module that is only imported the first time one of its
+    attributes is used, e.g. pd = LazyModule('pandas').'''
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        module = self.__dict__['_module']
+        if module is None:
+            module = self.__dict__['_module'] = importlib.import_module(self.__dict__['_name'])
+        return getattr(module, attr)
+
+
+class Slot(object):
+
+    '''One bracket slot: who feeds it (kind, heat1, heat2, rank) and the heat its
+    runner goes to next (nxt_heat).'''
+
+    __slots__ = ('slot_id', 'kind', 'heat1', 'heat2', 'rank', 'nxt_heat')
+
+    def __init__(self, slot_id, kind, heat1, heat2, rank, nxt_heat):
+        self.slot_id = slot_id
+        self.kind = kind
+        self.heat1 = heat1
+        self.heat2 = heat2
+        self.rank = rank
+        self.nxt_heat = nxt_heat
+
+    def label(self):
+        return seed_label(self.kind, self.heat1, self.heat2, self.rank)
+
+    def __repr__(self):
+        return 'Slot({}, {!r} -> {})'.format(self.slot_id, self.label(), heat_label(self.nxt_heat))
+
+
+class SlotTable(object):
+
+    '''Compiled bracket: slot ids 0..n-1 index parallel int arrays.
+
+    parameters:
+    h_seed_key - dict, keys are 'Heat ###' (or int heat codes), values are the
+        seed labels that feed into that heat (see SART.prepare_sd_h_keys).
+    heat_base - int, heat codes are round * heat_base + heat number.
+
+    attributes:
+    kind, heat1, heat2, rank, nxt_heat - array of int, one entry per slot id
+    heat_slots - dict, heat code -> list of slot ids feeding that heat
+    '''
+
+    __slots__ = ('heat_base', 'kind', 'heat1', 'heat2', 'rank', 'nxt_heat', 'heat_slots', '_by_key')
+
+    def __init__(self, h_seed_key, heat_base=HEAT_BASE):
+        self.heat_base = heat_base
+        self.kind = array('b')
+        self.heat1 = array('l')
+        self.heat2 = array('l')
+        self.rank = array('l')
+        self.nxt_heat = array('l')
+        self.heat_slots = {}
+        self._by_key = {}
+
+        for heat in sorted(h_seed_key, key=heat_code):
+            for label in h_seed_key[heat]:
+                self.add_slot(heat_code(heat), *parse_seed_label(label))
+
+    def add_slot(self, nxt_heat, kind, heat1=0, heat2=0, rank=0):
+        slot_id = len(self.kind)
+        self.kind.append(kind)
+        self.heat1.append(heat1)
+        self.heat2.append(heat2)
+        self.rank.append(rank)
+        self.nxt_heat.append(nxt_heat)
+        self.heat_slots.setdefault(nxt_heat, []).append(slot_id)
+        self._by_key[slot_key(kind, heat1, heat2, rank)] = slot_id
+        return slot_id
+
+    def __len__(self):
+        return len(self.kind)
+
+    def slot_id(self, kind, heat1=0, heat2=0, rank=0):
+        '''Slot id for a slot description, or -1 if the bracket has no such slot.'''
+        return self._by_key.get(slot_key(kind, heat1, heat2, rank), -1)
+
+    def slot_id_for_label(self, label):
+        '''Slot id for a legacy seed label, or -1 if the bracket has no such slot (or it isn't a seed label).'''
+        try:
+            return self.slot_id(*parse_seed_label(label))
+        except ValueError:
+            return -1
+
+    def slot(self, slot_id):
+        return Slot(slot_id, self.kind[slot_id], self.heat1[slot_id], self.heat2[slot_id],
+                    self.rank[slot_id], self.nxt_heat[slot_id])
+
+    def label(self, slot_id):
+        return seed_label(self.kind[slot_id], self.heat1[slot_id], self.heat2[slot_id], self.rank[slot_id])
+
+    def labels(self):
+        return [self.label(slot_id) for slot_id in range(len(self))]
+
+    def round_of_heat(self, heat):
+        return heat // self.heat_base
+
+    def slot_round(self, slot_id):
+        #round in which a slot gets filled - one less than the round of the heat it feeds
+        return self.nxt_heat[slot_id] // self.heat_base - 1
+
+    def to_seed_key(self):
+        '''Rebuild the legacy h_seed_key dict ('Heat ###' -> list of seed labels).'''
+        return dict((heat_label(heat), [self.label(slot_id) for slot_id in slot_ids])
+                    for heat, slot_ids in self.heat_slots.items())
+
+
+class RunnerRecord(object):
+
+    '''Where one runner is in the bracket.
+
+    attributes:
+    slots - dict, round -> slot id the runner's result in that round filled (0 is the time trial seed)
+    times - dict, round -> time the runner ran in that round
+    round - int, latest round with a result
+    heat - int, heat code the runner runs next
+    start_time - projected start of that heat (None if start_times doesn't have it)
+    '''
+
+    __slots__ = ('surname', 'first_name', 'slots', 'times', 'round', 'heat', 'start_time')
+
+    def __init__(self, surname, first_name):
+        self.surname = surname
+        self.first_name = first_name
+        self.slots = {}
+        self.times = {}
+        self.round = None
+        self.heat = None
+        self.start_time = None
+
+    def __repr__(self):
+        return 'RunnerRecord({!r}, {!r}, next {})'.format(self.surname, self.first_name,
+                                                         heat_label(self.heat) if self.heat is not None else None)
+
+
+class RunnerIndex(object):
+
+    '''Runner (surname, first name) -> RunnerRecord, kept up to date slot write by slot write, so
+    "where do I run next?" is a dict hit instead of a scan of the bracket.
+
+    parameters:
+    slot_table - SlotTable of the bracket
+    start_times - dict, 'Heat ###' -> start time
+
+    attributes:
+    slot_runner - list, slot id -> (surname, first name) of the runner in it, or None
+    '''
+
+    __slots__ = ('slot_table', 'start_times', 'runners', 'slot_runner')
+
+    def __init__(self, slot_table, start_times=None):
+        self.slot_table = slot_table
+        self.start_times = start_times or {}
+        self.runners = {}
+        self.slot_runner = [None] * len(slot_table)
+
+    def __len__(self):
+        return len(self.runners)
+
+    def __contains__(self, key):
+        return key in self.runners
+
+    def get(self, surname, first_name):
+        return self.runners.get((surname, first_name))
+
+    def slot_in_round(self, surname, first_name, rnd):
+        '''Slot id the runner filled in round rnd, or -1.'''
+        record = self.runners.get((surname, first_name))
+        return record.slots.get(rnd, -1) if record is not None else -1
+
+    def in_round(self, rnd):
+        '''(surname, first name) of every runner with a round rnd slot, in slot id order.'''
+        return [key for slot_id, key in enumerate(self.slot_runner)
+                if key is not None and self.slot_table.slot_round(slot_id) == rnd]
+
+    def record(self, slot_id, surname, first_name, time):
+        '''The runner now fills slot_id; whoever filled it before (a re-run round) loses it.'''
+        self.clear(slot_id)
+        rnd = self.slot_table.slot_round(slot_id)
+        key = (surname, first_name)
+        record = self.runners.get(key)
+        if record is None:
+            record = self.runners[key] = RunnerRecord(surname, first_name)
+        old_slot = record.slots.get(rnd)
+        if old_slot is not None and old_slot != slot_id and self.slot_runner[old_slot] == key:
+            self.slot_runner[old_slot] = None
+        record.slots[rnd] = slot_id
+        record.times[rnd] = time
+        self.slot_runner[slot_id] = key
+        self._update_next_heat(record)
+
+    def clear(self, slot_id):
+        key = self.slot_runner[slot_id]
+        if key is None:
+            return
+        self.slot_runner[slot_id] = None
+        record = self.runners[key]
+        rnd = self.slot_table.slot_round(slot_id)
+        if record.slots.get(rnd) == slot_id:
+            del record.slots[rnd]
+            del record.times[rnd]
+        if record.slots:
+            self._update_next_heat(record)
+        else:
+            del self.runners[key]
+
+    def _update_next_heat(self, record):
+        record.round = max(record.slots)
+        record.heat = self.slot_table.nxt_heat[record.slots[record.round]]
+        record.start_time = self.start_times.get(heat_label(record.heat))
+
+
+class BracketFormat(object):
+
+    '''Bracket topology produced by generate_bracket, in the same shapes the SART
+    class takes by hand (r0_seeds, bef_aft_ht_pairs, h_seed_key).
+
+    attributes:
+    r0_seeds - dict, 'Heat ###' -> list of round 0 seeds for each round 1 heat
+    bef_aft_ht_pairs - list of ((prior heat, prior heat), (up heat, down heat))
+    h_seed_key - dict, 'Heat ###' -> list of seed labels feeding that heat
+    heat_counts - dict, heat code -> number of runners the heat will hold
+    underfilled - dict, 'Heat ###' -> size, every heat holding fewer than heat_size runners
+    combined - dict, 'Heat ###' -> size, up heats that absorbed a too-small down heat
+    heat_base - int, heat codes are round * heat_base + heat number
+    '''
+
+    __slots__ = ('r0_seeds', 'bef_aft_ht_pairs', 'h_seed_key', 'heat_counts', 'underfilled', 'combined', 'heat_base')
+
+    def __init__(self, r0_seeds, bef_aft_ht_pairs, h_seed_key, heat_counts, underfilled, combined, heat_base):
+        self.r0_seeds = r0_seeds
+        self.bef_aft_ht_pairs = bef_aft_ht_pairs
+        self.h_seed_key = h_seed_key
+        self.heat_counts = heat_counts
+        self.underfilled = underfilled
+        self.combined = combined
+        self.heat_base = heat_base
+
+
+def bracket_seed_order(n_heats):
+    #standard bracket order of the top seeds across heat positions: 2 -> [1, 2], 4 -> [1, 4, 2, 3],
+    #16 -> [1, 16, 8, 9, 4, 13, 5, 12, 2, 15, 7, 10, 3, 14, 6, 11] (the Heat 101-116 order SART has always used)
+    order = [1]
+    while len(order) < n_heats:
+        size = len(order) * 2
+        order = [seed for top in order for seed in (top, size + 1 - top)]
+    return order
+
+
+def generate_bracket(bracket_size, heat_size, n_winners=1, n_fastest=None, n_rounds=None, min_heat_size=None):
+    '''Build the seeding, heat pairs and seed keys for any field size.
+
+    Round 1 has the smallest power of two number of heats that fits bracket_size
+    runners at heat_size per heat, seeded by snaking through the standard bracket
+    order.  After each round heats of the same standing are paired: the winner of
+    each heat (n_winners=1) plus the next n_fastest times across the pair move up,
+    everyone else moves down.  With the defaults (n_winners=1, n_fastest=heat_size-2)
+    this is the usual "2 heat winners + next 3 fastest" rule for 5 person heats.
+
+    Up heats are always filled first, so any shortfall from a field smaller than
+    heats * heat_size ends up in down heats; those heats and their sizes are
+    reported in underfilled rather than being hand-removed from the keys.  A down
+    heat that would drop below min_heat_size is combined into its up heat instead
+    (what combined_heats_R3 did by hand), and reported in combined.
+
+    parameters:
+    bracket_size - int, number of runners
+    heat_size - int, runners per heat
+    n_winners - int, 0 or 1, whether heat winners move up automatically
+    n_fastest - int, further runners per heat pair moving up on time
+        (default heat_size - 2 * n_winners)
+    n_rounds - int, rounds after the time trial (default: enough rounds for
+        every final heat to be its own level, e.g. 5 rounds for 16 heats)
+    min_heat_size - int, smallest down heat worth running on its own
+        (default heat_size // 2)
+    '''
+    if n_winners not in (0, 1):
+        raise ValueError('n_winners must be 0 or 1, got {}'.format(n_winners))
+    if n_fastest is None:
+        n_fastest = heat_size - 2 * n_winners
+    if bracket_size < 2 or heat_size < 2 or n_fastest < 0 or 2 * n_winners + n_fastest > 2 * heat_size:
+        raise ValueError('cannot build a bracket of {} with heats of {} moving up {} winners + {} fastest'.format(
+            bracket_size, heat_size, n_winners, n_fastest))
+
+    n_heats = 2
+    while n_heats * heat_size < bracket_size:
+        n_heats *= 2
+    max_rounds = n_heats.bit_length()
+    if n_rounds is None:
+        n_rounds = max_rounds
+    if not 1 <= n_rounds <= max_rounds:
+        raise ValueError('a bracket with {} heats per round supports 1 to {} rounds, got {}'.format(
+            n_heats, max_rounds, n_rounds))
+    heat_base = HEAT_BASE if n_heats < HEAT_BASE else 10 ** len(str(n_heats))
+    up_size = 2 * n_winners + n_fastest
+    if min_heat_size is None:
+        min_heat_size = heat_size // 2
+
+    #round 1: snake the seeds through the standard bracket order
+    heat_of_rank = [0] * n_heats
+    for position, rank in enumerate(bracket_seed_order(n_heats)):
+        heat_of_rank[rank - 1] = heat_base + position + 1
+
+    h_seed_key = {}
+    heat_counts = dict((heat_base + position + 1, 0) for position in range(n_heats))
+    for seed in range(1, bracket_size + 1):
+        row, col = divmod(seed - 1, n_heats)
+        heat = heat_of_rank[n_heats - 1 - col if row % 2 else col]
+        h_seed_key.setdefault(heat_label(heat), []).append(seed)
+        heat_counts[heat] += 1
+    r0_seeds = dict((heat, list(seeds)) for heat, seeds in h_seed_key.items())
+
+    #later rounds: heats at the same level sit stride apart, each pair feeds heats 2p+1 (up) and 2p+2 (down)
+    bef_aft_ht_pairs = []
+    combined = {}
+    for rnd in range(1, n_rounds):
+        stride = 2 ** (rnd - 1)
+        pair_no = 0
+        for position in range(n_heats):
+            if (position // stride) % 2:
+                continue
+            ht1 = rnd * heat_base + position + 1
+            ht2 = ht1 + stride
+            win_ht = (rnd + 1) * heat_base + 2 * pair_no + 1
+            lose_ht = win_ht + 1
+            pair_no += 1
+            heat_counts[win_ht] = heat_counts[lose_ht] = 0
+            if not heat_counts[ht1] and not heat_counts[ht2]:
+                continue
+            bef_aft_ht_pairs.append(((ht1, ht2), (win_ht, lose_ht)))
+
+            up_seeds = []
+            if n_winners:
+                up_seeds.extend(seed_label(WINNER, ht) for ht in (ht1, ht2) if heat_counts[ht])
+            n_qualifiers = heat_counts[ht1] + heat_counts[ht2] - len(up_seeds)
+            n_up = max(0, min(n_qualifiers, up_size - len(up_seeds)))
+            if n_qualifiers - n_up < min_heat_size:
+                n_up = n_qualifiers
+                combined[heat_label(win_ht)] = len(up_seeds) + n_up
+            up_seeds.extend(seed_label(PAIR_QUALIFIER, ht1, ht2, rank) for rank in range(1, n_up + 1))
+            down_seeds = [seed_label(PAIR_QUALIFIER, ht1, ht2, rank) for rank in range(n_up + 1, n_qualifiers + 1)]
+
+            for heat, seeds in ((win_ht, up_seeds), (lose_ht, down_seeds)):
+                heat_counts[heat] = len(seeds)
+                if seeds:
+                    h_seed_key[heat_label(heat)] = seeds
+
+    underfilled = dict((heat_label(heat), count) for heat, count in heat_counts.items() if 0 < count < heat_size)
+    for heat in list(combined):
+        if heat_counts[heat_code(heat)] <= heat_size:
+            del combined[heat]
+    return BracketFormat(r0_seeds, bef_aft_ht_pairs, h_seed_key, heat_counts, underfilled, combined, heat_base)
+
+
+def advance(slot_table, finishers, heat_pairs):
+    '''Slot a round's finishers into the bracket, by the same rules as SART.nxt_ht_assigns.
+
+    Each heat's winner fills W### (if the bracket has that slot), the rest of each
+    heat pair is ranked on time into ###/###-Q#, and a single heat pair fills ###-Q#
+    in finish order.  Equal times are ordered by tiebreak, then the lower heat, then
+    the order finishers are given in.
+
+    parameters:
+    slot_table - SlotTable
+    finishers - iterable of (runner, heat, seconds) or (runner, heat, seconds, tiebreak);
+        runner can be anything (e.g. a name); seconds None sorts last
+    heat_pairs - list of (ht1, ht2) or (ht1, ht2, single_heat); single_heat defaults to ht1 == ht2
+
+    Returns (assigned, unslotted): lists of (slot id, runner) and of (seed label, runner)
+    for places the bracket has no slot for.
+    '''
+    by_heat = {}
+    for order, finisher in enumerate(finishers):
+        runner, heat, seconds = finisher[:3]
+        tiebreak = finisher[3] if len(finisher) > 3 else 0
+        key = (float('inf') if seconds is None or seconds != seconds else seconds, tiebreak)
+        by_heat.setdefault(heat, []).append((key, order, runner))
+    for entries in by_heat.values():
+        entries.sort(key=lambda entry: entry[:2])
+
+    assigned, unslotted = [], []
+
+    def place(runner, kind, heat1, heat2=0, rank=0):
+        slot_id = slot_table.slot_id(kind, heat1, heat2, rank)
+        if slot_id < 0:
+            unslotted.append((seed_label(kind, heat1, heat2, rank), runner))
+        else:
+            assigned.append((slot_id, runner))
+
+    for heat_pair in heat_pairs:
+        ht1, ht2 = heat_pair[:2]
+        if (heat_pair[2] if len(heat_pair) > 2 else ht1 == ht2):
+            for rank, (key, order, runner) in enumerate(by_heat.get(ht1, []), 1):
+                place(runner, HEAT_QUALIFIER, ht1, rank=rank)
+            continue
+        rest = []
+        for heat in (ht1, ht2):
+            entries = by_heat.get(heat, [])
+            if entries and slot_table.slot_id(WINNER, heat) >= 0:
+                place(entries[0][2], WINNER, heat)
+                entries = entries[1:]
+            rest.extend(entries)
+        #stable on (time, tiebreak), so equal times keep ht1 before ht2
+        rest.sort(key=lambda entry: entry[0])
+        for rank, (key, order, runner) in enumerate(rest, 1):
+            place(runner, PAIR_QUALIFIER, ht1, ht2, rank)
+    return assigned, unslotted
+
+
+class HeatSchedule(object):
+
+    '''Dependency graph of heats built from bef_aft_ht_pairs and r0_seeds.
+
+    A heat pair can be processed once both its heats have finished; a heat can
+    start once every heat pair feeding it has been processed (round 1 heats wait
+    on the time trial).  Tracking this per heat pair rather than per round lets
+    rounds overlap, and the critical path shows which pending heat is holding
+    up the final heats.
+
+    parameters:
+    bef_aft_ht_pairs - list of ((prior heat, prior heat), (up heat, down heat))
+    r0_seeds - dict, 'Heat ###' -> round 0 seeds (its keys are the round 1 heats)
+
+    attributes:
+    finished - set, heats whose results are in
+    processed - set, heat pairs (ht1, ht2) written to the bracket
+    seeded - bool, time trial results are in the bracket
+    '''
+
+    def __init__(self, bef_aft_ht_pairs, r0_seeds):
+        self.pairs = [(tuple(pri_heats), tuple(wn_ls_heats)) for pri_heats, wn_ls_heats in bef_aft_ht_pairs]
+        self.first_heats = sorted(heat_code(heat) for heat in r0_seeds)
+        self.feeding_pairs = dict((heat, []) for heat in self.first_heats)
+        self.next_heats = {}
+        for pri_heats, wn_ls_heats in self.pairs:
+            for heat in set(wn_ls_heats):
+                self.feeding_pairs.setdefault(heat, []).append(pri_heats)
+            for heat in set(pri_heats):
+                self.next_heats.setdefault(heat, set()).update(wn_ls_heats)
+        self.heats = self._topological_order()
+        self.finished = set()
+        self.processed = set()
+        self.seeded = False
+
+    def _topological_order(self):
+        heats = set(self.feeding_pairs) | set(self.next_heats)
+        n_feeders = dict((heat, 0) for heat in heats)
+        for heat, next_heats in self.next_heats.items():
+            for next_heat in next_heats:
+                n_feeders[next_heat] += 1
+        order = []
+        queue = sorted(heat for heat, count in n_feeders.items() if count == 0)
+        while queue:
+            heat = heappop(queue)
+            order.append(heat)
+            for next_heat in self.next_heats.get(heat, ()):
+                n_feeders[next_heat] -= 1
+                if not n_feeders[next_heat]:
+                    heappush(queue, next_heat)
+        if len(order) != len(heats):
+            raise ValueError('bef_aft_ht_pairs loops back on itself around heats {}'.format(
+                sorted(heat for heat, count in n_feeders.items() if count)))
+        return order
+
+    def mark_seeded(self):
+        self.seeded = True
+
+    def mark_heat_finished(self, heat):
+        self.finished.add(heat)
+
+    def mark_pair_processed(self, ht1, ht2):
+        self.finished.update((ht1, ht2))
+        self.processed.add((ht1, ht2))
+
+    def heat_can_start(self, heat):
+        feeders = self.feeding_pairs.get(heat, [])
+        if heat in self.first_heats:
+            return self.seeded
+        return bool(feeders) and all(pair in self.processed for pair in feeders)
+
+    def ready_pairs(self):
+        '''Heat pairs whose heats have both finished but which are not in the bracket yet.'''
+        return [pri_heats for pri_heats, wn_ls_heats in self.pairs
+                if pri_heats not in self.processed and all(heat in self.finished for heat in pri_heats)]
+
+    def startable_heats(self):
+        '''Heats that have all their runners assigned but have not finished.'''
+        return [heat for heat in self.heats if heat not in self.finished and self.heat_can_start(heat)]
+
+    def final_heats(self):
+        return [heat for heat in self.heats if heat not in self.next_heats]
+
+    def critical_path(self, durations=None, heat_duration=1):
+        '''Longest chain of unfinished heats ending at a final heat.
+
+        durations - dict, heat -> time the heat takes to run and process (default heat_duration);
+            finished heats cost nothing.
+        Returns (remaining time, list of heats along the path, earliest first).
+        '''
+        durations = durations or {}
+        longest = {}
+        previous = {}
+        for heat in self.heats:
+            cost = 0 if heat in self.finished else durations.get(heat, heat_duration)
+            feeder_heats = [feeder for pair in self.feeding_pairs.get(heat, []) for feeder in set(pair)]
+            best = max(feeder_heats, key=lambda feeder: longest[feeder]) if feeder_heats else None
+            longest[heat] = cost + (longest[best] if best is not None else 0)
+            previous[heat] = best
+
+        end = max(self.final_heats(), key=lambda heat: longest[heat])
+        path = [end]
+        while previous[path[-1]] is not None:
+            path.append(previous[path[-1]])
+        path.reverse()
+        return longest[end], [heat for heat in path if heat not in self.finished]
+
+    def blocking_heat(self, durations=None, heat_duration=1):
+        '''First unfinished heat on the critical path - the one holding up the schedule right now.'''
+        remaining, path = self.critical_path(durations, heat_duration)
+        return path[0] if path else None
+
+    def plan_start_times(self, first_start, interval=3, heat_duration=20, processing=5, capacity=None,
+                         round_windows=None, durations=None, heat_base=HEAT_BASE):
+        '''Work out a start time for every heat, instead of hand typing start_times.
+
+        Heats go off one every interval minutes, at most capacity on the course at once, and
+        a heat never starts before every heat pair feeding it has finished and had processing
+        minutes to be put in the bracket and its heat sheet printed.  Heats are started in the
+        order they become ready (lowest heat number first among equals), so later rounds
+        overlap earlier ones wherever the dependencies allow.
+
+        parameters:
+        first_start - str, clock time of the first round 1 heat, e.g. '9:00am'
+        interval - int, minutes between consecutive starts
+        heat_duration - int, minutes from a heat's start until its last runner is expected in
+        processing - int, minutes from a heat pair finishing until the heats it feeds can start
+        capacity - int, most heats on the course at once (None for no limit beyond interval)
+        round_windows - dict, round -> earliest clock time its heats may start, or a
+            (earliest, latest) pair; heats finishing after latest are reported in StartPlan.overruns
+        durations - dict, heat -> its heat_duration, for heats that take longer (e.g. finals)
+        Returns a StartPlan.
+        '''
+        windows = dict((rnd, window if isinstance(window, tuple) else (window, None))
+                       for rnd, window in (round_windows or {}).items())
+        earliest = dict((rnd, parse_clock(start)) for rnd, (start, end) in windows.items())
+        latest = dict((rnd, parse_clock(end)) for rnd, (start, end) in windows.items() if end)
+        durations = dict((heat_code(heat), minutes) for heat, minutes in (durations or {}).items())
+        plan = self._list_schedule(parse_clock(first_start), interval, heat_duration, processing, capacity,
+                                   earliest, durations, heat_base)
+        #the same schedule with no round windows is as fast as the dependencies allow
+        unwindowed = self._list_schedule(parse_clock(first_start), interval, heat_duration, processing, capacity,
+                                         {}, durations, heat_base)
+        plan.min_turnaround = unwindowed.turnaround
+        plan.overruns = dict((heat, format_clock(finish)) for heat, finish in plan.finish.items()
+                             if heat // heat_base in latest and finish > latest[heat // heat_base])
+        return plan
+
+    def _list_schedule(self, first_start, interval, heat_duration, processing, capacity, earliest, durations, heat_base):
+        #one pass over the heats as they become ready: pop the earliest ready heat, give it the first start
+        #that respects interval and capacity, then release any heat whose feeding pairs are now all timed
+        ready = [(max(first_start, earliest.get(heat // heat_base, first_start)), heat)
+                 for heat in self.heats if not self.feeding_pairs.get(heat)]
+        ready.sort()
+        start, finish = {}, {}
+        on_course = []
+        last_start = None
+        while ready:
+            ready_at, heat = heappop(ready)
+            at = ready_at if last_start is None else max(ready_at, last_start + interval)
+            if capacity:
+                while on_course and on_course[0] <= at:
+                    heappop(on_course)
+                if len(on_course) >= capacity:
+                    at = max(at, heappop(on_course))
+            at = int(ceil(at))
+            start[heat] = last_start = at
+            finish[heat] = at + durations.get(heat, heat_duration)
+            heappush(on_course, finish[heat])
+
+            for next_heat in self.next_heats.get(heat, ()):
+                feeders = self.feeding_pairs[next_heat]
+                if not all(feeder in finish for pair in feeders for feeder in pair):
+                    continue
+                pairs_done = max(finish[feeder] for pair in feeders for feeder in pair) + processing
+                heappush(ready, (max(pairs_done, earliest.get(next_heat // heat_base, pairs_done)), next_heat))
+        return StartPlan(start, finish, heat_base)
+
+
+class StartPlan(object):
+
+    '''Start times worked out by HeatSchedule.plan_start_times.
+
+    attributes:
+    start, finish - dict, heat code -> minutes after midnight it starts / is expected to finish
+    rounds - dict, round -> (first start, last finish) in minutes after midnight
+    turnaround - dict, round -> minutes from the round's first start to the next round's first start
+    min_turnaround - dict, the same with no round windows, i.e. the fastest the dependencies allow
+    overruns - dict, heat code -> expected finish, heats running past their round window
+    '''
+
+    def __init__(self, start, finish, heat_base=HEAT_BASE):
+        self.start = start
+        self.finish = finish
+        self.rounds = {}
+        for heat in start:
+            first, last = self.rounds.get(heat // heat_base, (start[heat], finish[heat]))
+            self.rounds[heat // heat_base] = (min(first, start[heat]), max(last, finish[heat]))
+        rounds = sorted(self.rounds)
+        self.turnaround = dict((rnd, self.rounds[nxt][0] - self.rounds[rnd][0]) for rnd, nxt in zip(rounds, rounds[1:]))
+        self.min_turnaround = {}
+        self.overruns = {}
+
+    def start_times(self):
+        ''''Heat ###' -> clock time, the start_times dict the SART class takes.'''
+        return dict((heat_label(heat), format_clock(minutes)) for heat, minutes in self.start.items())
+
+    def report(self):
+        lines = []
+        for rnd in sorted(self.rounds):
+            first, last = self.rounds[rnd]
+            line = 'Round {}: {} to {}'.format(rnd, format_clock(first), format_clock(last))
+            if rnd in self.turnaround:
+                line += ', next round {} min later (at best {} min)'.format(self.turnaround[rnd], self.min_turnaround.get(rnd))
+            lines.append(line)
+        for heat in sorted(self.overruns):
+            lines.append('Warning: {} is expected to finish at {}, after its round window'.format(heat_label(heat), self.overruns[heat]))
+        return '\n'.join(lines)
+
+
+def read_oe_finishers(path, encoding='utf-8'):
+    '''((Surname, First name), heat, seconds) for every row of an OE0012 results export, via the csv module.'''
+    #python 2's csv module reads bytes
+    with (open(path, 'rb') if str is bytes else io.open(path, encoding=encoding, newline='')) as export:
+        rows = list(csv.DictReader(export))
+    return [((row['Surname'], row['First name']), int(row['Entry cl. No']), parse_time(row['Time']))
+            for row in rows if row.get('Surname') and (row.get('Entry cl. No') or '').strip().isdigit()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Look up heats and seed labels of a generated bracket (no pandas needed).')
+    parser.add_argument('bracket_size', type=int)
+    parser.add_argument('heat_size', type=int)
+    parser.add_argument('--n-winners', type=int, default=1)
+    parser.add_argument('--n-fastest', type=int, default=None)
+    parser.add_argument('--heat', type=int, nargs='*', default=[], help='show the seed labels feeding these heats')
+    parser.add_argument('--label', nargs='*', default=[], help="show the heat these seed labels go to, e.g. 12 W101 101/102-Q3")
+    parser.add_argument('--results', help='OE0012 results export of one round: show where each runner goes next')
+    parser.add_argument('--round', type=int, help='round of --results')
+    args = parser.parse_args(argv)
+
+    bracket_format = generate_bracket(args.bracket_size, args.heat_size, args.n_winners, args.n_fastest)
+    slot_table = SlotTable(bracket_format.h_seed_key, bracket_format.heat_base)
+    if not (args.heat or args.label or args.results):
+        for heat in sorted(slot_table.heat_slots):
+            print('{}: {}'.format(heat_label(heat), ', '.join(str(slot_table.label(slot_id)) for slot_id in slot_table.heat_slots[heat])))
+    for heat in args.heat:
+        print('{}: {}'.format(heat_label(heat), ', '.join(str(slot_table.label(slot_id)) for slot_id in slot_table.heat_slots.get(heat, []))))
+    for label in args.label:
+        slot_id = slot_table.slot_id_for_label(label)
+        print('{} -> {}'.format(label, heat_label(slot_table.nxt_heat[slot_id]) if slot_id >= 0 else 'not in this bracket'))
+    if args.results:
+        heat_pairs = [pri_heats for pri_heats, wn_ls_heats in bracket_format.bef_aft_ht_pairs
+                      if pri_heats[0] // bracket_format.heat_base == args.round]
+        assigned, unslotted = advance(slot_table, read_oe_finishers(args.results), heat_pairs)
+        for slot_id, (surname, first_name) in sorted(assigned, key=lambda entry: slot_table.nxt_heat[entry[0]]):
+            print('{} {}: {} -> {}'.format(first_name, surname, slot_table.label(slot_id), heat_label(slot_table.nxt_heat[slot_id])))
+        for label, (surname, first_name) in unslotted:
+            print('Warning: no bracket slot {} for {} {}'.format(label, first_name, surname))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+'''Per-stage timers, counters and optional cProfile capture for the SART class.
+
+Pass an Instrumentation to SART (or SART.from_bracket_format) to switch it on:
+
+    inst = Instrumentation(log_path='NSC2019_instrumentation.jsonl', profile=True, echo=True)
+    sart = SART(r0_seeds, bef_aft_ht_pairs, columns, start_times, instrumentation=inst)
+
+Every instrumented SART method then writes one JSON line when it finishes -
+stage name, wall seconds, the counters it bumped (rows parsed, slots written,
+heat pairs processed, ...) and any fields such as the round - so the file can be
+collected after the event.  Lines are appended as they happen, so a crash keeps
+everything recorded up to that point.  Without an Instrumentation the SART
+methods run against NULL_INSTRUMENTATION, which records nothing.
+'''
+from __future__ import print_function
+import cProfile
+import functools
+import inspect
+import io
+import json
+import pstats
+import time
+from contextlib import contextmanager
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
+
+class Instrumentation(object):
+
+    '''Collect stage timings and counters as JSON line records.
+
+    parameters:
+    log_path - str, file the JSON lines are appended to (None keeps records in memory only)
+    profile - bool, run a cProfile profiler during outermost stages (see print_profile, dump_profile)
+    echo - bool, print a one line timing for every stage as it finishes
+
+    attributes:
+    records - list of dict, every record emitted, in order
+    timers - dict, stage -> [calls, total seconds, max seconds]
+    counters - dict, counter -> total over every stage
+    profiler - cProfile.Profile, or None when profile is off
+    '''
+
+    def __init__(self, log_path=None, profile=False, echo=False):
+        self.log_path = log_path
+        self.echo = echo
+        self.records = []
+        self.timers = {}
+        self.counters = {}
+        self.profiler = cProfile.Profile() if profile else None
+        self._open_stages = []
+
+    def emit(self, record):
+        record = dict(record, time=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        self.records.append(record)
+        if self.log_path is not None:
+            with io.open(self.log_path, 'a', encoding='utf-8') as log:
+                log.write(u'{}\n'.format(json.dumps(record, sort_keys=True)))
+
+    @contextmanager
+    def stage(self, name, **fields):
+        '''Time the enclosed block as stage name; fields are copied into its record.'''
+        counts = {}
+        outermost = not self._open_stages
+        self._open_stages.append(counts)
+        if outermost and self.profiler is not None:
+            self.profiler.enable()
+        start = _clock()
+        try:
+            yield counts
+        finally:
+            seconds = _clock() - start
+            if outermost and self.profiler is not None:
+                self.profiler.disable()
+            self._open_stages.pop()
+
+            calls, total, longest = self.timers.get(name, [0, 0.0, 0.0])
+            self.timers[name] = [calls + 1, total + seconds, max(longest, seconds)]
+            self.emit(dict(fields, event='stage', stage=name, seconds=round(seconds, 6),
+                           depth=len(self._open_stages), counters=counts))
+            if self.echo:
+                print('[{:.3f}s] {}{}'.format(seconds, name, ''.join(' {}={}'.format(key, fields[key]) for key in sorted(fields))))
+
+    def count(self, name, n=1):
+        '''Add n to counter name, for the running total and for every stage currently open.'''
+        n = int(n)
+        self.counters[name] = self.counters.get(name, 0) + n
+        for counts in self._open_stages:
+            counts[name] = counts.get(name, 0) + n
+
+    def summary(self):
+        '''Per-stage calls / total / max seconds and counter totals, slowest stage first.'''
+        stages = [{'stage': name, 'calls': calls, 'seconds': round(total, 6), 'max_seconds': round(longest, 6)}
+                  for name, (calls, total, longest) in self.timers.items()]
+        return {'stages': sorted(stages, key=lambda stage: -stage['seconds']), 'counters': dict(self.counters)}
+
+    def emit_summary(self):
+        self.emit(dict(self.summary(), event='summary'))
+
+    def print_profile(self, sort='cumulative', limit=25):
+        if self.profiler is None:
+            print('Profiling is off - construct Instrumentation with profile=True')
+            return
+        pstats.Stats(self.profiler).sort_stats(sort).print_stats(limit)
+
+    def dump_profile(self, path):
+        '''Write the cProfile data (for snakeviz, pstats, etc).'''
+        self.profiler.dump_stats(path)
+
+
+class NullInstrumentation(object):
+
+    '''Stand-in used when instrumentation is off; every call is a no-op.'''
+
+    @contextmanager
+    def stage(self, name, **fields):
+        yield {}
+
+    def count(self, name, n=1):
+        pass
+
+    def emit(self, record):
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
+
+
+def instrumented(stage=None, **arg_fields):
+    '''Decorate a SART method so each call runs as an instrumentation stage.
+
+    stage defaults to the method name; arg_fields maps record fields to the method
+    argument they come from, e.g. @instrumented(round='rnd').
+    '''
+    def decorate(method):
+        name = stage or method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = self.instrumentation
+            if instrumentation is NULL_INSTRUMENTATION:
+                return method(self, *args, **kwargs)
+            fields = {}
+            if arg_fields:
+                call_args = inspect.getcallargs(method, self, *args, **kwargs)
+                fields = dict((field, call_args[arg]) for field, arg in arg_fields.items())
+            with instrumentation.stage(name, **fields):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,280 @@
+'''Append-only journal of everything fed into a SART bracket during an event.
+
+Every results file ingested and every manual fix - a tie broken by hand, a DNS
+runner added, a mispunch given '59:00', a bracket cell corrected - goes through
+an EventJournal instead of an ad-hoc .loc edit in a notebook cell.  Each one is
+appended to the journal file as a JSON line (flushed to disk before it is
+applied), so the file is an ordered audit trail of the event and can rebuild
+the bracket after a crash:
+
+    journal = EventJournal(sart, 'NSC2019.journal')
+    journal.ingest_time_trial('TT_R0_Results.csv')
+    journal.ingest_results(1, 'R1_Results.csv')
+    journal.correct_result(1, 'Woods', 'Stan', time='0:21:07')    #tie fix
+    journal.add_result(2, 'Devine', 'Kirk', '59:00', 203)         #DNS
+    ...
+    journal = EventJournal.replay('NSC2019.journal', make_sart)   #after a crash
+
+Every snapshot_every entries the journal writes a snapshot (a SART checkpoint
+plus the round results it holds), and replay starts from the latest snapshot,
+so recovery only re-applies the entries since then.  Replay is incremental:
+consecutive entries for the same round are applied to that round's results and
+the round is re-assigned once, not once per entry.  Re-assigning a round from
+its full results is idempotent, so replaying an entry twice does no harm.
+'''
+from __future__ import print_function
+import io
+import json
+import os
+import time
+
+import pandas as pd
+
+from SART_Class_v6 import SART
+from SART_core import write_atomic
+from SART_oe import read_results, read_time_trial
+
+#Status is OK, DNS, DNF, MP, ... (OK when the export had no Classifier column)
+RESULT_COLUMNS = ['Surname', 'First_name', 'Time', 'Heat', 'Status']
+#Status only when the export had a Classifier column
+TIME_TRIAL_COLUMNS = ['Surname', 'First_name', 'Time', 'Status']
+
+
+def _records(df, columns):
+    #dataframe -> list of plain dicts that json can write (numpy ints, NaN -> null)
+    return json.loads(df[columns].to_json(orient='records'))
+
+
+class EventJournal(object):
+
+    '''Log and apply result ingests and corrections for one SART instance.
+
+    parameters:
+    sart - SART instance with its bracket created (prepare_sd_h_keys, create_bracket)
+    path - str, journal file; entries are appended, an existing journal is continued
+    snapshot_every - int, write a snapshot after this many entries (0 or None for never)
+
+    attributes:
+    results - dict, round -> dataframe of that round's results (Surname, First_name, Time, Heat, Status),
+        one row per runner, with every ingest and correction applied; runners missing from it and runners
+        without a valid result are placed by SART.place_non_finishers when the round is re-assigned
+    seq - int, sequence number of the last entry written or applied
+    '''
+
+    def __init__(self, sart, path, snapshot_every=20):
+        self.sart = sart
+        self.path = path
+        self.snapshot_every = snapshot_every
+        self.results = {}
+        self.seq = 0
+        self._dirty_rounds = set()
+        for entry in self.read_entries(path):
+            self.seq = entry['seq']
+
+    @property
+    def snapshot_path(self):
+        #checkpoint of the snapshot taken at the current seq
+        return '{}.snapshot.{}'.format(self.path, self.seq)
+
+    @property
+    def snapshot_meta_path(self):
+        return '{}.snapshot.json'.format(self.path)
+
+    @staticmethod
+    def read_snapshot_meta(path):
+        '''The latest snapshot's meta for journal path - seq, checkpoint file and round results - or None.'''
+        meta_path = '{}.snapshot.json'.format(path)
+        if not os.path.exists(meta_path):
+            return None
+        with io.open(meta_path, encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+        #snapshots written before the checkpoint name was stored in the meta
+        meta.setdefault('checkpoint', '{}.snapshot'.format(os.path.basename(path)))
+        return meta
+
+    @staticmethod
+    def read_entries(path, after_seq=0):
+        '''Journal entries in order; a half-written last line (crash mid-append) is ignored.'''
+        if not os.path.exists(path):
+            return
+        with io.open(path, encoding='utf-8') as journal:
+            for line in journal:
+                if not line.endswith('\n'):
+                    break
+                entry = json.loads(line)
+                if entry['seq'] > after_seq:
+                    yield entry
+
+    def _log(self, op, **fields):
+        self.seq += 1
+        entry = dict(fields, seq=self.seq, op=op, time=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        with io.open(self.path, 'a', encoding='utf-8') as journal:
+            journal.write(u'{}\n'.format(json.dumps(entry, sort_keys=True)))
+            journal.flush()
+            os.fsync(journal.fileno())
+        self._apply(entry)
+        self._flush()
+        if self.snapshot_every and self.seq % self.snapshot_every == 0:
+            self.snapshot()
+        return entry
+
+    #entries
+
+    def ingest_time_trial(self, raw_csv):
+        time_trial_df = read_time_trial(raw_csv)
+        columns = [column for column in TIME_TRIAL_COLUMNS if column in time_trial_df]
+        return self._log('time_trial', source=raw_csv, rows=_records(time_trial_df, columns))
+
+    def ingest_results(self, rnd, raw_csv):
+        '''A round's results export - the whole round or just the heats finished so far.'''
+        results_df = read_results(raw_csv)
+        results_df = results_df[pd.notnull(results_df['Surname']) & pd.notnull(results_df['Heat'])]
+        if 'Status' not in results_df:
+            results_df = results_df.assign(Status='OK')
+        return self._log('results', round=rnd, source=raw_csv, rows=_records(results_df, RESULT_COLUMNS))
+
+    def _find_runner(self, rnd, surname, first_name):
+        results_df = self.results.get(rnd)
+        if results_df is None or not ((results_df['Surname'] == surname) & (results_df['First_name'] == first_name)).any():
+            print('Warning: {} {} has no Round {} result to correct - check data!'.format(first_name, surname, rnd))
+            return False
+        return True
+
+    def correct_result(self, rnd, surname, first_name, time=None, heat=None, status=None, note=None):
+        '''Change a runner's time (tie fix, mispunch '59:00'), heat and/or status, then re-assign the round.'''
+        if not self._find_runner(rnd, surname, first_name):
+            return None
+        changes = dict((column, value) for column, value in (('Time', time), ('Heat', heat), ('Status', status))
+                       if value is not None)
+        return self._log('correct_result', round=rnd, surname=surname, first_name=first_name, changes=changes, note=note)
+
+    def add_result(self, rnd, surname, first_name, time, heat, note=None):
+        '''Add a runner missing from the results export (e.g. a DNS given a placeholder time).'''
+        row = {'Surname': surname, 'First_name': first_name, 'Time': time, 'Heat': int(heat), 'Status': 'OK'}
+        return self._log('results', round=rnd, source=None, rows=[row], note=note)
+
+    def drop_result(self, rnd, surname, first_name, note=None):
+        if not self._find_runner(rnd, surname, first_name):
+            return None
+        return self._log('drop_result', round=rnd, surname=surname, first_name=first_name, note=note)
+
+    def correct_bracket(self, seed, note=None, **values):
+        '''Set bracket_df columns for one seed label directly, e.g. correct_bracket('W101', Time='0:15:53').
+
+        A label that isn't a slot of this bracket, or a column bracket_df doesn't have, is reported and not
+        journalled: applied, it would add a row (or column) to bracket_df, and every replay would repeat it.
+        '''
+        slot_id = self.sart.slot_table.slot_id_for_label(seed)
+        unknown_columns = sorted(set(values) - set(self.sart.bracket_df.columns))
+        if slot_id < 0:
+            print('Warning: {!r} is not a seed label in this bracket, correction not made - check data!'.format(seed))
+            return None
+        if unknown_columns:
+            print('Warning: bracket_df has no {} column, correction not made - check data!'.format(', '.join(unknown_columns)))
+            return None
+        #the bracket's own label, so '12' is logged as seed 12
+        return self._log('correct_bracket', seed=self.sart.slot_table.label(slot_id), values=values, note=note)
+
+    #applying entries
+
+    def _apply(self, entry):
+        op = entry['op']
+        if op in ('results', 'correct_result', 'drop_result'):
+            rnd = entry['round']
+            if self._dirty_rounds - set([rnd]):
+                self._flush()
+            self._apply_to_round(rnd, entry)
+            self._dirty_rounds.add(rnd)
+            return
+
+        self._flush()
+        if op == 'time_trial':
+            rows = entry['rows']
+            has_status = bool(rows) and 'Status' in rows[0]
+            self.sart._seed_time_trial(pd.DataFrame(rows, columns=TIME_TRIAL_COLUMNS[:4 if has_status else 3]))
+            self.sart.add_time_trial_results()
+        elif op == 'correct_bracket':
+            seed = entry['seed']
+            #seed labels for round 0 are ints; json keeps them as ints
+            for column, value in entry['values'].items():
+                self.sart.bracket_df.loc[seed, column] = value
+            #keeps runner_index (and any display boards listening) in step with the hand edit
+            self.sart._slots_written([self.sart.slot_table.slot_id_for_label(seed)])
+        else:
+            raise ValueError('unknown journal entry {!r} (seq {})'.format(op, entry['seq']))
+
+    def _apply_to_round(self, rnd, entry):
+        results_df = self.results.get(rnd, pd.DataFrame(columns=RESULT_COLUMNS))
+        op = entry['op']
+        if op == 'results':
+            #a runner runs one heat per round - a re-export or later row replaces the earlier one
+            new_rows = pd.DataFrame(entry['rows'], columns=RESULT_COLUMNS)
+            results_df = pd.concat([results_df, new_rows]).drop_duplicates(['Surname', 'First_name'], keep='last')
+        else:
+            runner = (results_df['Surname'] == entry['surname']) & (results_df['First_name'] == entry['first_name'])
+            if op == 'drop_result':
+                results_df = results_df[~runner]
+            else:
+                for column, value in entry['changes'].items():
+                    results_df.loc[runner, column] = value
+        results_df = results_df.reset_index(drop=True)
+        results_df['Heat'] = results_df['Heat'].astype(int)
+        results_df['Status'] = results_df['Status'].fillna('OK')
+        self.results[rnd] = results_df
+
+    def _flush(self):
+        #re-assign every round touched since the last flush, from its full results (with DNS and MP runners
+        #placed, as SART_service does, so a replay assigns the round as it was assigned live)
+        for rnd in sorted(self._dirty_rounds):
+            self.sart.nxt_ht_assigns(self.sart.place_non_finishers(self.results[rnd], rnd), rnd)
+        self._dirty_rounds.clear()
+
+    #snapshots and replay
+
+    def snapshot(self):
+        '''Checkpoint the SART instance and the round results, so replay can start from here.
+
+        The checkpoint is written under a name stamped with the seq, then the meta naming it is renamed
+        into place; until that rename the previous meta and its checkpoint stand, so a crash part way
+        through never pairs a checkpoint with another snapshot's seq or results.  The previous checkpoint
+        is removed once the new meta is in place.
+        '''
+        self._flush()
+        previous = self.read_snapshot_meta(self.path)
+        self.sart.save_checkpoint(self.snapshot_path)
+        meta = {'seq': self.seq, 'checkpoint': os.path.basename(self.snapshot_path),
+                'results': dict((str(rnd), _records(results_df, RESULT_COLUMNS))
+                                for rnd, results_df in self.results.items())}
+        write_atomic(self.snapshot_meta_path, u'{}'.format(json.dumps(meta)))
+        if previous is not None and previous['checkpoint'] != meta['checkpoint']:
+            previous_path = os.path.join(os.path.dirname(self.path), previous['checkpoint'])
+            if os.path.exists(previous_path):
+                os.remove(previous_path)
+
+    @classmethod
+    def replay(cls, path, sart_factory, use_snapshot=True, snapshot_every=20):
+        '''Rebuild the SART instance from a journal and return a journal ready to keep appending to.
+
+        sart_factory - callable returning a fresh SART with its bracket created; only called when there is
+            no snapshot to start from (or use_snapshot is False)
+        '''
+        meta = cls.read_snapshot_meta(path) if use_snapshot else None
+        if meta is not None:
+            sart = SART.load_checkpoint(os.path.join(os.path.dirname(path), meta['checkpoint']))
+        else:
+            meta = {'seq': 0, 'results': {}}
+            sart = sart_factory()
+
+        journal = cls(sart, path, snapshot_every)
+        journal.seq = meta['seq']
+        for rnd, rows in meta['results'].items():
+            journal.results[int(rnd)] = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+        n_applied = 0
+        for entry in cls.read_entries(path, after_seq=meta['seq']):
+            journal._apply(entry)
+            journal.seq = entry['seq']
+            n_applied += 1
+        journal._flush()
+        print('Replayed {} journal entries after snapshot seq {}; journal now at seq {}'.format(n_applied, meta['seq'], journal.seq))
+        return journal
@@ -0,0 +1,151 @@
+'''Readers for SportsSoftware OE CSV exports (OE0001 registration, OE0012 results).
+
+The exports carry around 60 columns, of which the SART class needs a handful.
+read_results and read_time_trial parse only those columns, with fixed dtypes:
+names and the time as the text SportsSoftware printed, the heat as an integer.
+Where the export has a Classifier column, read_results and read_time_trial also
+give each runner's Status (OK, DNS, DNF, MP, DSQ, OT); a code outside those is
+reported and kept as 'Classifier <code>', so the runner is placed as a
+non-finisher, not a finisher.
+
+Names stay plain strings and times stay text because the frames get hand edited
+in the notebooks (tie fixes, mispunch times, DNS rows) before they are used: a
+categorical would refuse a name it hasn't seen, and seconds parsed at read time
+would go stale when Time is edited.  The SART class parses times when it ranks
+(time_to_seconds).
+
+read_splits takes the same export with split times switched on, where each
+runner's row ends in Control1, Punch1, Control2, Punch2, ... (control code and
+elapsed time at that control, in course order), and returns one row per runner
+per control, for breaking tied times (see SART._split_tiebreak).
+
+The registration master is re-read for every round's import file, so
+read_registration keeps the parsed frame in memory keyed on the file's path,
+size and modification time.  Re-reading an unchanged file is a dict hit and a
+copy; editing the file (or clear_cache) forces a fresh parse.
+'''
+from __future__ import print_function
+import os
+import re
+
+from SART_core import LazyModule
+
+#imported on first use, so importing the SART class doesn't load pandas
+np = LazyModule('numpy')
+pd = LazyModule('pandas')
+
+#export column -> SART column
+RESULTS_COLUMNS = {'Surname': 'Surname', 'First name': 'First_name', 'Time': 'Time', 'Entry cl. No': 'Heat'}
+TIME_TRIAL_COLUMNS = {'Surname': 'Surname', 'First name': 'First_name', 'Time': 'Time'}
+#read when the export has them
+STATUS_COLUMNS = {'Classifier': 'Status'}
+
+#SportsSoftware classifier codes
+CLASSIFIER_STATUS = {'0': 'OK', '1': 'DNS', '2': 'DNF', '3': 'MP', '4': 'DSQ', '5': 'OT'}
+
+_DTYPES = {'Surname': str, 'First name': str, 'Time': str}
+
+_registration_cache = {}
+
+#Control1/Punch1 ... (or Control/Punch, Control.1/Punch.1 ... when the export repeats the header names)
+_SPLIT_COLUMN = re.compile(r'^(Control|Punch)(\d+|\.\d+)?$')
+
+
+def time_to_seconds(times):
+    '''Parse SportsSoftware times ('0:10:26', '10:26', '0:10:26.5', '59:00') into float seconds in one pass;
+    anything that doesn't parse (blank, 'mp', etc) comes back as NaN.'''
+    times = pd.Series(times).astype(str).str.strip()
+    n_colons = times.str.count(':')
+    times = pd.Series(np.where(n_colons == 1, '0:' + times, np.where(n_colons == 0, '0:0:' + times, times)), index=times.index)
+    hms = times.str.split(':', expand=True).reindex(columns=range(3)).apply(pd.to_numeric, errors='coerce')
+    return hms[0] * 3600 + hms[1] * 60 + hms[2]
+
+
+def read_oe_columns(path, columns, encoding=None, optional=None):
+    '''Read only the given export columns, renamed per columns (export name -> SART name), plus any
+    optional columns (same form) the export has.
+
+    index_col=False keeps the columns lined up when rows end in a trailing comma.'''
+    dtypes = dict((column, dtype) for column, dtype in _DTYPES.items() if column in columns)
+    if not optional:
+        df = pd.read_csv(path, usecols=list(columns.keys()), dtype=dtypes, index_col=False, encoding=encoding)
+        return df.rename(columns=columns)[list(columns.values())]
+
+    dtypes.update((column, str) for column in optional)
+    wanted = set(columns) | set(optional)
+    df = pd.read_csv(path, usecols=lambda column: column in wanted, dtype=dtypes, index_col=False, encoding=encoding)
+    missing = set(columns) - set(df.columns)
+    if missing:
+        raise ValueError('{} has no {} column'.format(path, ', '.join(sorted(missing))))
+    renames = dict(columns, **optional)
+    return df.rename(columns=renames)[[renames[column] for column in list(columns) + list(optional) if column in df.columns]]
+
+
+def _heat_as_int(heat):
+    #integer heat codes; a results file with a blank heat keeps NaN (float) so the gap is visible
+    heat = pd.to_numeric(heat, errors='coerce')
+    return heat.astype(int) if heat.notnull().all() else heat
+
+
+def read_results(path, encoding=None):
+    '''Surname, First_name, Time, Heat and Status (if the export has a Classifier) from an OE0012 results export.'''
+    df = read_oe_columns(path, RESULTS_COLUMNS, encoding, optional=STATUS_COLUMNS)
+    df['Heat'] = _heat_as_int(df['Heat'])
+    #path can be an open file (SART_stream reads the new rows of a growing export from memory)
+    return _classifier_status(df, getattr(path, 'name', path))
+
+
+def read_time_trial(path, encoding=None):
+    '''Surname, First_name, Time and Status (if the export has a Classifier) from the time trial results export.'''
+    return _classifier_status(read_oe_columns(path, TIME_TRIAL_COLUMNS, encoding, optional=STATUS_COLUMNS), path)
+
+
+def _classifier_status(df, path):
+    #Classifier codes -> OK, DNS, ...; a code we don't know is kept (so the runner is flagged, not taken as
+    #a finisher) and reported
+    if 'Status' not in df:
+        return df
+    codes = df['Status'].str.strip()
+    df['Status'] = codes.map(CLASSIFIER_STATUS)
+    unknown = df['Status'].isnull() & codes.notnull() & (codes != '')
+    if unknown.any():
+        df.loc[unknown, 'Status'] = 'Classifier ' + codes[unknown]
+        print('Warning: unknown Classifier code(s) {} in {} for {} - check data!'.format(
+            ', '.join(sorted(codes[unknown].unique())), path,
+            ', '.join('{} {}'.format(first, last) for first, last in df.loc[unknown, ['First_name', 'Surname']].values)))
+    return df
+
+
+def read_splits(path, encoding=None):
+    '''Surname, First_name, Leg (1 for the first control), Control and Split (elapsed seconds at the
+    control) from a results export with split times, one row per runner per control punched.'''
+    keep = set(TIME_TRIAL_COLUMNS) - set(['Time'])
+    df = pd.read_csv(path, usecols=lambda column: column in keep or _SPLIT_COLUMN.match(column) is not None,
+                     dtype=str, index_col=False, encoding=encoding)
+    controls = [column for column in df.columns if column.startswith('Control')]
+    punches = [column for column in df.columns if column.startswith('Punch')]
+    legs = pd.concat([pd.DataFrame({'Surname': df['Surname'], 'First_name': df['First name'], 'Leg': leg,
+                                    'Control': df[control].str.strip(), 'Split': time_to_seconds(df[punch])})
+                      for leg, (control, punch) in enumerate(zip(controls, punches), 1)], ignore_index=True)
+    legs = legs[legs['Control'].notnull() & (legs['Control'] != '')]
+    return legs[['Surname', 'First_name', 'Leg', 'Control', 'Split']].reset_index(drop=True)
+
+
+def read_registration(path, encoding=None, use_cache=True):
+    '''The whole OE0001 registration master (every column, as it is written back out as the import file).
+    Returns a copy, so callers can change it freely without touching the cached frame.'''
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime, encoding)
+    if not use_cache or key not in _registration_cache:
+        df = pd.read_csv(path, memory_map=True, encoding=encoding)
+        if not use_cache:
+            return df
+        #drop stale entries for an older version of the same file
+        for old_key in [old_key for old_key in _registration_cache if old_key[0] == key[0]]:
+            del _registration_cache[old_key]
+        _registration_cache[key] = df
+    return _registration_cache[key].copy()
+
+
+def clear_cache():
+    _registration_cache.clear()
@@ -0,0 +1,277 @@
+'''Push bracket changes to the display boards as they happen (Server-Sent Events, Python 3).
+
+Instead of printing R*_heat_assigns.txt after each round and copying it onto
+the notice boards by hand, any number of screens on the local network open
+
+    GET /events      text/event-stream of bracket changes
+    GET /            a bare heat board page that listens to /events
+
+and every time add_time_trial_results or nxt_ht_assigns (or assign_ready_pairs)
+fills bracket slots, each connected board gets one "slots" event holding just
+the slots written - seed label, heat, start time, name and time - not the whole
+bracket_df.  A board that connects (or reconnects) first gets a "snapshot"
+event of every filled slot, so it never needs more than the deltas after that.
+
+The publisher hangs off the SART instance's slot_listeners, so it sees writes
+however they are made (notebook cell, SART_service POST, EventJournal replay).
+The changed rows are read in the writing thread, straight after the write, and
+handed to the asyncio loop, which fans them out to one queue per board; a board
+that falls too far behind is dropped and gets a fresh snapshot on reconnect.
+
+From a notebook, next to the SART instance already there:
+
+    publisher = BracketPublisher(sart19).start(port=8020)
+
+or together with the SART_service HTTP service on a checkpoint, so results
+posted to the service reach the boards:
+
+    python SART_publish.py NSC2019.checkpoint --port 8020 --service-port 8019
+'''
+import argparse
+import asyncio
+import json
+import threading
+
+from SART_Class_v6 import SART
+from SART_core import LazyModule
+from SART_service import _plain, serve
+
+pd = LazyModule('pandas')
+
+_BOARD_PAGE = u'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>SART heats</title>
+<style>body{font-family:sans-serif}div.heat{display:inline-block;vertical-align:top;margin:0 2em 1em 0}
+td{padding:0 .5em}</style></head>
+<body><div id="heats"></div>
+<script>
+var slots = {};
+function cell(row, text) {
+  //names arrive as typed into the results exports: set as text, never parsed as markup
+  row.insertCell().textContent = text;
+}
+function render() {
+  var heats = {};
+  Object.keys(slots).forEach(function (seed) {
+    var slot = slots[seed];
+    (heats[slot.heat] = heats[slot.heat] || []).push(slot);
+  });
+  var board = document.getElementById('heats');
+  board.textContent = '';
+  Object.keys(heats).sort().forEach(function (heat) {
+    var div = board.appendChild(document.createElement('div'));
+    div.className = 'heat';
+    div.appendChild(document.createElement('h3')).textContent = heat + ' ' + (heats[heat][0].start_time || '');
+    var table = div.appendChild(document.createElement('table'));
+    heats[heat].forEach(function (slot) {
+      var row = table.insertRow();
+      cell(row, slot.first_name + ' ' + slot.surname);
+      cell(row, slot.time || '');
+    });
+  });
+}
+var events = new EventSource('/events');
+events.addEventListener('snapshot', function (e) { slots = {}; JSON.parse(e.data).slots.forEach(function (slot) { slots[slot.seed] = slot; }); render(); });
+events.addEventListener('slots', function (e) { JSON.parse(e.data).slots.forEach(function (slot) { slots[slot.seed] = slot; }); render(); });
+</script></body></html>
+'''
+
+
+def slot_records(sart, slot_ids):
+    '''One dict per slot id - seed label, round, next heat, its start time, runner and time - read
+    straight from bracket_df by row position.'''
+    rows = sart.bracket_df.iloc[sart.slot_rows[list(slot_ids)]]
+    return [{'seed': _plain(label), 'round': _plain(rnd), 'heat': heat, 'start_time': _plain(start),
+             'surname': _plain(surname), 'first_name': _plain(first_name), 'time': _plain(time)}
+            for label, rnd, heat, start, surname, first_name, time in zip(
+                rows.index, rows['Round'], rows['Nxt_Heat'], rows['Nxt_Heat_Time'], rows['Surname'],
+                rows['First_name'], rows['Time'])]
+
+
+def _event(name, seq, body):
+    return u'id: {}\nevent: {}\ndata: {}\n\n'.format(seq, name, json.dumps(body, sort_keys=True)).encode('utf-8')
+
+
+class BracketPublisher(object):
+
+    '''Fan bracket slot writes out to connected display boards over Server-Sent Events.
+
+    parameters:
+    sart - SART instance with its bracket created; the publisher adds itself to sart.slot_listeners
+    queue_size - int, events a board may fall behind by before it is dropped
+    keepalive - float, seconds between comment lines on an idle stream (keeps proxies / wifi from timing out)
+
+    attributes:
+    seq - int, id of the last event published
+    boards - int, boards connected right now
+    '''
+
+    def __init__(self, sart, queue_size=100, keepalive=15.0):
+        self.sart = sart
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self.seq = 0
+        self.loop = None
+        self._queues = set()
+        self._clients = set()
+        self._server = None
+        self._thread = None
+        sart.slot_listeners.append(self._slots_written)
+
+    @property
+    def boards(self):
+        return len(self._queues)
+
+    def close(self):
+        '''Stop listening to the bracket and, if start() started the server, shut it down: the boards'
+        connections are closed, the server stops and its loop is stopped and closed.'''
+        if self._slots_written in self.sart.slot_listeners:
+            self.sart.slot_listeners.remove(self._slots_written)
+        if self._thread is not None and self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    async def _shutdown(self):
+        #stop accepting, end every board's stream, then wait for the server to finish closing
+        self._server.close()
+        clients = list(self._clients)
+        for task in clients:
+            task.cancel()
+        await asyncio.gather(*clients, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def _slots_written(self, slot_ids):
+        #runs in the thread that wrote the bracket, so the rows read here are exactly what was written
+        if self.loop is None or not slot_ids:
+            return
+        records = slot_records(self.sart, slot_ids)
+        self.loop.call_soon_threadsafe(self._publish, records)
+
+    def _publish(self, records):
+        self.seq += 1
+        event = _event('slots', self.seq, {'slots': records})
+        for queue in list(self._queues):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                #too far behind - end its stream, the board reconnects and gets a snapshot
+                self._queues.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def _snapshot(self):
+        bracket_df = self.sart.bracket_df
+        row_of_slot = dict((row, slot_id) for slot_id, row in enumerate(self.sart.slot_rows))
+        filled = [row_of_slot[row] for row in pd.notnull(bracket_df['Surname']).values.nonzero()[0]]
+        return _event('snapshot', self.seq, {'slots': slot_records(self.sart, filled)})
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._clients.add(task)
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            parts = request.decode('latin-1').split()
+            path = parts[1].split('?')[0] if len(parts) > 1 else ''
+            if path == '/':
+                page = _BOARD_PAGE.encode('utf-8')
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\nContent-Length: ' +
+                             str(len(page)).encode('ascii') + b'\r\nConnection: close\r\n\r\n' + page)
+            elif path == '/events':
+                await self._stream(writer)
+            else:
+                writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            #_shutdown ending the connection - the handler is the whole task, so just finish
+            pass
+        finally:
+            self._clients.discard(task)
+            writer.close()
+
+    async def _stream(self, writer):
+        queue = asyncio.Queue(self.queue_size)
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                     b'Connection: keep-alive\r\n\r\n')
+        #the snapshot is taken in the loop, so no delta published after it can be missed or repeated
+        writer.write(self._snapshot())
+        self._queues.add(queue)
+        try:
+            while True:
+                await writer.drain()
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    event = b': keepalive\n\n'
+                if event is None:
+                    return
+                writer.write(event)
+        finally:
+            self._queues.discard(queue)
+
+    async def serve(self, host='127.0.0.1', port=8020):
+        '''Serve the boards on host:port from the running asyncio loop until cancelled.'''
+        self.loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, host, port)
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self._shutdown()
+
+    def start(self, host='127.0.0.1', port=8020):
+        '''Run serve() on its own loop in a daemon thread (e.g. from a notebook); returns self, close() stops it.'''
+        started = threading.Event()
+        errors = []
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                self._server = self.loop.run_until_complete(asyncio.start_server(self._handle, host, port))
+            except Exception as error:
+                errors.append(error)
+                return
+            finally:
+                started.set()
+            try:
+                self.loop.run_forever()
+            finally:
+                self.loop.close()
+
+        self._thread = threading.Thread(target=run)
+        self._thread.daemon = True
+        self._thread.start()
+        started.wait()
+        if errors:
+            self._thread = None
+            raise errors[0]
+        return self
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Push SART bracket changes to display boards over Server-Sent Events.')
+    parser.add_argument('checkpoint', help='checkpoint written by SART.save_checkpoint')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8020, help='port the boards connect to')
+    parser.add_argument('--service-port', type=int, default=None,
+                        help='also run SART_service on this port (results posted there are pushed to the boards)')
+    args = parser.parse_args(argv)
+
+    sart = SART.load_checkpoint(args.checkpoint)
+    publisher = BracketPublisher(sart)
+    if args.service_port is not None:
+        serve(sart, args.host, args.service_port, checkpoint_path=args.checkpoint, background=True)
+    print('Publishing the bracket on http://{}:{}/'.format(args.host, args.port))
+    try:
+        asyncio.run(publisher.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+'''Local HTTP service around one SART instance, so everyone at the event can query it.
+
+Instead of the tournament living in one notebook kernel that only the person at
+that keyboard can ask, the bracket is loaded once into a long running process
+and served on localhost.  The start chief, results desk and announcer all talk
+to the same state:
+
+    GET  /runner?surname=Woods&first_name=Stan    where a runner goes next (heat, start time, times so far)
+    GET  /heat/204                                 roster of Heat 204
+    GET  /status                                   rounds / heat pairs processed so far
+    POST /results     {"round": 2, "path": "R2_Results.csv"}          ingest a round's results export
+    POST /time_trial  {"path": "TT_R0_Results.csv"}                    ingest the time trial
+
+A results POST runs the same steps as the notebook cells (clean_results_csv,
+place_non_finishers, nxt_ht_assigns; "splits" breaks ties as in nxt_ht_assigns)
+and returns what they printed.  Queries share a read lock and run side by side;
+an ingest takes the write lock, so no query ever sees a half-assigned round.
+Lookups are answered from dicts rebuilt from SART.runner_index after each
+ingest, not by scanning bracket_df.
+
+Start it on a checkpoint written by SART.save_checkpoint (each ingest saves the
+checkpoint again, so the service can be restarted where it left off):
+
+    python SART_service.py NSC2019.checkpoint --port 8019
+
+or from a notebook, on the SART instance already there:
+
+    server = serve(sart19, background=True)
+'''
+from __future__ import print_function
+import argparse
+import json
+import sys
+import threading
+from contextlib import contextmanager
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+from SART_Class_v6 import SART
+from SART_core import heat_label
+
+
+class ReadWriteLock(object):
+
+    '''Many readers at once, or one writer; a waiting writer goes ahead of new readers.'''
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+class _PrintLog(object):
+
+    #collects what the SART methods print during an ingest, to send back to the client
+    def __init__(self):
+        self.parts = []
+
+    def write(self, text):
+        self.parts.append(text if isinstance(text, type(u'')) else text.decode('utf-8', 'replace'))
+
+    def flush(self):
+        pass
+
+    def lines(self):
+        return [line for line in u''.join(self.parts).splitlines() if line.strip()]
+
+
+def _plain(value):
+    #numpy scalars / NaN -> json-able python values
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if hasattr(value, 'item'):
+        return _plain(value.item())
+    return value
+
+
+def _runner_key(surname, first_name):
+    return (u'{}'.format(surname).strip().lower(), u'{}'.format(first_name).strip().lower())
+
+
+class BracketService(object):
+
+    '''Thread safe queries and ingests against one SART instance.
+
+    parameters:
+    sart - SART instance with its bracket created
+    checkpoint_path - str, save_checkpoint here after every ingest (None to not save)
+
+    attributes:
+    lock - ReadWriteLock guarding sart
+    runners - dict, (surname, first name) lower cased -> where that runner is, see runner()
+    '''
+
+    def __init__(self, sart, checkpoint_path=None):
+        self.sart = sart
+        self.checkpoint_path = checkpoint_path
+        self.lock = ReadWriteLock()
+        self.runners = {}
+        self._refresh()
+
+    def _refresh(self):
+        #case insensitive lookups over the SART instance's runner_index (kept up to date on every slot write)
+        slot_table = self.sart.slot_table
+        runners = {}
+        for record in self.sart.runner_index.runners.values():
+            runners[_runner_key(record.surname, record.first_name)] = {
+                'surname': record.surname, 'first_name': record.first_name,
+                'seed': _plain(slot_table.label(record.slots[record.round])), 'round': record.round + 1,
+                'next_heat': heat_label(record.heat), 'start_time': _plain(record.start_time),
+                'times': dict((str(rnd), _plain(time)) for rnd, time in record.times.items())}
+        self.runners = runners
+
+    def runner(self, surname, first_name=None):
+        '''Next heat, start time, bracket slot and times so far (by round, 0 is the time trial) for a runner;
+        with no first name, every runner with that surname.'''
+        with self.lock.read():
+            if first_name is not None:
+                entry = self.runners.get(_runner_key(surname, first_name))
+                return {'runners': [entry] if entry else []}
+            surname = _runner_key(surname, '')[0]
+            return {'runners': [entry for key, entry in self.runners.items() if key[0] == surname]}
+
+    def heat(self, heat):
+        '''Runners assigned to a heat so far, from the slot table (no bracket_df scan).'''
+        with self.lock.read():
+            slot_ids = self.sart.slot_table.heat_slots.get(heat, [])
+            rows = self.sart.bracket_df.iloc[self.sart.slot_rows[slot_ids]]
+            roster = [{'seed': _plain(label), 'surname': _plain(surname), 'first_name': _plain(first_name),
+                       'time': _plain(time)}
+                      for label, surname, first_name, time in zip(rows.index, rows['Surname'], rows['First_name'], rows['Time'])]
+            start = _plain(rows['Nxt_Heat_Time'].iloc[0]) if len(rows) else None
+            return {'heat': heat_label(heat), 'start_time': start, 'slots': len(slot_ids), 'runners': roster}
+
+    def status(self):
+        with self.lock.read():
+            schedule = self.sart.schedule
+            return {'seeded': schedule.seeded, 'heat_pairs_processed': len(schedule.processed),
+                    'heat_pairs': len(schedule.pairs), 'runners_placed': len(self.runners),
+                    'startable_heats': [heat_label(heat) for heat in schedule.startable_heats()]}
+
+    @contextmanager
+    def _ingest(self):
+        #write lock, capture what the SART methods print, then refresh lookups and checkpoint
+        log = _PrintLog()
+        with self.lock.write():
+            stdout = sys.stdout
+            sys.stdout = log
+            try:
+                yield log
+            finally:
+                sys.stdout = stdout
+            self._refresh()
+            if self.checkpoint_path is not None:
+                self.sart.save_checkpoint(self.checkpoint_path)
+
+    def ingest_time_trial(self, path, splits=None):
+        with self._ingest() as log:
+            self.sart.process_time_trial_results(path, splits)
+            self.sart.add_time_trial_results()
+        return {'seeded': self.sart.schedule.seeded, 'messages': log.lines()}
+
+    def ingest_results(self, rnd, path, splits=None):
+        with self._ingest() as log:
+            processed = len(self.sart.schedule.processed)
+            results_df = self.sart.clean_results_csv(path)
+            results_df = self.sart.place_non_finishers(results_df, rnd)
+            self.sart.nxt_ht_assigns(results_df, rnd, splits=splits)
+        return {'round': rnd, 'heat_pairs_processed': len(self.sart.schedule.processed) - processed,
+                'messages': log.lines()}
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    service = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body, sort_keys=True, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, handle):
+        try:
+            status, body = handle()
+        except (KeyError, ValueError, IOError, OSError) as error:
+            status, body = 400, {'error': '{}: {}'.format(type(error).__name__, error)}
+        except Exception as error:
+            status, body = 500, {'error': '{}: {}'.format(type(error).__name__, error)}
+        self._reply(status, body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict((key, values[-1]) for key, values in parse_qs(url.query).items())
+        parts = [part for part in url.path.split('/') if part]
+
+        def handle():
+            if parts == ['runner']:
+                return 200, self.service.runner(query['surname'], query.get('first_name'))
+            if len(parts) == 2 and parts[0] == 'heat':
+                return 200, self.service.heat(int(parts[1]))
+            if parts == ['status']:
+                return 200, self.service.status()
+            return 404, {'error': 'unknown path {}'.format(url.path)}
+        self._route(handle)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        url = urlparse(self.path)
+
+        def handle():
+            request = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+            if url.path == '/results':
+                return 200, self.service.ingest_results(int(request['round']), request['path'], request.get('splits'))
+            if url.path == '/time_trial':
+                return 200, self.service.ingest_time_trial(request['path'], request.get('splits'))
+            return 404, {'error': 'unknown path {}'.format(url.path)}
+        self._route(handle)
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(sart, host='127.0.0.1', port=8019, checkpoint_path=None, background=False):
+    '''Serve sart over HTTP on host:port (localhost only by default).
+
+    background - run the server in a daemon thread and return it (call server.shutdown() to stop),
+        e.g. from a notebook; otherwise serve until interrupted.
+    '''
+    class Handler(_Handler):
+        service = BracketService(sart, checkpoint_path)
+
+    server = _ThreadingServer((host, port), Handler)
+    if background:
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return server
+    print('Serving the bracket on http://{}:{}/'.format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a SART bracket to the event desks over local HTTP.')
+    parser.add_argument('checkpoint', help='checkpoint written by SART.save_checkpoint; re-saved after every ingest')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8019)
+    args = parser.parse_args(argv)
+    serve(SART.load_checkpoint(args.checkpoint), args.host, args.port, checkpoint_path=args.checkpoint)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+'''Heat sheets for a round - text, HTML and CSV - written in one pass over the bracket.
+
+The start chief's and event director's copies, the sheets posted on the notice
+boards and a CSV for anything else all come from one call:
+
+    write_heat_sheets(sart19, 2, ['02-Woodland2/R2_heat_assigns.txt', '02-Woodland2/R2_heat_assigns_ED.txt',
+                                  '02-Woodland2/R2_heat_assigns.html', '02-Woodland2/R2_heat_assigns.csv'])
+
+The format of each file comes from its extension.  The round's rows are taken
+from the bracket once (SART.round_heat_sheets, every heat the round has, however
+many), and each heat is handed to every writer in turn, so adding another copy
+or format doesn't mean another pass over bracket_df.  Text files read exactly as
+the notebooks' print(*sart.print_heat_assigns(rnd), sep='\\n', file=...) did.
+
+SART.export_round goes one step further and writes everything a round needs -
+heat sheets, the SportsSoftware import file and a bracket snapshot - with
+write_files: each file is written next to its final name and renamed into
+place, on a small thread pool, so a half-written file is never picked up.
+'''
+import io
+import os
+from multiprocessing.pool import ThreadPool
+
+from SART_core import heat_label, write_atomic
+
+
+def _text(value):
+    #python 2 frames print as bytes
+    text = '{}'.format(value)
+    return text if isinstance(text, type(u'')) else text.decode('utf-8')
+
+
+class TextSheetWriter(object):
+
+    '''Each heat as its label and the printed frame, as the notebooks' heat assigns text files.'''
+
+    def __init__(self, out):
+        self.out = out
+
+    def start(self, rnd):
+        pass
+
+    def heat(self, heat, start_time, rows):
+        self.out.write(u'{}\n\n\n{}\n\n\n'.format(heat_label(heat), _text(rows)))
+
+    def close(self):
+        pass
+
+
+class HtmlSheetWriter(object):
+
+    '''One page, a heading and a table per heat, for posting or showing on a screen.'''
+
+    def __init__(self, out):
+        self.out = out
+
+    def start(self, rnd):
+        self.out.write(u'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Round {} heats</title>\n'
+                       u'<style>body{{font-family:sans-serif}} table{{border-collapse:collapse;margin-bottom:1em}} '
+                       u'td,th{{border:1px solid #999;padding:2px 8px}}</style></head>\n<body>\n'
+                       u'<h1>Round {} heats</h1>\n'.format(rnd, rnd))
+
+    def heat(self, heat, start_time, rows):
+        start = u' - {}'.format(_text(start_time)) if start_time is not None else u''
+        self.out.write(u'<h2>{}{}</h2>\n{}\n'.format(heat_label(heat), start,
+                                                      _text(rows[['First_name', 'Surname']].to_html(na_rep=''))))
+
+    def close(self):
+        self.out.write(u'</body></html>\n')
+
+
+class CsvSheetWriter(object):
+
+    '''One row per runner: Heat, Start, Seed, First_name, Surname.'''
+
+    def __init__(self, out):
+        self.out = out
+        self.header = True
+
+    def start(self, rnd):
+        pass
+
+    def heat(self, heat, start_time, rows):
+        sheet = rows[['First_name', 'Surname']].reset_index()
+        sheet.insert(0, 'Start', start_time)
+        sheet.insert(0, 'Heat', heat)
+        self.out.write(_text(sheet.to_csv(index=False, header=self.header)))
+        self.header = False
+
+    def close(self):
+        pass
+
+
+SHEET_WRITERS = {'.txt': TextSheetWriter, '.html': HtmlSheetWriter, '.htm': HtmlSheetWriter, '.csv': CsvSheetWriter}
+
+
+def sheet_writer(path):
+    '''Writer class for a file name, from its extension.'''
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in SHEET_WRITERS:
+        raise ValueError('no heat sheet format for {} (use one of {})'.format(path, ', '.join(sorted(SHEET_WRITERS))))
+    return SHEET_WRITERS[extension]
+
+
+def render_heat_sheets(sart, rnd, writers):
+    '''Feed every heat of round rnd to each writer (opened file objects wrapped by the writer classes above).
+
+    Each writer is started with the round, given every heat in turn and closed.'''
+    for writer in writers:
+        writer.start(rnd)
+    n_heats = 0
+    for heat, start_time, rows in sart.round_heat_sheets(rnd):
+        for writer in writers:
+            writer.heat(heat, start_time, rows)
+        n_heats += 1
+    for writer in writers:
+        writer.close()
+    return n_heats
+
+
+def write_heat_sheets(sart, rnd, paths):
+    '''Write round rnd's heat sheets to every path (.txt, .html or .csv) in one pass; returns the number of heats.'''
+    writer_classes = [sheet_writer(path) for path in paths]
+    files = [io.open(path, 'w', encoding='utf-8') for path in paths]
+    try:
+        return render_heat_sheets(sart, rnd, [writer_class(out) for writer_class, out in zip(writer_classes, files)])
+    finally:
+        for out in files:
+            out.close()
+
+
+def heat_sheet_texts(sart, rnd, names):
+    '''Round rnd's heat sheets, rendered in one pass, as {name: text} (format from each name's extension).'''
+    buffers = [io.StringIO() for name in names]
+    render_heat_sheets(sart, rnd, [sheet_writer(name)(out) for name, out in zip(names, buffers)])
+    return dict((name, out.getvalue()) for name, out in zip(names, buffers))
+
+
+def write_files(contents, workers=4):
+    '''Write {path: text} concurrently on a thread pool, each file atomically; returns the paths written.'''
+    pool = ThreadPool(max(1, min(workers, len(contents))))
+    try:
+        return pool.map(lambda item: write_atomic(item[0], _text(item[1])), sorted(contents.items()))
+    finally:
+        pool.close()
+        pool.join()
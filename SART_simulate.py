@@ -0,0 +1,326 @@
+'''Monte Carlo simulation of whole tournaments over a bracket topology.
+
+Compiles a bracket (a SART instance, a SlotTable or an h_seed_key) into index
+arrays once, then runs many simulated tournaments at a time as NumPy array
+operations: every runner gets a true ability, every race adds noise, and each
+round's heats are ranked and their winners / qualifiers moved into the next
+round's slots for all simulations at once.  Chunks of simulations are spread
+over worker processes.  The point is to compare seeding tables and advancement
+rules before committing to a format, e.g.
+
+    python SART_simulate.py 74 5 --rules 1+3 1+4 0+5 --n-sims 200000
+
+or from a notebook, for the format actually being run:
+
+    sart19.prepare_sd_h_keys()
+    simulate(sart19, n_sims=1000000)
+
+Reported fairness metrics: how often the true top k all reach the top final
+heat, each true rank's chance of reaching it, how often the best runner places
+first overall, and the Spearman correlation / mean displacement between true
+rank and final placing.  Final placing is top final heat first, then by time
+within each final heat (the combined time scoring of the bottom heats is not
+modelled).
+'''
+from __future__ import print_function
+import argparse
+import multiprocessing
+
+import numpy as np
+
+from SART_core import (BracketFormat, SlotTable, HEAT_BASE, SEED, WINNER, PAIR_QUALIFIER, HEAT_QUALIFIER,
+                       generate_bracket)
+
+
+class AbilityModel(object):
+
+    '''How runners' true abilities and race times are drawn.
+
+    parameters:
+    mean, sd - float, spread of true ability (base race time in seconds) across the field
+    noise - float, sigma of the lognormal race-to-race variation (0.05 is roughly +/-5%)
+    blunder_rate - float, chance per race of a big mistake (mispunch, wrong turn)
+    blunder_cost - float, a blunder adds this fraction of the runner's base time
+    '''
+
+    def __init__(self, mean=1200.0, sd=180.0, noise=0.05, blunder_rate=0.02, blunder_cost=0.3):
+        self.mean = mean
+        self.sd = sd
+        self.noise = noise
+        self.blunder_rate = blunder_rate
+        self.blunder_cost = blunder_cost
+
+    def draw_abilities(self, rng, n_sims, n_runners):
+        return np.maximum(rng.normal(self.mean, self.sd, (n_sims, n_runners)), self.mean * 0.1)
+
+    def race(self, rng, base_times):
+        times = base_times * np.exp(rng.normal(0.0, self.noise, base_times.shape))
+        if self.blunder_rate:
+            times *= 1 + self.blunder_cost * (rng.random_sample(base_times.shape) < self.blunder_rate)
+        return times
+
+
+class _RoundPlan(object):
+
+    #index arrays for one round: which slots hold each heat's runners, and which slots its results fill
+
+    def __init__(self, heats, heat_inputs, winner_out, winner_heat, pairs, pair_out, pair_idx, pair_rank,
+                 single_out, single_heat, single_rank):
+        self.heats = heats
+        self.heat_inputs = heat_inputs
+        self.winner_out = winner_out
+        self.winner_heat = winner_heat
+        self.winner_taken = np.zeros(len(heats), dtype=bool)
+        self.winner_taken[winner_heat] = True
+        self.pairs = pairs
+        self.pair_out = pair_out
+        self.pair_idx = pair_idx
+        self.pair_rank = pair_rank
+        self.single_out = single_out
+        self.single_heat = single_heat
+        self.single_rank = single_rank
+
+
+class CompiledBracket(object):
+
+    '''A bracket topology as index arrays, ready for simulate.
+
+    parameters:
+    slot_table - SlotTable (see SART_core), e.g. sart.slot_table after prepare_sd_h_keys
+
+    attributes:
+    n_runners - int, number of round 0 seeds
+    n_slots - int, number of bracket slots; slot n_slots is an always-empty padding slot
+    seed_slots, seed_ranks - array, round 0 slots and the seed that fills each
+    rounds - list of _RoundPlan, one per round in order
+    final_order - array, positions in rounds[-1].heats of the last round's heats, top final first
+    final_heats - list of int, heat codes of the last round, top final first
+    '''
+
+    def __init__(self, slot_table):
+        kind = np.array(slot_table.kind, dtype=np.int8)
+        heat1 = np.array(slot_table.heat1, dtype=np.int64)
+        heat2 = np.array(slot_table.heat2, dtype=np.int64)
+        rank = np.array(slot_table.rank, dtype=np.int64)
+        base = slot_table.heat_base
+        self.n_slots = len(slot_table)
+
+        is_seed = kind == SEED
+        self.seed_slots = np.nonzero(is_seed)[0]
+        self.seed_ranks = rank[is_seed]
+        self.n_runners = int(self.seed_ranks.max())
+
+        self.rounds = []
+        heats_by_round = {}
+        for heat in slot_table.heat_slots:
+            heats_by_round.setdefault(heat // base, []).append(heat)
+        for rnd in sorted(heats_by_round):
+            heats = sorted(heats_by_round[rnd])
+            heat_pos = dict((heat, i) for i, heat in enumerate(heats))
+            width = max(len(slot_table.heat_slots[heat]) for heat in heats)
+            heat_inputs = np.full((len(heats), width), self.n_slots, dtype=np.int64)
+            for i, heat in enumerate(heats):
+                heat_inputs[i, :len(slot_table.heat_slots[heat])] = slot_table.heat_slots[heat]
+
+            from_round = (~is_seed) & (heat1 // base == rnd)
+            winner = np.nonzero(from_round & (kind == WINNER))[0]
+            pair = np.nonzero(from_round & (kind == PAIR_QUALIFIER))[0]
+            single = np.nonzero(from_round & (kind == HEAT_QUALIFIER))[0]
+            pairs = sorted(set(zip(heat1[pair].tolist(), heat2[pair].tolist())))
+            pair_pos = dict((heat_pair, i) for i, heat_pair in enumerate(pairs))
+            self.rounds.append(_RoundPlan(
+                heats, heat_inputs,
+                winner, np.array([heat_pos[heat] for heat in heat1[winner]], dtype=np.int64),
+                np.array([(heat_pos[ht1], heat_pos[ht2]) for ht1, ht2 in pairs], dtype=np.int64).reshape(-1, 2),
+                pair, np.array([pair_pos[heat_pair] for heat_pair in zip(heat1[pair].tolist(), heat2[pair].tolist())], dtype=np.int64),
+                rank[pair] - 1,
+                single, np.array([heat_pos[heat] for heat in heat1[single]], dtype=np.int64), rank[single] - 1))
+
+        #which final heat is the top one depends on how the bracket numbers its heats (501 in generated
+        #brackets, 516 in 2019's), so find out by running the bracket with every race going to seed
+        self.final_order = np.arange(len(self.rounds[-1].heats))
+        seeds = np.arange(self.n_runners)[None, :]
+        seed_finish = _run_rounds(self, self.seed_occupants(1, seeds), lambda runners: runners.astype(float))
+        self.final_order = np.argsort(seed_finish[0, :, 0], kind='mergesort')
+        self.final_heats = [self.rounds[-1].heats[i] for i in self.final_order]
+
+    def seed_occupants(self, n_sims, seeded):
+        '''Slot occupancy (sims x slots + 1) after round 0; seeded[s, i] is the runner with seed i + 1.'''
+        occupant = np.full((n_sims, self.n_slots + 1), self.n_runners, dtype=np.int64)
+        has_runner = self.seed_ranks <= seeded.shape[1]
+        occupant[:, self.seed_slots[has_runner]] = seeded[:, self.seed_ranks[has_runner] - 1]
+        return occupant
+
+    @classmethod
+    def from_bracket(cls, bracket, heat_base=HEAT_BASE):
+        '''Compile a SART instance (after prepare_sd_h_keys), SlotTable, CompiledBracket, BracketFormat or
+        h_seed_key dict (whose heat codes are round * heat_base + heat number).'''
+        if isinstance(bracket, cls):
+            return bracket
+        if isinstance(bracket, BracketFormat):
+            return cls(SlotTable(bracket.h_seed_key, bracket.heat_base))
+        if isinstance(bracket, SlotTable):
+            return cls(bracket)
+        if getattr(bracket, 'slot_table', None) is not None:
+            return cls(bracket.slot_table)
+        if isinstance(bracket, dict):
+            return cls(SlotTable(bracket, heat_base))
+        raise TypeError('cannot compile a bracket from {!r} - call prepare_sd_h_keys first?'.format(bracket))
+
+
+def _gather(values, index):
+    #values[s, index[s, ...]] for every simulation s
+    rows = np.arange(values.shape[0]).reshape((-1,) + (1,) * (index.ndim - 1))
+    return values[rows, index]
+
+
+def _pad(array, width, fill):
+    #widen the last axis so every qualifier rank the bracket asks for exists (extra places are empty)
+    if array.shape[-1] >= width:
+        return array
+    padding = np.full(array.shape[:-1] + (width - array.shape[-1],), fill, dtype=array.dtype)
+    return np.concatenate([array, padding], axis=-1)
+
+
+def _run_rounds(compiled, occupant, race):
+    #race every round in order, moving winners / qualifiers into their slots; returns the last round's
+    #finishing order (sims x final heats x places, top final first)
+    empty = compiled.n_runners
+    n_sims = occupant.shape[0]
+    for plan in compiled.rounds:
+        runners = occupant[:, plan.heat_inputs]                                       #sims x heats x places
+        times = race(runners)
+        order = np.argsort(times, axis=2)
+        finish = np.take_along_axis(runners, order, axis=2)
+        times = np.take_along_axis(times, order, axis=2)
+
+        occupant[:, plan.winner_out] = finish[:, plan.winner_heat, 0]
+        if len(plan.single_out):
+            singles = _pad(finish, plan.single_rank.max() + 1, empty)
+            occupant[:, plan.single_out] = singles[:, plan.single_heat, plan.single_rank]
+        if len(plan.pair_out):
+            #both heats' runners ranked on time, less the heat winners that already went through
+            #(and less the second copy when a "pair" is one heat, as for a nine person heat)
+            taken = np.zeros((len(plan.heats), finish.shape[2]), dtype=bool)
+            taken[:, 0] = plan.winner_taken
+            pair_runners = np.concatenate([finish[:, plan.pairs[:, 0]], finish[:, plan.pairs[:, 1]]], axis=2)
+            pair_times = np.concatenate([times[:, plan.pairs[:, 0]], times[:, plan.pairs[:, 1]]], axis=2)
+            pair_taken = np.concatenate([taken[plan.pairs[:, 0]],
+                                         taken[plan.pairs[:, 1]] | (plan.pairs[:, :1] == plan.pairs[:, 1:])], axis=1)
+            pair_times = np.where(pair_taken, np.inf, pair_times)
+            pair_runners = np.where(pair_taken, empty, pair_runners)
+            pair_order = np.argsort(pair_times, axis=2, kind='mergesort')
+            pair_runners = _pad(np.take_along_axis(pair_runners, pair_order, axis=2), plan.pair_rank.max() + 1, empty)
+            occupant[:, plan.pair_out] = pair_runners[:, plan.pair_idx, plan.pair_rank]
+    return finish[:, compiled.final_order]
+
+
+def _simulate_chunk(args):
+    compiled, n_sims, seed, model, top_k = args
+    rng = np.random.RandomState(seed)
+    n_runners = compiled.n_runners
+    sims = np.arange(n_sims)[:, None]
+
+    ability = model.draw_abilities(rng, n_sims, n_runners)
+    true_rank = np.argsort(np.argsort(ability, axis=1), axis=1)
+    #runner id n_runners is an empty place; inf ability always ranks it last
+    ability = np.concatenate([ability, np.full((n_sims, 1), np.inf)], axis=1)
+
+    with np.errstate(invalid='ignore'):
+        seeded = np.argsort(model.race(rng, ability[:, :n_runners]), axis=1)
+        finish = _run_rounds(compiled, compiled.seed_occupants(n_sims, seeded),
+                             lambda runners: model.race(rng, _gather(ability, runners)))
+
+    #final placing: top final heat first, then by time within each final heat
+    final_order = finish.reshape(n_sims, -1)
+    place = np.full((n_sims, n_runners + 1), final_order.shape[1], dtype=np.int64)
+    place[sims, final_order] = np.arange(final_order.shape[1])
+    place = place[:, :n_runners]
+    #runners the bracket dropped along the way (if any) are placed behind everyone, by true rank
+    final_rank = np.argsort(np.argsort(place * (n_runners + 1) + true_rank, axis=1), axis=1)
+
+    in_top_final = np.zeros((n_sims, n_runners + 1), dtype=bool)
+    in_top_final[sims, finish[:, 0, :]] = True
+    by_true_rank = _gather(in_top_final[:, :n_runners], np.argsort(true_rank, axis=1))      #column i = true rank i + 1
+
+    displacement = final_rank - true_rank
+    spearman = 1 - 6.0 * (displacement ** 2).sum(axis=1) / (n_runners * (n_runners ** 2 - 1))
+    return {'n_sims': n_sims,
+            'top_k_all_in_final': dict((k, int(by_true_rank[:, :k].all(axis=1).sum())) for k in top_k),
+            'top_k_share_in_final': dict((k, float(by_true_rank[:, :k].mean(axis=1).sum())) for k in top_k),
+            'final_by_true_rank': by_true_rank.sum(axis=0),
+            'best_wins': int((final_rank[np.arange(n_sims), np.argmin(true_rank, axis=1)] == 0).sum()),
+            'spearman': float(spearman.sum()),
+            'displacement': float(np.abs(displacement).mean(axis=1).sum())}
+
+
+def simulate(bracket, n_sims=100000, model=None, top_k=(1, 3, 5), chunk_size=20000, workers=None, seed=0,
+             heat_base=HEAT_BASE):
+    '''Simulate n_sims tournaments over bracket and return fairness metrics.
+
+    parameters:
+    bracket - SART instance (after prepare_sd_h_keys), SlotTable, CompiledBracket, BracketFormat or h_seed_key dict
+    model - AbilityModel (default AbilityModel())
+    top_k - ks for the "true top k all reach the top final heat" metrics
+    chunk_size - simulations per NumPy batch; each batch is one task for the worker pool
+    workers - processes to spread batches over (default: one per core; 1 runs in this process)
+    seed - int, base random seed; batch i uses seed + i, so results are reproducible
+    heat_base - int, heat code base of an h_seed_key dict bracket (the other kinds carry their own)
+
+    Returns a dict: n_sims, p_top_k_all_in_final and mean_top_k_share_in_final (k -> probability),
+    p_final_by_true_rank (list, true rank 1 first), p_best_wins, mean_spearman, mean_displacement.
+    '''
+    compiled = CompiledBracket.from_bracket(bracket, heat_base)
+    model = model or AbilityModel()
+    top_k = [k for k in top_k if k <= compiled.n_runners]
+    chunks = [(compiled, min(chunk_size, n_sims - start), seed + i, model, top_k)
+              for i, start in enumerate(range(0, n_sims, chunk_size))]
+
+    workers = min(workers or multiprocessing.cpu_count(), len(chunks))
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            parts = pool.map(_simulate_chunk, chunks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        parts = [_simulate_chunk(chunk) for chunk in chunks]
+
+    total = float(sum(part['n_sims'] for part in parts))
+    return {'n_sims': int(total),
+            'p_top_k_all_in_final': dict((k, sum(part['top_k_all_in_final'][k] for part in parts) / total) for k in top_k),
+            'mean_top_k_share_in_final': dict((k, sum(part['top_k_share_in_final'][k] for part in parts) / total) for k in top_k),
+            'p_final_by_true_rank': (sum(part['final_by_true_rank'] for part in parts) / total).tolist(),
+            'p_best_wins': sum(part['best_wins'] for part in parts) / total,
+            'mean_spearman': sum(part['spearman'] for part in parts) / total,
+            'mean_displacement': sum(part['displacement'] for part in parts) / total}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare advancement rules by simulating tournaments.')
+    parser.add_argument('bracket_size', type=int)
+    parser.add_argument('heat_size', type=int)
+    parser.add_argument('--rules', nargs='*', default=None,
+                        help="advancement rules as winners+fastest, e.g. 1+3 (heat winners plus 3 fastest); default 1+(heat_size-2)")
+    parser.add_argument('--n-sims', type=int, default=100000)
+    parser.add_argument('--noise', type=float, default=0.05)
+    parser.add_argument('--blunder-rate', type=float, default=0.02)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    model = AbilityModel(noise=args.noise, blunder_rate=args.blunder_rate)
+    rules = args.rules or ['1+{}'.format(args.heat_size - 2)]
+    for rule in rules:
+        n_winners, n_fastest = [int(part) for part in rule.split('+')]
+        bracket_format = generate_bracket(args.bracket_size, args.heat_size, n_winners, n_fastest)
+        report = simulate(bracket_format, args.n_sims, model, workers=args.workers, seed=args.seed)
+        print('{} winners+fastest {}: P(best wins) {:.3f}, Spearman {:.3f}, mean displacement {:.2f}'.format(
+            args.bracket_size, rule, report['p_best_wins'], report['mean_spearman'], report['mean_displacement']))
+        print('    P(true top k all in top final): {}'.format(', '.join(
+            'k={} {:.3f}'.format(k, p) for k, p in sorted(report['p_top_k_all_in_final'].items()))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+from __future__ import print_function
+import io
+import os
+import time
+import pandas as pd
+from SART_core import heat_label
+from SART_oe import RESULTS_COLUMNS, read_results
+
+
+class ResultsStream(object):
+
+    '''Feed a round's results into a SART bracket while the round is still running.
+
+    Instead of waiting for the whole round's R*_Results.csv, point this at the
+    SportsSoftware results export as it grows (source is a file), or at a folder
+    that results exports get dropped into (source is a directory).  Each poll
+    only parses what is new: rows appended to the file since the last poll, or
+    files that have appeared in the folder.  As soon as both heats of a pair in
+    bef_aft_ht_pairs have all their runners in, that pair's winners and
+    qualifiers are written to the bracket, and any next round heat whose slots
+    are now all filled is reported as ready to go to the start chief.
+
+    Rows are read with SART_oe.read_results, so a runner's Classifier comes
+    through as Status, and mispunched (or DNF, ...) runners are placed after
+    the finishers of their heat by SART.place_non_finishers, as are runners
+    missing from a heat marked complete.  A heat counts as complete once it has
+    a row for every bracket slot feeding it; use mark_heat_complete for heats
+    with a DNS.
+
+    If a heat pair has tied times nothing is written for it; poll reports the
+    pairs in tied_pairs, and run stops so the ties can be fixed in the export
+    (a rewritten export is picked up from the start on the next poll).
+
+    parameters:
+    sart - SART instance with its bracket created
+    rnd - int, round whose results are coming in
+    source - str, path to a growing results export or to a drop folder
+    encoding - str, encoding of the export files
+
+    attributes:
+    results_df - dataframe, every result row read so far, as read_results gives them
+    done_pairs - set, first heat of each heat pair written to the bracket
+    ready_heats - list, next round heats filled so far, in the order they filled
+    tied_pairs - list, (heat1, heat2) of the heat pairs the last poll couldn't write because of ties
+    '''
+
+    def __init__(self, sart, rnd, source, encoding='utf-8'):
+        self.sart = sart
+        self.rnd = rnd
+        self.source = source
+        self.encoding = encoding
+        self.results_df = pd.DataFrame(columns=list(RESULTS_COLUMNS.values()))
+        self.done_pairs = set()
+        self.ready_heats = []
+        self.tied_pairs = []
+        self._round_pairs = sart._round_heat_pairs(rnd)
+        self._feeds = self._next_heats_fed(sart.slot_table)
+        self._complete_overrides = set()
+        self._header = None
+        self._offset = 0
+        self._partial = b''
+        #inode, modification time and the last bytes read, to tell an export rewritten from one appended to
+        self._inode = None
+        self._mtime = None
+        self._tail = b''
+        self._restarted = False
+        self._seen_files = set()
+
+    def _next_heats_fed(self, table):
+        #heat -> next round heats its runners can land in, from one pass over the slot table
+        feeds = {}
+        for heat1, heat2, nxt_heat in zip(table.heat1, table.heat2, table.nxt_heat):
+            for heat in (heat1, heat2):
+                if heat:
+                    feeds.setdefault(heat, set()).add(nxt_heat)
+        return feeds
+
+    def _read(self, export):
+        df = read_results(export, encoding=self.encoding)
+        return df[pd.notnull(df['Surname']) & pd.notnull(df['Heat'])]
+
+    def _rewritten(self, export, stat):
+        #SportsSoftware writes the export over again (new file, or truncated and rewritten) rather than
+        #appending when results are corrected: a new inode, a shorter file, a change with nothing appended,
+        #or different bytes where the last read ended
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            return True
+        if stat.st_size == self._offset:
+            return stat.st_mtime != self._mtime
+        export.seek(self._offset - len(self._tail))
+        return export.read(len(self._tail)) != self._tail
+
+    def _read_file_tail(self):
+        #read whatever was appended since the last poll; a trailing half-written line waits for the next poll
+        with io.open(self.source, 'rb') as export:
+            stat = os.fstat(export.fileno())
+            if self._inode is not None and self._rewritten(export, stat):
+                #start over; the rows read from the whole export replace results_df
+                self._offset, self._partial, self._tail, self._header, self._restarted = 0, b'', b'', None, True
+            self._inode, self._mtime = stat.st_ino, stat.st_mtime
+            export.seek(self._offset)
+            new_bytes = export.read()
+            self._offset = export.tell()
+        if new_bytes:
+            self._tail = (self._tail + new_bytes)[-64:]
+        chunk = self._partial + new_bytes
+
+        complete, _, self._partial = chunk.rpartition(b'\n')
+        if not complete:
+            self._partial = chunk
+            return None
+        if self._header is None:
+            self._header, _, complete = complete.partition(b'\n')
+        if not complete.strip():
+            return None
+        #the header line goes in front of the new rows, so they are read exactly as a whole export would be
+        rows = io.BytesIO(self._header + b'\n' + complete)
+        rows.name = self.source
+        return self._read(rows)
+
+    def _read_new_files(self):
+        new_files = sorted(name for name in os.listdir(self.source)
+                           if name.lower().endswith('.csv') and name not in self._seen_files)
+        frames = []
+        for name in new_files:
+            self._seen_files.add(name)
+            frames.append(self._read(os.path.join(self.source, name)))
+        return pd.concat(frames, sort=False) if frames else None
+
+    def _read_new_rows(self):
+        if os.path.isdir(self.source):
+            return self._read_new_files()
+        return self._read_file_tail()
+
+    def _heat_count(self, heat):
+        return (self.results_df['Heat'] == heat).sum()
+
+    def heat_complete(self, heat):
+        expected = len(self.sart.slot_table.heat_slots.get(heat, []))
+        return heat in self._complete_overrides or (expected > 0 and self._heat_count(heat) >= expected)
+
+    def mark_heat_complete(self, heat):
+        '''Treat a heat as finished even though it is short of runners (DNS).'''
+        self._complete_overrides.add(heat)
+
+    def poll(self):
+        '''Read new results and process every heat pair that became complete or got new rows.
+        Returns the next round heats that became ready on this poll.'''
+        with self.sart.instrumentation.stage('stream_poll', round=self.rnd):
+            return self._poll()
+
+    def _poll(self):
+        new_rows = self._read_new_rows()
+        changed_heats = set()
+        if self._restarted:
+            #every heat read before the rewrite may have changed (or gone) in it
+            changed_heats = set(self.results_df['Heat'])
+            self.results_df = self.results_df.iloc[:0]
+            self._restarted = False
+        if new_rows is not None and len(new_rows) > 0:
+            self.sart.instrumentation.count('rows_parsed', len(new_rows))
+            new_rows = new_rows.assign(Heat=new_rows['Heat'].astype(int))
+            changed_heats.update(new_rows['Heat'])
+            self.results_df = pd.concat([self.results_df, new_rows], sort=False).drop_duplicates(
+                ['Surname', 'First_name', 'Heat'], keep='last').reset_index(drop=True)
+
+        to_process = [(ht1, ht2, single_heat) for ht1, ht2, single_heat in self._round_pairs
+                      if (ht1 not in self.done_pairs or ht1 in changed_heats or ht2 in changed_heats)
+                      and self.heat_complete(ht1) and (single_heat or self.heat_complete(ht2))]
+        if not to_process:
+            return []
+
+        print('Processing Heat Pairs {} as they finished'.format(', '.join('{},{}'.format(ht1, ht2) for ht1, ht2, single_heat in to_process)))
+        #pair by pair, so a tie in one heat pair doesn't hold back the others
+        written, self.tied_pairs = [], []
+        for ht1, ht2, single_heat in to_process:
+            results_df = self.sart.place_non_finishers(self.results_df, self.rnd, [ht1, ht2])
+            if self.sart._assign_heat_pairs(results_df, [(ht1, ht2, single_heat)], ['Surname', 'First_name', 'Time']):
+                written.append((ht1, ht2))
+            else:
+                self.tied_pairs.append((ht1, ht2))
+                self.done_pairs.discard(ht1)
+        self.done_pairs.update(ht1 for ht1, ht2 in written)
+
+        fed_heats = set()
+        for ht1, ht2 in written:
+            fed_heats.update(self._feeds.get(ht1, ()))
+            fed_heats.update(self._feeds.get(ht2, ()))
+        newly_ready = [heat_label(heat) for heat in sorted(fed_heats)
+                       if heat_label(heat) not in self.ready_heats and self.sart._heat_is_filled(heat)]
+        self.ready_heats.extend(newly_ready)
+        return newly_ready
+
+    def all_pairs_done(self):
+        return all(ht1 in self.done_pairs for ht1, ht2, single_heat in self._round_pairs)
+
+    def run(self, interval=5, on_ready=None):
+        '''Poll every interval seconds until every heat pair of the round is in the bracket.
+        on_ready, if given, is called with the list of next round heats each time some become ready.
+
+        Stops early if a heat pair has tied times - fix them in the export and call run again, which
+        carries on from where it stopped.  Returns True once the round is done, False if stopped on ties.'''
+        while not self.all_pairs_done():
+            newly_ready = self.poll()
+            if newly_ready:
+                print('Ready for the start chief: {}'.format(', '.join(newly_ready)))
+                if on_ready is not None:
+                    on_ready(newly_ready)
+            if self.tied_pairs:
+                print('Stopped: ties in Heat Pair(s) {} - fix the results and run again'.format(
+                    ', '.join('{},{}'.format(ht1, ht2) for ht1, ht2 in self.tied_pairs)))
+                return False
+            if not self.all_pairs_done():
+                time.sleep(interval)
+        return True
@@ -0,0 +1,397 @@
+import pickle
+
+import pandas as pd
+import pytest
+
+from SART_Class_v6 import SART
+
+COLUMNS = ['Round', 'Nxt_Heat', 'First_name', 'Surname', 'Time', 'Nxt_Heat_Time']
+START_TIMES = {'Heat 101': '9:00am', 'Heat 102': '9:03am', 'Heat 201': '10:00am', 'Heat 202': '10:03am'}
+
+
+def seeded_sart(tmp_path):
+    #10 runners, R01 fastest in the time trial: Heat 101 gets seeds 1, 4, 5, 8, 9 and Heat 102 the rest
+    sart = SART.from_bracket_format(10, 5, COLUMNS, START_TIMES)
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    time_trial = tmp_path / 'TT_R0_Results.csv'
+    pd.DataFrame({'Surname': ['R{:02d}'.format(seed) for seed in range(1, 11)], 'First name': 'F',
+                  'Time': ['0:10:{:02d}'.format(seed) for seed in range(1, 11)]}).to_csv(str(time_trial), index=False)
+    sart.process_time_trial_results(str(time_trial))
+    sart.add_time_trial_results()
+    return sart
+
+
+def round_1_results(tmp_path, times, name='R1_Results.csv'):
+    #times - surname -> time; heats as seeded by seeded_sart
+    heat = dict(('R{:02d}'.format(seed), 101 if seed in (1, 4, 5, 8, 9) else 102) for seed in range(1, 11))
+    path = tmp_path / name
+    pd.DataFrame({'Surname': list(times), 'First name': 'F', 'Time': list(times.values()),
+                  'Entry cl. No': [heat[surname] for surname in times]}).to_csv(str(path), index=False)
+    return str(path)
+
+
+def runner_in(sart, label):
+    return sart.bracket_df.loc[label, 'Surname']
+
+
+def write_splits(tmp_path, splits):
+    #splits - surname -> [(control, punch), ...] in course order
+    n_legs = max(len(punches) for punches in splits.values())
+    rows = []
+    for surname, punches in splits.items():
+        row = {'Surname': surname, 'First name': 'F', 'Time': ''}
+        for leg, (control, punch) in enumerate(punches, 1):
+            row['Control{}'.format(leg)] = control
+            row['Punch{}'.format(leg)] = punch
+        rows.append(row)
+    columns = ['Surname', 'First name', 'Time'] + [
+        '{}{}'.format(name, leg) for leg in range(1, n_legs + 1) for name in ('Control', 'Punch')]
+    path = tmp_path / 'R1_Splits.csv'
+    pd.DataFrame(rows, columns=columns).to_csv(str(path), index=False)
+    return str(path)
+
+
+ROUND_1_TIMES = {'R01': '0:20:01', 'R02': '0:20:02', 'R04': '0:20:30', 'R03': '0:20:30', 'R05': '0:20:40',
+                 'R06': '0:20:41', 'R07': '0:20:42', 'R08': '0:20:43', 'R09': '0:20:44', 'R10': '0:20:45'}
+
+
+def test_tied_times_are_broken_on_the_last_common_control(tmp_path):
+    sart = seeded_sart(tmp_path)
+    results = sart.clean_results_csv(round_1_results(tmp_path, ROUND_1_TIMES))
+    #R04 and R03 tie for the first qualifying place; R03 was faster at control 32, the last one both punched
+    #(R04's extra control 99 is not common to both, so it doesn't count)
+    splits = write_splits(tmp_path, {'R04': [('31', '5:00'), ('32', '15:00'), ('99', '19:00')],
+                                     'R03': [('31', '5:10'), ('32', '14:50')]})
+    sart.nxt_ht_assigns(results, 1, splits=splits)
+    assert runner_in(sart, '101/102-Q1') == 'R03'
+    assert runner_in(sart, '101/102-Q2') == 'R04'
+    assert runner_in(sart, 'W101') == 'R01' and runner_in(sart, 'W102') == 'R02'
+
+
+def test_ties_without_splits_or_with_equal_splits_stay_tied(tmp_path, capsys):
+    sart = seeded_sart(tmp_path)
+    results = sart.clean_results_csv(round_1_results(tmp_path, ROUND_1_TIMES))
+    sart.nxt_ht_assigns(results, 1)
+    assert 'Ties exist in Heat Pair 101,102' in capsys.readouterr().out
+    assert sart.bracket_df.loc['101/102-Q1':'W102', 'Surname'].isnull().all()
+
+    splits = write_splits(tmp_path, {'R04': [('31', '5:00'), ('32', '15:00')],
+                                     'R03': [('31', '5:00'), ('32', '15:00')]})
+    sart.nxt_ht_assigns(results, 1, splits=splits)
+    assert 'Ties exist in Heat Pair 101,102' in capsys.readouterr().out
+    assert pd.isnull(runner_in(sart, '101/102-Q1'))
+
+
+def test_split_tiebreak_orders_each_tie_group_on_its_own(tmp_path):
+    sart = seeded_sart(tmp_path)
+    runners = pd.DataFrame({'Surname': ['A', 'B', 'C', 'D', 'E'], 'First_name': 'F',
+                            'Seconds': [600.0, 600.0, 600.0, 600.0, 610.0], 'Pair1': [101, 101, 103, 103, 101]})
+    splits = pd.DataFrame({'Surname': ['A', 'A', 'B', 'B', 'C', 'D'], 'First_name': 'F', 'Leg': [1, 2, 1, 2, 1, 1],
+                           'Control': ['31', '32', '31', '32', '31', '31'],
+                           'Split': [100.0, 320.0, 90.0, 310.0, 200.0, 190.0]})
+    tiebreak = sart._split_tiebreak(runners, splits, ['Pair1'])
+    assert list(tiebreak) == [1, 0, 1, 0, 0]
+
+
+def test_create_bracket_has_one_row_per_slot():
+    sart = SART.from_bracket_format(74, 5, COLUMNS, {'Heat 101': '11:15am', 'Heat 408': '9:21am'})
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    bracket_df = sart.bracket_df
+    assert list(bracket_df.columns) == COLUMNS
+    assert sorted(map(str, bracket_df.index)) == sorted(map(str, sart.slot_table.labels()))
+    assert len(bracket_df) == 370
+    #every round 0 to 4 seats the whole field; the round is the round the slot is filled in
+    assert bracket_df['Round'].value_counts().sort_index().tolist() == [74] * 5
+    for heat, labels in sart.bracket_format.h_seed_key.items():
+        assert (bracket_df.loc[labels, 'Nxt_Heat'] == heat).all()
+    #the underfilled 2 runner Heat 408 is fed by two slots, both with its start time
+    assert bracket_df.loc[bracket_df['Nxt_Heat'] == 'Heat 408', 'Nxt_Heat_Time'].tolist() == ['9:21am'] * 2
+    assert bracket_df.loc[1, 'Nxt_Heat_Time'] == '11:15am'
+    assert bracket_df.loc['W101', 'Round'] == 1 and pd.isnull(bracket_df.loc['W101', 'Nxt_Heat_Time'])
+    #slot_rows points each slot id at its row
+    assert list(bracket_df.index[sart.slot_rows]) == sart.slot_table.labels()
+
+
+def test_create_bracket_with_four_digit_heats():
+    sart = SART.from_bracket_format(1000, 5, COLUMNS, {})
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    assert sart.heat_base == 1000
+    assert sart.bracket_df.loc[1, 'Nxt_Heat'] == 'Heat 1001'
+    assert sart.bracket_df.loc['W1001', 'Round'] == 1
+    assert (sart.bracket_df['Round'].value_counts() == 1000).all()
+
+
+def test_runner_index_follows_every_write(tmp_path):
+    sart = seeded_sart(tmp_path)
+    record = sart.runner_index.get('R04', 'F')
+    assert (record.round, record.heat, record.start_time) == (0, 101, '9:00am')
+    assert record.slots == {0: sart.slot_table.slot_id_for_label(4)}
+
+    times = dict(ROUND_1_TIMES, R03='0:20:29')
+    sart.nxt_ht_assigns(sart.clean_results_csv(round_1_results(tmp_path, times)), 1)
+    record = sart.runner_index.get('R03', 'F')
+    assert (record.round, record.heat, record.start_time) == (1, 201, '10:00am')
+    assert record.times == {0: '0:10:03', 1: '0:20:29'}
+    assert sart.runner_index.get('R10', 'F').heat == 202
+
+    #the round is re-run with a corrected result: R10 now qualifies first and R03 drops to the next slot
+    times['R10'] = '0:20:10'
+    sart.nxt_ht_assigns(sart.clean_results_csv(round_1_results(tmp_path, times, 'R1_Results_fixed.csv')), 1)
+    assert sart.runner_index.get('R10', 'F').slots[1] == sart.slot_table.slot_id_for_label('101/102-Q1')
+    assert sart.runner_index.get('R10', 'F').heat == 201
+    assert sart.runner_index.get('R03', 'F').slots[1] == sart.slot_table.slot_id_for_label('101/102-Q2')
+    in_round_1 = sart.runner_index.in_round(1)
+    assert len(in_round_1) == len(set(in_round_1)) == 10
+    assert sart.runner_index.get('R08', 'F').heat == 202
+
+
+def test_runner_index_rebuilds_after_a_hand_edit(tmp_path):
+    sart = seeded_sart(tmp_path)
+    #a late entry is written straight into bracket_df, as the notebooks do
+    sart.bracket_df.loc[10, ['First_name', 'Surname', 'Time']] = ['Late', 'Runner', '0:11:00']
+    assert sart.runner_index.get('Runner', 'Late') is None
+    sart.index_runners()
+    assert sart.runner_index.get('Runner', 'Late').heat == 102
+    assert sart.runner_index.get('R10', 'F') is None
+    assert len(sart.runner_index) == 10
+
+
+def time_trial_seeds(tmp_path, rows):
+    #rows - (surname, time, classifier); returns surname -> seed and the tie check message
+    path = tmp_path / 'TT_R0_Results.csv'
+    pd.DataFrame(rows, columns=['Surname', 'Time', 'Classifier']).assign(**{'First name': 'F'}).to_csv(str(path), index=False)
+    sart = SART({}, [], COLUMNS, {})
+    sart.process_time_trial_results(str(path))
+    return dict(zip(sart.tt_df_cleaned['Surname'], sart.tt_df_cleaned['Seed'])), sart._check_TT_for_ties()
+
+
+def test_time_trial_mispunch_is_seeded_after_every_finisher(tmp_path):
+    #as in the 2018 time trial: the MP runner's 0:19:12 is faster than the last finisher's 0:20:53
+    seeds, tie_status = time_trial_seeds(tmp_path, [('Castelluccio', '0:16:47', 0), ('Srivastava', '0:20:53', 0),
+                                                    ('Shustrova', '0:19:12', 3), ('Pleiss', '0:14:57', 0)])
+    assert seeds == {'Pleiss': 1, 'Castelluccio': 2, 'Srivastava': 3, 'Shustrova': 4}
+    assert tie_status == 'No Ties, results added to bracket!'
+
+
+def test_time_trial_unparseable_times_rank_last_and_are_not_ties(tmp_path):
+    seeds, tie_status = time_trial_seeds(tmp_path, [('A', 'mp', 0), ('B', '0:12:00', 0), ('C', '', 0),
+                                                    ('D', '0:11:00', 0), ('E', '0:12:00', 3)])
+    assert seeds == {'D': 1, 'B': 2, 'A': 3, 'C': 4, 'E': 5}
+    assert tie_status == 'No Ties, results added to bracket!'
+
+    seeds, tie_status = time_trial_seeds(tmp_path, [('A', '0:12:00', 0), ('B', '0:12:00', 0), ('C', 'mp', 0)])
+    assert seeds == {'A': 1, 'B': 2, 'C': 3}
+    assert tie_status.startswith('Warning: Ties exist - diff in list length is 1.')
+
+
+def test_time_trial_accepts_a_dns_runner_added_by_hand(tmp_path):
+    sart = SART.from_bracket_format(10, 5, COLUMNS, {})
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    path = tmp_path / 'TT_R0_Results.csv'
+    pd.DataFrame({'Surname': ['R{:02d}'.format(seed) for seed in range(1, 10)], 'First name': 'F',
+                  'Time': ['0:10:{:02d}'.format(seed) for seed in range(1, 10)]}).to_csv(str(path), index=False)
+    sart.process_time_trial_results(str(path))
+    #as the 2018/2019 notebooks add a DNS runner
+    sart.tt_df_cleaned.loc['9', ['Surname']] = 'Roecks'
+    sart.tt_df_cleaned.loc['9', ['First_name']] = 'Marissa'
+    sart.tt_df_cleaned.loc['9', ['Time']] = '0:59:00'
+    sart.tt_df_cleaned.loc['9', ['Seed']] = int(10)
+    assert sart._check_TT_for_ties() == 'No Ties, results added to bracket!'
+    sart.add_time_trial_results()
+    assert sart.bracket_df.loc[10, 'Surname'] == 'Roecks'
+    assert sart.runner_index.get('Roecks', 'Marissa').heat == sart.slot_table.nxt_heat[sart.slot_table.slot_id_for_label(10)]
+
+    #a hand-added time equal to a finisher's is still a tie
+    sart.tt_df_cleaned.loc['9', ['Time']] = '0:10:09'
+    assert sart._check_TT_for_ties().startswith('Warning: Ties exist - diff in list length is 1.')
+
+
+def test_import_file_follows_a_hand_edited_bracket(tmp_path):
+    #a 6 runner bracket typed in by hand, as the 2017 and 2018 notebooks do
+    sart = SART({'Heat 101': [1, 4, 5], 'Heat 102': [2, 3, 6]}, [((101, 102), (201, 202))], COLUMNS,
+                {'Heat 201': '10:00am', 'Heat 202': '10:04am'}, [], [])
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    for seed, surname in enumerate(['Ames', 'Bode', 'Cole', 'Dunn', 'Eng', 'Fry'], 1):
+        sart.bracket_df.loc[seed, ['Round', 'First_name', 'Surname', 'Time']] = [0, 'F', surname, '0:10:0{}'.format(seed)]
+    #Fry didn't start round 1 and Gill ran in the seed 6 spot instead
+    sart.bracket_df.loc[6, 'Surname'] = 'Gill'
+    sart.bracket_df.loc[['W101', 'W102', '101/102-Q1', '101/102-Q2', '101/102-Q3', '101/102-Q4'],
+                        ['First_name', 'Surname']] = [['F', name] for name in ['Ames', 'Bode', 'Cole', 'Dunn', 'Eng', 'Gill']]
+    registration = tmp_path / 'OE0001_R1.csv'
+    pd.DataFrame({'Surname': ['Ames', 'Bode', 'Cole', 'Dunn', 'Eng', 'Gill'], 'First name': 'F',
+                  'Short': '', 'Long': '', 'Cl. no.': ''}).to_csv(str(registration), index=False)
+    ss_input = sart.assign_nxt_ht_to_ss_import_csv(str(registration), 1)
+    assert ss_input is not None
+    assert dict(zip(ss_input['Surname'], ss_input['Short'])) == {'Ames': 'H201', 'Bode': 'H201', 'Cole': 'H201',
+                                                                 'Dunn': 'H201', 'Eng': 'H201', 'Gill': 'H202'}
+    assert ss_input.loc[ss_input['Surname'] == 'Gill', 'Long'].item() == 'Heat 202'
+
+
+def test_nxt_ht_assigns_ranks_pairs_and_single_heats_in_one_call(capsys):
+    #Heat 103 runs on its own (like 402 in 2019): its runners go on together, in finish order
+    sart = SART({'Heat 101': [1, 4], 'Heat 102': [2, 3], 'Heat 103': [5, 6, 7]},
+                [((101, 102), (201, 202)), ((103, 103), (203, 203))], COLUMNS, {}, [], [103])
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    results = pd.DataFrame({'Surname': ['Ash', 'Birch', 'Cedar', 'Dogwood', 'Elm', 'Fir', 'Gum'], 'First_name': 'F',
+                            'Time': ['0:21:00', '0:20:00', '0:22:00', '0:19:30', '0:25:10', '0:25:05', '0:24:59'],
+                            'Heat': [101, 101, 102, 102, 103, 103, 103]})
+    sart.nxt_ht_assigns(results, 1)
+    assert 'Processed 2 heat pairs for Round 1' in capsys.readouterr().out
+    assert sart.bracket_df.loc[['W101', 'W102', '101/102-Q1', '101/102-Q2'], 'Surname'].tolist() == ['Birch', 'Dogwood', 'Ash', 'Cedar']
+    assert sart.bracket_df.loc[['103-Q1', '103-Q2', '103-Q3'], 'Surname'].tolist() == ['Gum', 'Fir', 'Elm']
+    assert sart.bracket_df.loc['103-Q1', 'Time'] == '0:24:59'
+    assert sart.bracket_df.loc[['101/102-Q3'] + ['103-Q{}'.format(rank) for rank in range(4, 10)], 'Surname'].isnull().all()
+
+
+def family_time_trial_sart(tmp_path):
+    #12 runners, three of them Kims: the import file is matched on the whole name
+    sart = SART.from_bracket_format(12, 4, COLUMNS, {'Heat 101': '10:00am', 'Heat 102': '10:04am'})
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    names = [('Kim', 'Ana'), ('Lund', 'Bo'), ('Kim', 'Cal'), ('Moss', 'Di'), ('Nye', 'Ed'), ('Kim', 'Fay'),
+             ('Ott', 'Gil'), ('Pratt', 'Hu'), ('Quon', 'Ida'), ('Rao', 'Jo'), ('Shaw', 'Kit'), ('Tate', 'Lu')]
+    time_trial = tmp_path / 'TT_R0_Results.csv'
+    pd.DataFrame({'Surname': [surname for surname, first_name in names], 'First name': [first_name for surname, first_name in names],
+                  'Time': ['0:12:{:02d}'.format(seed) for seed in range(1, 13)]}).to_csv(str(time_trial), index=False)
+    sart.process_time_trial_results(str(time_trial))
+    sart.add_time_trial_results()
+    #the registration master, in entry order, with the other columns SportsSoftware keeps
+    registration = pd.DataFrame({'Stno': range(1, 13), 'Surname': [surname for surname, first_name in reversed(names)],
+                                 'First name': [first_name for surname, first_name in reversed(names)],
+                                 'Cl. no.': 1, 'Short': 'TT', 'Long': 'Time Trial'})
+    return sart, registration
+
+
+def test_import_file_joins_registrants_on_the_whole_name(tmp_path):
+    sart, registration = family_time_trial_sart(tmp_path)
+    path = str(tmp_path / 'OE0001_R0.csv')
+    registration.to_csv(path, index=False)
+    ss_input = sart.assign_nxt_ht_to_ss_import_csv(path, 0)
+    assert list(ss_input.columns) == ['Stno', 'Surname', 'First name', 'Cl. no.', 'Short', 'Long']
+    assert ss_input['Stno'].tolist() == list(range(1, 13))
+    heats = dict(((surname, first_name), long_name) for surname, first_name, long_name in ss_input[['Surname', 'First name', 'Long']].values)
+    #seeds 1, 3 and 6 go to Heats 101, 104 and 104
+    assert [heats[('Kim', first_name)] for first_name in ('Ana', 'Cal', 'Fay')] == ['Heat 101', 'Heat 104', 'Heat 104']
+    assert ss_input.loc[ss_input['First name'] == 'Ana', ['Short', 'Cl. no.']].values.tolist() == [['H101', '101']]
+
+
+def test_import_file_mismatches_are_all_reported(tmp_path, capsys):
+    sart, registration = family_time_trial_sart(tmp_path)
+    #Fay Kim is missing, Kit Shaw is in twice and a Zed Kim registered who never ran
+    registration = pd.concat([registration[registration['First name'] != 'Fay'], registration[registration['First name'] == 'Kit'],
+                              pd.DataFrame({'Surname': ['Kim'], 'First name': ['Zed']})], sort=False)
+    path = str(tmp_path / 'OE0001_R0.csv')
+    registration.to_csv(path, index=False)
+    assert sart.assign_nxt_ht_to_ss_import_csv(path, 0) is None
+    out = capsys.readouterr().out
+    assert 'Warning: 1 runners in import file but not in Round 0 of the bracket - check data! Zed Kim' in out
+    assert 'Warning: 1 runners in Round 0 of the bracket but not in import file - check data! Fay Kim' in out
+    assert 'Warning: 1 runners listed more than once - check data! Kit Shaw' in out
+
+
+def test_combined_scores_sum_every_round_for_combined_heats():
+    sart = SART({}, [], COLUMNS, {})
+    r3 = pd.DataFrame({'Surname': ['Ueda', 'Vega', 'Wong', 'Xu'], 'First_name': 'F',
+                       'Time': ['0:20:00', '0:21:00', '0:22:00', '0:19:00'], 'Heat': [301, 301, 302, 302]})
+    r4 = pd.DataFrame({'Surname': ['Ueda', 'Vega', 'Wong'], 'First_name': 'F',
+                       'Time': ['0:20:30.5', '0:19:00', '0:21:00'], 'Heat': [401, 401, 402]})
+    #Xu has no round 4 time, so no total; Yates and Zane ran the ordinary Heat 502 on its own time
+    r5 = pd.DataFrame({'Surname': ['Ueda', 'Vega', 'Xu', 'Yates', 'Zane'], 'First_name': 'F',
+                       'Time': ['0:20:00', '0:21:00', '0:10:00', '0:18:00', '0:17:59'], 'Heat': [501, 501, 501, 502, 502]})
+    scored = sart.calc_combined_scores({3: r3, 4: r4, 5: r5}, [501])
+    assert scored.index.tolist() == [1, 2, 3, 4, 5]
+    assert scored['Surname'].tolist() == ['Zane', 'Yates', 'Ueda', 'Vega', 'Xu']
+    assert scored.loc[scored['Heat'] == 501, 'SumTime'].tolist()[:2] == ['01:00:30.5', '01:01:00']
+    assert pd.isnull(scored.loc[5, 'SumTime']) and pd.isnull(scored.loc[1, 'SumTime'])
+    assert scored.loc[1, 'Time_Official'] == '0:17:59'
+
+    #only rounds 4 and 5 count towards the total
+    scored = sart.calc_combined_scores({3: r3, 4: r4, 5: r5}, [501], combine_rounds=[4, 5])
+    assert scored.loc[scored['Heat'] == 501, 'Surname'].tolist() == ['Vega', 'Ueda', 'Xu']
+    assert scored.loc[3, 'Time_Official'] == '00:40:00'
+
+
+def round_1_results_for(sart, heats):
+    #every runner the bracket has in the given round 1 heats, faster the lower their seed
+    rows = sart.bracket_df[sart.bracket_df['Nxt_Heat'].isin(['Heat {}'.format(heat) for heat in heats]) &
+                           (sart.bracket_df['Round'] == 0)]
+    return pd.DataFrame({'Surname': rows['Surname'].values, 'First_name': rows['First_name'].values,
+                         'Time': ['0:30:{:02d}'.format(int(seed)) for seed in rows.index],
+                         'Heat': rows['Nxt_Heat'].str.split().str[-1].astype(int).values})
+
+
+def test_checkpoint_resumes_a_round_part_way_through(tmp_path):
+    sart = SART.from_bracket_format(30, 5, COLUMNS, {'Heat 201': '11:00am'})
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    sart._seed_time_trial(pd.DataFrame({'Surname': ['C{:02d}'.format(seed) for seed in range(1, 31)], 'First_name': 'F',
+                                        'Time': ['0:11:{:02d}'.format(seed) for seed in range(1, 31)]}))
+    sart.add_time_trial_results()
+    #heats 101 to 104 are in, 105 to 108 are still running
+    assert sart.assign_ready_pairs(round_1_results_for(sart, range(101, 105))) == [(101, 102), (103, 104)]
+    path = str(tmp_path / 'NSC.checkpoint')
+    sart.save_checkpoint(path)
+
+    resumed = SART.load_checkpoint(path)
+    assert resumed.bracket_df.equals(sart.bracket_df)
+    assert resumed.slot_table.labels() == sart.slot_table.labels()
+    assert resumed.schedule.processed == sart.schedule.processed == set([(101, 102), (103, 104)])
+    assert (resumed.heat_base, resumed.bracket_format.r0_seeds) == (100, sart.bracket_format.r0_seeds)
+    assert resumed.runner_index.get('C01', 'F').heat == 201
+    assert dict(resumed.h_seed_key) == dict(sart.h_seed_key)
+
+    #both carry on the same way with the rest of the round
+    rest = round_1_results_for(sart, range(105, 109))
+    assert sart.assign_ready_pairs(rest) == resumed.assign_ready_pairs(rest) == [(105, 106), (107, 108)]
+    assert resumed.bracket_df.equals(sart.bracket_df)
+
+
+def test_load_checkpoint_refuses_other_files(tmp_path):
+    path = tmp_path / 'Bracket_before_R2.csv'
+    path.write_text('Seed,Round\n')
+    with pytest.raises(ValueError, match='not a SART checkpoint'):
+        SART.load_checkpoint(str(path))
+    path = tmp_path / 'old.checkpoint'
+    path.write_bytes(SART.checkpoint_magic + pickle.dumps((0, {})))
+    with pytest.raises(ValueError, match='version 0 checkpoint'):
+        SART.load_checkpoint(str(path))
+
+
+def test_place_non_finishers_orders_them_after_the_slowest_finisher(capsys):
+    #heats of three, seeded by hand as the notebooks do
+    sart = SART.from_bracket_format(12, 3, COLUMNS, {})
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    for seed in range(1, 13):
+        sart.bracket_df.loc[seed, ['First_name', 'Surname', 'Time']] = ['F', 'N{:02d}'.format(seed), '0:15:{:02d}'.format(seed)]
+    sart.index_runners()
+    #N12 (Heat 102) didn't start; N04 has no time; Zed isn't in the bracket at all
+    results = pd.DataFrame([('N01', '1:02:00', 101, 'OK'), ('N08', '0:30:00', 101, 'MP'), ('N09', '0:31:00', 101, 'OK'),
+                            ('N04', '', 102, None), ('N05', '0:29:00', 102, 'DSQ'),
+                            ('N02', '0:40:00', 103, 'MP'), ('N07', '0:33:00', 103, 'OK'), ('N10', '0:34:00', 103, 'OK'),
+                            ('N03', '0:35:00', 104, 'OK'), ('N06', '0:36:00', 104, 'OK'), ('N11', '0:37:00', 104, 'OK'),
+                            ('Zed', '0:36:30', 104, 'OK')],
+                           columns=['Surname', 'Time', 'Heat', 'Status']).assign(First_name='F')
+
+    placed = sart.place_non_finishers(results, 1)
+    out = capsys.readouterr().out
+    assert 'Warning: F Zed are in the Round 1 results but not in a Round 1 heat - check data!' in out
+    assert 'Heat 102 F N12 DNS (no time) placed last as 01:03:04' in out
+    flagged = placed[placed['Status'] != 'OK'].sort_values('Time')
+    #MP first (faster recorded time first), then DSQ, DNF and DNS, from the minute after the slowest finisher
+    assert flagged[['Surname', 'Status', 'Time']].values.tolist() == [
+        ['N08', 'MP', '01:03:00'], ['N02', 'MP', '01:03:01'], ['N05', 'DSQ', '01:03:02'], ['N04', 'DNF', '01:03:03'],
+        ['N12', 'DNS', '01:03:04']]
+    assert placed.loc[placed['Surname'] == 'N12', 'Heat'].item() == 102
+    assert len(placed) == len(results) + 1 and len(results) == 12
+
+    #only heats 103 and 104 (a heat pair finished early): their slowest finisher is well under 59 minutes
+    placed = sart.place_non_finishers(results, 1, heats=[103, 104])
+    assert sorted(placed['Surname']) == ['N02', 'N03', 'N06', 'N07', 'N10', 'N11', 'Zed']
+    assert placed.loc[placed['Status'] != 'OK', ['Surname', 'Time']].values.tolist() == [['N02', '00:59:00']]
@@ -0,0 +1,197 @@
+import pytest
+
+from SART_Class_v6 import SART
+from SART_core import (HeatSchedule, SlotTable, generate_bracket, heat_label, main, HEAT_BASE, HEAT_CODE_BITS, HEAT_QUALIFIER, PAIR_QUALIFIER,
+                       SEED, WINNER, parse_seed_label, seed_label, slot_key)
+
+COLUMNS = ['Round', 'Nxt_Heat', 'First_name', 'Surname', 'Time', 'Nxt_Heat_Time']
+
+#the 74 runner bracket run in 2019, as typed into 2019_SART.ipynb
+R0_SEEDS_2019 = {'Heat 101': [1, 32, 33, 64, 65], 'Heat 102': [16, 17, 48, 49],
+                 'Heat 103': [8, 25, 40, 57, 72], 'Heat 104': [9, 24, 41, 56, 73],
+                 'Heat 105': [4, 29, 36, 61, 68], 'Heat 106': [13, 20, 45, 52],
+                 'Heat 107': [5, 28, 37, 60, 69], 'Heat 108': [12, 21, 44, 53],
+                 'Heat 109': [2, 31, 34, 63, 66], 'Heat 110': [15, 18, 47, 50],
+                 'Heat 111': [7, 26, 39, 58, 71], 'Heat 112': [10, 23, 42, 55, 74],
+                 'Heat 113': [3, 30, 35, 62, 67], 'Heat 114': [14, 19, 46, 51],
+                 'Heat 115': [6, 27, 38, 59, 70], 'Heat 116': [11, 22, 43, 54]}
+BEF_AFT_HT_PAIRS_2019 = [((101, 102), (201, 202)), ((103, 104), (203, 204)), ((105, 106), (205, 206)),
+                         ((107, 108), (207, 208)), ((109, 110), (209, 210)), ((111, 112), (211, 212)),
+                         ((113, 114), (213, 214)), ((115, 116), (215, 216)),
+                         ((201, 203), (301, 302)), ((205, 207), (305, 306)), ((209, 211), (309, 310)),
+                         ((213, 215), (313, 314)), ((202, 204), (303, 304)), ((206, 208), (307, 308)),
+                         ((210, 212), (311, 304)), ((214, 216), (315, 308)),
+                         ((301, 305), (416, 414)), ((309, 313), (415, 413)), ((302, 306), (412, 410)),
+                         ((310, 314), (411, 409)), ((303, 307), (408, 406)), ((311, 315), (407, 405)),
+                         ((304, 308), (404, 402)),
+                         ((416, 415), (516, 515)), ((414, 413), (514, 513)), ((412, 411), (512, 511)),
+                         ((410, 409), (510, 509)), ((408, 407), (508, 507)), ((406, 405), (506, 505)),
+                         ((404, 404), (504, 504)), ((402, 402), (502, 502))]
+
+
+def seed_key_2019():
+    sart = SART(dict(R0_SEEDS_2019), BEF_AFT_HT_PAIRS_2019, COLUMNS, {}, [304, 308], [402])
+    sart.prepare_sd_h_keys()
+    return dict(sart.h_seed_key)
+
+
+def test_seed_labels_round_trip():
+    for label in [12, '12', 'W101', '101/102-Q3', '402-Q5', '304/308-Q12']:
+        assert str(seed_label(*parse_seed_label(label))) == str(label)
+    assert parse_seed_label('101/102-Q3') == (PAIR_QUALIFIER, 101, 102, 3)
+    assert parse_seed_label('402-Q5') == (HEAT_QUALIFIER, 402, 0, 5)
+
+
+def test_slot_table_compiles_the_2019_bracket():
+    h_seed_key = seed_key_2019()
+    table = SlotTable(h_seed_key)
+    assert len(table) == sum(len(labels) for labels in h_seed_key.values()) == 370
+    assert table.to_seed_key() == h_seed_key
+    assert table.slot_id(SEED, rank=74) == table.slot_id_for_label(74)
+    slot = table.slot(table.slot_id_for_label('W101'))
+    assert (slot.kind, slot.heat1, slot.nxt_heat) == (WINNER, 101, 201)
+    assert table.slot_round(slot.slot_id) == 1
+    #the 2019 bracket's hand-combined heats: 210/212 down runners go to Heat 304
+    assert table.slot(table.slot_id_for_label('210/212-Q7')).nxt_heat == 304
+    assert table.slot_id_for_label('312/316-Q1') == -1
+    assert table.slot_id_for_label('bogus') == table.slot_id_for_label('W') == -1
+
+
+def test_slot_keys_are_distinct_and_bounded():
+    keys = set(slot_key(kind, heat1, heat2, rank) for kind in (SEED, WINNER, PAIR_QUALIFIER, HEAT_QUALIFIER)
+               for heat1, heat2 in ((101, 102), (102, 101), (0, 0)) for rank in (0, 1, 9))
+    assert len(keys) == 4 * 3 * 3
+    largest = (1 << HEAT_CODE_BITS) - 1
+    assert slot_key(WINNER, largest) != slot_key(WINNER, 0, largest)
+    with pytest.raises(ValueError):
+        slot_key(WINNER, 1 << HEAT_CODE_BITS)
+    with pytest.raises(ValueError):
+        #round 11 of a bracket with 100000 heat codes per round
+        SlotTable({'Heat {}'.format(12 * 100000 + 1): ['W{}'.format(11 * 100000 + 1)]}, heat_base=HEAT_BASE * 1000)
+
+
+def test_generate_bracket_reproduces_the_2019_bracket():
+    bracket_format = generate_bracket(74, 5)
+    h_seed_key = seed_key_2019()
+    assert bracket_format.r0_seeds == R0_SEEDS_2019
+    assert bracket_format.heat_base == HEAT_BASE
+    #rounds 1 and 2 and the round 3 heats the 2019 bracket didn't combine by hand are the same heats
+    for heat in range(101, 117):
+        assert bracket_format.h_seed_key[heat_label(heat)] == h_seed_key[heat_label(heat)]
+    for heat in range(201, 217):
+        assert bracket_format.h_seed_key[heat_label(heat)] == h_seed_key[heat_label(heat)]
+    for heat in set(range(301, 317)) - set([304, 308, 312, 316]):
+        assert bracket_format.h_seed_key[heat_label(heat)] == h_seed_key[heat_label(heat)]
+    #2019 ran Heats 312 and 316 inside 304 and 308; the generator keeps them as their own heats
+    for combined, kept in ((304, 312), (308, 316)):
+        assert h_seed_key[heat_label(combined)] == (bracket_format.h_seed_key[heat_label(combined)] +
+                                                    bracket_format.h_seed_key[heat_label(kept)])
+    assert len(SlotTable(bracket_format.h_seed_key)) == len(SlotTable(h_seed_key))
+
+
+def test_generate_bracket_reports_underfilled_heats():
+    bracket_format = generate_bracket(74, 5)
+    assert bracket_format.underfilled['Heat 408'] == 2
+    assert bracket_format.underfilled['Heat 416'] == 2
+    assert bracket_format.combined == {}
+    for rnd in range(1, 6):
+        in_round = [count for heat, count in bracket_format.heat_counts.items() if heat // HEAT_BASE == rnd]
+        assert sum(in_round) == 74
+    for heat, size in bracket_format.underfilled.items():
+        assert len(bracket_format.h_seed_key[heat]) == size < 5
+
+
+def test_generate_bracket_combines_a_too_small_down_heat():
+    #22 runners in 8 heats: the 6 runners of 103/104 (and 107/108) would leave 1 for a down heat of at least 3
+    bracket_format = generate_bracket(22, 5, min_heat_size=3)
+    assert sorted(bracket_format.combined) == ['Heat 203', 'Heat 207']
+    for heat, size in bracket_format.combined.items():
+        assert len(bracket_format.h_seed_key[heat]) == size > 3
+    with pytest.raises(ValueError):
+        generate_bracket(74, 5, n_rounds=9)
+
+
+def test_heat_schedule_releases_heats_pair_by_pair():
+    schedule = HeatSchedule(BEF_AFT_HT_PAIRS_2019, R0_SEEDS_2019)
+    assert schedule.startable_heats() == []
+    schedule.mark_seeded()
+    assert schedule.startable_heats() == list(range(101, 117))
+
+    schedule.mark_heat_finished(101)
+    assert schedule.ready_pairs() == []
+    schedule.mark_heat_finished(102)
+    assert schedule.ready_pairs() == [(101, 102)]
+    schedule.mark_pair_processed(101, 102)
+    assert schedule.ready_pairs() == []
+    assert schedule.heat_can_start(201) and schedule.heat_can_start(202)
+    assert not schedule.heat_can_start(203)
+    #Heat 304 takes the down runners of two heat pairs, so it waits for both
+    assert sorted(schedule.feeding_pairs[304]) == [(202, 204), (210, 212)]
+    assert 201 in schedule.startable_heats() and 101 not in schedule.startable_heats()
+
+
+def test_heat_schedule_final_heats_and_critical_path():
+    schedule = HeatSchedule(BEF_AFT_HT_PAIRS_2019, R0_SEEDS_2019)
+    #2019 had no Heat 501 or 503: 402 and 404 each stayed together as one group into 502 and 504
+    assert schedule.final_heats() == [502, 504] + list(range(505, 517))
+    length, path = schedule.critical_path()
+    assert length == 5 and len(path) == 5
+    assert path[0] // HEAT_BASE == 1 and path[-1] in schedule.final_heats()
+
+    for heat in range(101, 117):
+        schedule.mark_heat_finished(heat)
+    length, path = schedule.critical_path(durations={416: 3})
+    assert length == 6 and 416 in path
+    assert schedule.blocking_heat(durations={416: 3}) == path[0]
+
+
+def test_heat_schedule_rejects_a_loop():
+    with pytest.raises(ValueError):
+        HeatSchedule([((101, 102), (201, 202)), ((201, 202), (101, 102))], {'Heat 101': [1], 'Heat 102': [2]})
+
+
+def test_main_reports_labels_not_in_the_bracket(capsys):
+    main(['22', '5', '--label', '12', 'W101', 'bogus', '101/102-Q', '409-Q1'])
+    assert capsys.readouterr().out.splitlines() == ['12 -> Heat 104', 'W101 -> Heat 201', 'bogus -> not in this bracket',
+                                                    '101/102-Q -> not in this bracket', '409-Q1 -> not in this bracket']
+
+
+FOUR_HEAT_PAIRS = [((101, 102), (201, 202)), ((103, 104), (203, 204))]
+FOUR_HEAT_SEEDS = {'Heat 101': [1, 4], 'Heat 102': [2, 3], 'Heat 103': [5, 8], 'Heat 104': [6, 7]}
+
+
+def test_plan_start_times_waits_for_feeding_pairs():
+    plan = HeatSchedule(FOUR_HEAT_PAIRS, FOUR_HEAT_SEEDS).plan_start_times('9:00am', interval=3, heat_duration=20, processing=5)
+    #201/202 wait for 102 to finish (9:23am) plus 5 minutes; 203/204 for 104 (9:29am)
+    assert plan.start_times() == {'Heat 101': '9:00am', 'Heat 102': '9:03am', 'Heat 103': '9:06am', 'Heat 104': '9:09am',
+                                  'Heat 201': '9:28am', 'Heat 202': '9:31am', 'Heat 203': '9:34am', 'Heat 204': '9:37am'}
+    assert plan.rounds == {1: (540, 569), 2: (568, 597)}
+    assert plan.turnaround == plan.min_turnaround == {1: 28}
+    assert plan.overruns == {}
+
+
+def test_plan_start_times_keeps_to_capacity_and_round_windows():
+    schedule = HeatSchedule(FOUR_HEAT_PAIRS, FOUR_HEAT_SEEDS)
+    #two heats on the course at once: each start waits for a heat to come in
+    plan = schedule.plan_start_times('9:00am', interval=3, heat_duration=20, processing=5, capacity=2)
+    assert [plan.start[heat] - 540 for heat in (101, 102, 103, 104, 201, 202, 203, 204)] == [0, 3, 20, 23, 40, 43, 60, 63]
+
+    plan = schedule.plan_start_times('9:00am', interval=3, heat_duration=20, processing=5,
+                                     round_windows={2: ('9:40am', '10:00am')}, durations={'Heat 204': 25})
+    assert plan.start_times()['Heat 201'] == '9:40am'
+    assert (plan.turnaround, plan.min_turnaround) == ({1: 40}, {1: 28})
+    assert plan.overruns == {202: '10:03am', 203: '10:06am', 204: '10:14am'}
+    assert plan.report().splitlines() == ['Round 1: 9:00am to 9:29am, next round 40 min later (at best 28 min)',
+                                          'Round 2: 9:40am to 10:14am',
+                                          'Warning: Heat 202 is expected to finish at 10:03am, after its round window',
+                                          'Warning: Heat 203 is expected to finish at 10:06am, after its round window',
+                                          'Warning: Heat 204 is expected to finish at 10:14am, after its round window']
+
+
+def test_sart_plan_start_times_fills_the_bracket_start_times(capsys):
+    sart = SART(dict(FOUR_HEAT_SEEDS), FOUR_HEAT_PAIRS, COLUMNS, {}, [], [])
+    sart.plan_start_times('1:30pm', interval=4, heat_duration=15, processing=3)
+    assert 'Round 1: 1:30pm to 1:57pm' in capsys.readouterr().out
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    assert sart.bracket_df.loc[[1, 5, 'W101', '103/104-Q3'], 'Nxt_Heat_Time'].tolist() == ['1:30pm', '1:38pm', '1:52pm', '2:00pm']
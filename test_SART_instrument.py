@@ -0,0 +1,60 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+from SART_Class_v6 import SART
+from SART_instrument import Instrumentation
+
+COLUMNS = ['Round', 'Nxt_Heat', 'First_name', 'Surname', 'Time', 'Nxt_Heat_Time']
+
+
+def test_instrumented_stages_record_time_counters_and_round(tmp_path):
+    log_path = str(tmp_path / 'instrumentation.jsonl')
+    inst = Instrumentation(log_path=log_path)
+    sart = SART.from_bracket_format(16, 4, COLUMNS, {}, instrumentation=inst)
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    time_trial = tmp_path / 'TT_R0_Results.csv'
+    pd.DataFrame({'Surname': ['T{:02d}'.format(seed) for seed in range(1, 17)], 'First name': 'F',
+                  'Time': ['0:09:{:02d}'.format(seed) for seed in range(1, 17)]}).to_csv(str(time_trial), index=False)
+    sart.process_time_trial_results(str(time_trial))
+    sart.add_time_trial_results()
+    heats = dict((seed, int(heat.split()[-1])) for heat, seeds in sart.r0_seeds.items() for seed in seeds)
+    results = pd.DataFrame({'Surname': ['T{:02d}'.format(seed) for seed in range(1, 17)], 'First_name': 'F',
+                            'Time': ['0:20:{:02d}'.format(seed) for seed in range(1, 17)],
+                            'Heat': [heats[seed] for seed in range(1, 17)]})
+    sart.nxt_ht_assigns(results, 1)
+
+    stages = [record['stage'] for record in inst.records]
+    assert stages == ['prepare_sd_h_keys', 'create_bracket', 'process_time_trial_results', 'add_time_trial_results',
+                      'nxt_ht_assigns']
+    nxt_ht_assigns = inst.records[-1]
+    assert nxt_ht_assigns['round'] == 1 and nxt_ht_assigns['depth'] == 0
+    assert nxt_ht_assigns['counters'] == {'slots_written': 16, 'heat_pairs_processed': 2}
+    assert inst.records[3]['counters'] == {'slots_written': 16}
+    assert inst.counters['slots_written'] == 32
+    assert inst.timers['nxt_ht_assigns'][0] == 1
+
+    with io.open(log_path, encoding='utf-8') as log:
+        assert [json.loads(line) for line in log] == inst.records
+    summary = inst.summary()
+    assert sorted(stage['stage'] for stage in summary['stages']) == sorted(stages)
+    assert summary['counters']['heat_pairs_processed'] == 2
+
+
+def test_stages_nest_and_are_recorded_when_they_fail():
+    inst = Instrumentation()
+    with pytest.raises(ValueError):
+        with inst.stage('round', round=2):
+            inst.count('rows_parsed', 3)
+            with inst.stage('heat_pair'):
+                inst.count('rows_parsed', 2)
+                raise ValueError('bad export')
+    inner, outer = inst.records
+    assert (inner['stage'], inner['depth'], inner['counters']) == ('heat_pair', 1, {'rows_parsed': 2})
+    assert (outer['stage'], outer['depth'], outer['counters'], outer['round']) == ('round', 0, {'rows_parsed': 5}, 2)
+
+    #without an Instrumentation nothing is recorded
+    assert SART({}, [], COLUMNS, {}).instrumentation.stage('anything').__enter__() == {}
@@ -0,0 +1,54 @@
+import json
+import socket
+
+import pandas as pd
+
+from SART_Class_v6 import SART
+from SART_publish import _BOARD_PAGE, BracketPublisher
+
+COLUMNS = ['Round', 'Nxt_Heat', 'First_name', 'Surname', 'Time', 'Nxt_Heat_Time']
+
+
+def read_event(board):
+    #next 'event: name' / 'data: {...}' block off the stream, skipping keepalive comments
+    lines = []
+    while True:
+        line = board.readline().decode('utf-8').rstrip('\r\n')
+        if line:
+            lines.append(line)
+        elif lines and any(field.startswith('data: ') for field in lines):
+            fields = dict(field.split(': ', 1) for field in lines if not field.startswith(':'))
+            return fields['event'], json.loads(fields['data'])
+
+
+def test_boards_get_names_as_text(tmp_path):
+    #the page builds the board from text nodes, so a name is shown as typed, whatever it holds
+    assert 'innerHTML' not in _BOARD_PAGE and 'textContent' in _BOARD_PAGE
+
+    sart = SART.from_bracket_format(6, 3, COLUMNS, {'Heat 101': '9:00am'})
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    publisher = BracketPublisher(sart, keepalive=60).start(port=0)
+    try:
+        port = publisher._server.sockets[0].getsockname()[1]
+        connection = socket.create_connection(('127.0.0.1', port))
+        connection.sendall(b'GET /events HTTP/1.1\r\nHost: board\r\n\r\n')
+        board = connection.makefile('rb')
+        assert board.readline().startswith(b'HTTP/1.1 200')
+        while board.readline().strip():
+            pass
+        assert read_event(board) == ('snapshot', {'slots': []})
+
+        time_trial = tmp_path / 'TT_R0_Results.csv'
+        pd.DataFrame({'Surname': ['<b>Lee</b>', 'Ng', 'Ortiz', 'Park', 'Quinn', 'Roy'], 'First name': 'F',
+                      'Time': ['0:10:0{}'.format(seed) for seed in range(1, 7)]}).to_csv(str(time_trial), index=False)
+        sart.process_time_trial_results(str(time_trial))
+        sart.add_time_trial_results()
+        name, body = read_event(board)
+        assert name == 'slots' and len(body['slots']) == 6
+        first = [slot for slot in body['slots'] if slot['seed'] == 1][0]
+        assert first == {'seed': 1, 'round': 0, 'heat': 'Heat 101', 'start_time': '9:00am',
+                         'surname': '<b>Lee</b>', 'first_name': 'F', 'time': '0:10:01'}
+        connection.close()
+    finally:
+        publisher.close()
@@ -0,0 +1,96 @@
+import json
+import threading
+
+import pandas as pd
+import pytest
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import HTTPError, Request, urlopen
+
+from SART_Class_v6 import SART
+from SART_service import BracketService, serve
+
+COLUMNS = ['Round', 'Nxt_Heat', 'First_name', 'Surname', 'Time', 'Nxt_Heat_Time']
+#seed -> (surname, first name); Heat 101 gets seeds 1, 4, 5, 8 and Heat 102 seeds 2, 3, 6, 7
+RUNNERS = {1: ('Hale', 'Ari'), 2: ('Hale', 'Bea'), 3: ('Ives', 'Cam'), 4: ('Jain', 'Dev'),
+           5: ('Kerr', 'Eli'), 6: ('Lowe', 'Fen'), 7: ('Mace', 'Gus'), 8: ('Nash', 'Hal')}
+
+
+def write_event_files(tmp_path):
+    sart = SART.from_bracket_format(8, 4, COLUMNS, {'Heat 201': '10:30am', 'Heat 202': '10:33am'})
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    time_trial = tmp_path / 'TT_R0_Results.csv'
+    pd.DataFrame({'Surname': [RUNNERS[seed][0] for seed in range(1, 9)], 'First name': [RUNNERS[seed][1] for seed in range(1, 9)],
+                  'Time': ['0:14:{:02d}'.format(seed) for seed in range(1, 9)]}).to_csv(str(time_trial), index=False)
+    #in round 1 the order reverses: seed 8 is fastest
+    round_1 = tmp_path / 'R1_Results.csv'
+    pd.DataFrame({'Surname': [RUNNERS[seed][0] for seed in range(1, 9)], 'First name': [RUNNERS[seed][1] for seed in range(1, 9)],
+                  'Time': ['0:22:{:02d}'.format(20 - seed) for seed in range(1, 9)],
+                  'Entry cl. No': [101 if seed in (1, 4, 5, 8) else 102 for seed in range(1, 9)]}).to_csv(str(round_1), index=False)
+    return sart, str(time_trial), str(round_1)
+
+
+def test_queries_wait_for_an_ingest_to_finish(tmp_path):
+    sart, time_trial, round_1 = write_event_files(tmp_path)
+    service = BracketService(sart)
+    service.ingest_time_trial(time_trial)
+
+    #hold the ingest inside nxt_ht_assigns, with the write lock taken
+    in_assign, release = threading.Event(), threading.Event()
+    nxt_ht_assigns = sart.nxt_ht_assigns
+
+    def held_nxt_ht_assigns(*args, **kwargs):
+        in_assign.set()
+        release.wait(5)
+        return nxt_ht_assigns(*args, **kwargs)
+    sart.nxt_ht_assigns = held_nxt_ht_assigns
+
+    ingested = []
+    ingest = threading.Thread(target=lambda: ingested.append(service.ingest_results(1, round_1)))
+    ingest.start()
+    assert in_assign.wait(5)
+    rosters = []
+    query = threading.Thread(target=lambda: rosters.append(service.heat(201)))
+    query.start()
+    query.join(0.2)
+    assert query.is_alive() and not rosters
+
+    release.set()
+    ingest.join(5)
+    query.join(5)
+    #the query only ever sees the round fully assigned
+    assert [runner['surname'] for runner in rosters[0]['runners']] == ['Nash', 'Mace', 'Lowe', 'Kerr']
+    assert ingested[0]['heat_pairs_processed'] == 1
+    assert 'Processed 1 heat pairs for Round 1' in ingested[0]['messages']
+
+
+def test_http_ingest_and_lookups(tmp_path):
+    sart, time_trial, round_1 = write_event_files(tmp_path)
+    checkpoint = str(tmp_path / 'NSC.checkpoint')
+    server = serve(sart, port=0, checkpoint_path=checkpoint, background=True)
+    url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+    def call(path, body=None):
+        data = None if body is None else json.dumps(body).encode('utf-8')
+        return json.loads(urlopen(Request(url + path, data=data), timeout=10).read().decode('utf-8'))
+    try:
+        assert call('/time_trial', {'path': time_trial})['seeded'] is True
+        call('/results', {'round': 1, 'path': round_1})
+        #case insensitive, and a surname alone gives the whole family
+        assert call('/runner?surname=hale&first_name=ARI')['runners'][0]['next_heat'] == 'Heat 202'
+        hales = call('/runner?surname=Hale')['runners']
+        assert sorted(runner['first_name'] for runner in hales) == ['Ari', 'Bea']
+        nash = call('/runner?surname=Nash&first_name=Hal')['runners'][0]
+        assert (nash['seed'], nash['start_time'], nash['times']) == ('W101', '10:30am', {'0': '0:14:08', '1': '0:22:12'})
+        assert call('/status')['heat_pairs_processed'] == 1
+        with pytest.raises(HTTPError) as error:
+            call('/results', {'round': 1, 'path': str(tmp_path / 'missing.csv')})
+        assert error.value.code == 400
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert SART.load_checkpoint(checkpoint).bracket_df.equals(sart.bracket_df)
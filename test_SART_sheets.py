@@ -0,0 +1,102 @@
+from __future__ import print_function
+import io
+
+import pandas as pd
+import pytest
+
+from SART_Class_v6 import SART
+from SART_sheets import heat_sheet_texts, sheet_writer, write_heat_sheets
+from test_SART_core import BEF_AFT_HT_PAIRS_2019, COLUMNS, R0_SEEDS_2019
+
+
+def seeded_2019_sart():
+    #the 2019 bracket with 74 time trial runners; R0_SEEDS_2019 lists Heat 101 as seeds 1, 32, 33, 64, 65
+    sart = SART(dict(R0_SEEDS_2019), BEF_AFT_HT_PAIRS_2019, COLUMNS, {'Heat 101': '9:00am', 'Heat 102': '9:02am'},
+                [304, 308], [402])
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    #a second and a half apart: 0:10:01.5, 0:10:03, 0:10:04.5, ...
+    seconds = [600 + seed * 1.5 for seed in range(1, 75)]
+    sart._seed_time_trial(pd.DataFrame({'Surname': ['S{:02d}'.format(seed) for seed in range(1, 75)], 'First_name': 'F',
+                                        'Time': ['0:{:02d}:{:02d}{}'.format(int(second) // 60, int(second) % 60, '.5' if second % 1 else '')
+                                                 for second in seconds]}))
+    sart.add_time_trial_results()
+    return sart
+
+
+def test_heat_sheets_list_each_heat_fastest_first_in_every_format():
+    sart = seeded_2019_sart()
+    texts = heat_sheet_texts(sart, 1, ['R1.txt', 'R1.html', 'R1.csv'])
+
+    notebook = io.StringIO()
+    print(*sart.print_heat_assigns(1), sep='\n', file=notebook)
+    assert texts['R1.txt'] == notebook.getvalue()
+    assert texts['R1.txt'].count('Heat 1') == 16
+
+    html = texts['R1.html']
+    assert html.startswith('<!DOCTYPE html>') and html.endswith('</body></html>\n')
+    assert '<h2>Heat 101 - 9:00am</h2>' in html and '<h2>Heat 103</h2>' in html
+    assert html.index('S01') < html.index('S32') < html.index('S64')
+
+    csv = pd.read_csv(io.StringIO(texts['R1.csv']))
+    assert list(csv.columns) == ['Heat', 'Start', 'Seed', 'First_name', 'Surname'] and len(csv) == 74
+    assert csv.loc[csv['Heat'] == 101, 'Surname'].tolist() == ['S01', 'S32', 'S33', 'S64', 'S65']
+    assert csv.loc[csv['Heat'] == 102, 'Start'].unique().tolist() == ['9:02am']
+
+
+def test_heat_sheets_leave_out_heats_with_no_slots(tmp_path):
+    #2019 ran Heats 312/316 inside 304/308, and had no Heat 501 or 503
+    sart = seeded_2019_sart()
+    paths = [str(tmp_path / 'R3_heat_assigns.txt'), str(tmp_path / 'R3_heat_assigns.csv')]
+    assert write_heat_sheets(sart, 3, paths) == 14
+    with io.open(paths[0], encoding='utf-8') as text:
+        sheets = text.read()
+    assert 'Heat 304' in sheets and 'Heat 312' not in sheets and 'Heat 316' not in sheets
+    #nobody has reached round 3 yet: every slot is listed, empty
+    csv = pd.read_csv(paths[1])
+    assert len(csv) == 74 and csv['Surname'].isnull().all()
+    assert csv.groupby('Heat').size().to_dict()[304] == 8
+
+    heats = [heat for heat, start_time, rows in sart.round_heat_sheets(5)]
+    assert 501 not in heats and 503 not in heats and len(heats) == 14
+    with pytest.raises(ValueError):
+        sheet_writer('R3_heat_assigns.pdf')
+
+
+def test_export_round_writes_every_desk_file(tmp_path, capsys):
+    sart = seeded_2019_sart()
+    round_1 = sart.bracket_df[sart.bracket_df['Round'] == 0]
+    results = pd.DataFrame({'Surname': round_1['Surname'].values, 'First_name': 'F',
+                            'Time': ['0:30:{:02d}'.format(seed % 60) if seed < 60 else '0:31:{:02d}'.format(seed - 60)
+                                     for seed in round_1.index],
+                            'Heat': round_1['Nxt_Heat'].str.split().str[-1].astype(int).values})
+    sart.nxt_ht_assigns(results, 1)
+    registration = str(tmp_path / 'OE0001.csv')
+    pd.DataFrame({'Stno': range(1, 75), 'Surname': ['S{:02d}'.format(seed) for seed in range(1, 75)], 'First name': 'F',
+                  'Cl. no.': 1, 'Short': 'H1', 'Long': 'Heat 1'}).to_csv(registration, index=False)
+
+    out_dir = tmp_path / '02-Woodland2'
+    paths = sart.export_round(2, str(out_dir), registration, workers=3)
+    assert sorted(path.name for path in out_dir.iterdir()) == sorted(paths) == [
+        'Bracket_before_R2.csv', 'R2_heat_assigns.csv', 'R2_heat_assigns.html', 'R2_heat_assigns.txt',
+        'SS_import_R2_with_heats.csv']
+    assert paths['SS_import_R2_with_heats.csv'] == str(out_dir / 'SS_import_R2_with_heats.csv')
+    ss_import = pd.read_csv(str(out_dir / 'SS_import_R2_with_heats.csv'))
+    runner = sart.runner_index.get('S01', 'F')
+    assert ss_import.loc[ss_import['Surname'] == 'S01', ['Long', 'Short', 'Cl. no.']].values.tolist() == [
+        ['Heat {}'.format(runner.heat), 'H{}'.format(runner.heat), runner.heat]]
+    assert sorted(ss_import['Long'].unique()) == ['Heat {}'.format(heat) for heat in range(201, 217)]
+    bracket = pd.read_csv(str(out_dir / 'Bracket_before_R2.csv'))
+    assert len(bracket) == len(sart.bracket_df) and bracket['Surname'].notnull().sum() == 148
+    with io.open(str(out_dir / 'R2_heat_assigns.txt'), encoding='utf-8') as text:
+        assert text.read() == heat_sheet_texts(sart, 2, ['R2.txt'])['R2.txt']
+
+    #a registration that doesn't line up: no import file, the rest still written over the old copies
+    pd.read_csv(registration)[:-1].to_csv(registration, index=False)
+    capsys.readouterr()
+    sart.bracket_df.loc['W101', 'Time'] = '0:29:59'
+    paths = sart.export_round(2, str(out_dir), registration, sheet_formats=('.txt',))
+    assert sorted(paths) == ['Bracket_before_R2.csv', 'R2_heat_assigns.txt']
+    assert 'check data!' in capsys.readouterr().out
+    assert pd.read_csv(str(out_dir / 'Bracket_before_R2.csv')).set_index('Seed').loc['W101', 'Time'] == '0:29:59'
+    assert not [path.name for path in out_dir.iterdir() if path.name.startswith('.') or path.name.endswith('.tmp')]
@@ -0,0 +1,18 @@
+from SART_core import generate_bracket
+from SART_simulate import CompiledBracket, main, simulate
+
+
+def test_cli_runs_a_1000_runner_bracket(capsys):
+    #a 1000 runner field has 200 round 1 heats, so heat codes are round * 1000 + heat number
+    main(['1000', '5', '--n-sims', '200', '--workers', '1'])
+    out = capsys.readouterr().out
+    assert '1000 winners+fastest 1+3: P(best wins)' in out
+
+
+def test_bracket_format_keeps_its_heat_base():
+    bracket_format = generate_bracket(1000, 5)
+    assert bracket_format.heat_base == 1000
+    compiled = CompiledBracket.from_bracket(bracket_format)
+    assert compiled.n_runners == 1000
+    report = simulate(bracket_format.h_seed_key, n_sims=50, workers=1, heat_base=bracket_format.heat_base)
+    assert report['n_sims'] == 50
@@ -0,0 +1,94 @@
+import os
+
+import pandas as pd
+
+from SART_Class_v6 import SART
+from SART_stream import ResultsStream
+
+COLUMNS = ['Round', 'Nxt_Heat', 'First_name', 'Surname', 'Time', 'Nxt_Heat_Time']
+HEADER = 'Surname,First name,Time,Classifier,Entry cl. No\n'
+
+
+def twenty_runner_sart(tmp_path):
+    #generate_bracket(20, 5): Heat 101 gets seeds 1, 8, 9, 16, 17, Heat 102 4, 5, 12, 13, 20, and so on
+    sart = SART.from_bracket_format(20, 5, COLUMNS, {})
+    sart.prepare_sd_h_keys()
+    sart.create_bracket()
+    time_trial = tmp_path / 'TT_R0_Results.csv'
+    pd.DataFrame({'Surname': ['S{:02d}'.format(seed) for seed in range(1, 21)], 'First name': 'F',
+                  'Time': ['0:10:{:02d}'.format(seed) for seed in range(1, 21)]}).to_csv(str(time_trial), index=False)
+    sart.process_time_trial_results(str(time_trial))
+    sart.add_time_trial_results()
+    return sart
+
+
+def export_rows(sart, heat, times, classifiers={}):
+    #times - round 1 times of the heat's runners, in seed order
+    seeds = sart.bracket_format.r0_seeds['Heat {}'.format(heat)]
+    return ''.join('S{:02d},F,{},{},{}\n'.format(seed, time, classifiers.get(seed, 0), heat) for seed, time in zip(seeds, times))
+
+
+def test_a_growing_export_is_read_as_it_is_written(tmp_path):
+    sart = twenty_runner_sart(tmp_path)
+    export = tmp_path / 'R1_Results.csv'
+    stream = ResultsStream(sart, 1, str(export))
+    export.write_text(HEADER + export_rows(sart, 101, ['0:20:01', '0:20:05', '0:20:09', '0:20:13', '0:20:17']))
+    assert stream.poll() == []
+
+    #seed 4 mispunched with the fastest time of the pair; the last row is still being written
+    heat_102 = export_rows(sart, 102, ['0:19:00', '0:20:02', '0:20:06', '0:20:10', '0:20:14'], {4: 3})
+    with export.open('a') as appending:
+        appending.write(heat_102[:-8])
+    assert stream.poll() == [] and (stream.results_df['Heat'] == 102).sum() == 4
+    with export.open('a') as appending:
+        appending.write(heat_102[-8:])
+    assert stream.poll() == ['Heat 201', 'Heat 202']
+
+    assert stream.results_df.loc[stream.results_df['Surname'] == 'S04', 'Status'].item() == 'MP'
+    assert sart.bracket_df.loc['W102', 'Surname'] == 'S05'
+    assert sart.bracket_df.loc['101/102-Q8', 'Surname'] == 'S04'
+    assert stream.done_pairs == set([101])
+
+
+def test_run_stops_on_a_tie_and_picks_up_the_corrected_export(tmp_path, capsys):
+    sart = twenty_runner_sart(tmp_path)
+    export = tmp_path / 'R1_Results.csv'
+    rows = (export_rows(sart, 101, ['0:20:01', '0:20:05', '0:20:09', '0:20:13', '0:20:17']) +
+            export_rows(sart, 102, ['0:20:02', '0:20:06', '0:20:10', '0:20:14', '0:20:18']) +
+            export_rows(sart, 103, ['0:20:03', '0:20:07', '0:20:11', '0:20:15', '0:20:19']) +
+            export_rows(sart, 104, ['0:20:04', '0:20:07', '0:20:12', '0:20:16', '0:20:20']))
+    export.write_text(HEADER + rows)
+    stream = ResultsStream(sart, 1, str(export))
+    assert stream.run(interval=0) is False
+    #101/102 goes ahead without waiting for the tie in 103/104
+    assert stream.tied_pairs == [(103, 104)] and stream.done_pairs == set([101])
+    assert 'Stopped: ties in Heat Pair(s) 103,104' in capsys.readouterr().out
+    assert stream.ready_heats == ['Heat 201', 'Heat 202']
+
+    #the tie is fixed by rewriting the export in place: same size, nothing appended
+    export.write_text(HEADER + rows.replace('S06,F,0:20:07', 'S06,F,0:20:08'))
+    modified = os.stat(str(export)).st_mtime + 5
+    os.utime(str(export), (modified, modified))
+    assert stream.run(interval=0) is True
+    assert stream.tied_pairs == []
+    assert len(stream.results_df) == 20
+    assert sart.bracket_df.loc[['103/104-Q1', '103/104-Q2'], 'Surname'].tolist() == ['S07', 'S06']
+
+
+def test_a_rewritten_export_replaces_the_rows_read_before(tmp_path):
+    sart = twenty_runner_sart(tmp_path)
+    export = tmp_path / 'R1_Results.csv'
+    export.write_text(HEADER + export_rows(sart, 101, ['0:20:01', '0:20:05', '0:20:09', '0:20:13', '0:20:17']) +
+                      'S04,F,0:20:02,0,101\n')
+    stream = ResultsStream(sart, 1, str(export))
+    stream.poll()
+    assert (stream.results_df['Heat'] == 101).sum() == 6
+
+    #S04's heat corrected in a new file moved over the export
+    corrected = tmp_path / 'R1_Results.csv.new'
+    corrected.write_text(HEADER + export_rows(sart, 101, ['0:20:01', '0:20:05', '0:20:09', '0:20:13', '0:20:17']) +
+                         export_rows(sart, 102, ['0:20:02', '0:20:06', '0:20:10', '0:20:14', '0:20:18']))
+    os.rename(str(corrected), str(export))
+    assert stream.poll() == ['Heat 201', 'Heat 202']
+    assert stream.results_df.groupby('Heat').size().to_dict() == {101: 5, 102: 5}
+    assert sart.bracket_df.loc['W102', 'Surname'] == 'S04'